@@ -32,3 +32,56 @@ export const healthCheck = async () => {
         throw error;
     }
 };
+
+// Read API: responses carry ETag/Last-Modified with Cache-Control: no-cache, so the
+// browser revalidates from its own cache and unchanged pages come back as cheap 304s
+const getJson = async (path, params = {}) => {
+    const query = new URLSearchParams(
+        Object.entries(params).filter(([, value]) => value !== undefined && value !== null)
+    ).toString();
+    const response = await fetch(`${API_BASE_URL}${path}${query ? `?${query}` : ''}`);
+    if (!response.ok) {
+        const errorData = await response.json().catch(() => ({}));
+        throw new Error(errorData.error || `HTTP error! status: ${response.status}`);
+    }
+    return response.json();
+};
+
+// Pages are { results, next_cursor }; pass next_cursor back as cursor for the next page
+export const listRoutes = ({ limit, cursor } = {}) => getJson('/routes/', { limit, cursor });
+
+export const getRoute = (routeId) => getJson(`/routes/${routeId}/`);
+
+export const getRouteLogs = (routeId, { limit, cursor } = {}) =>
+    getJson(`/routes/${routeId}/logs/`, { limit, cursor });
+
+// Background plans: the job is queued (202) and polled until the worker has run it.
+// Resolves to the same body calculateRoute returns
+export const calculateRouteInBackground = async (routeData, { maxWaitMs = 5 * 60 * 1000 } = {}) => {
+    const response = await fetch(`${API_BASE_URL}/calculate-route/jobs/`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(routeData),
+    });
+    if (response.status !== 202) {
+        const errorData = await response.json().catch(() => ({}));
+        throw new Error(errorData.error || `HTTP error! status: ${response.status}`);
+    }
+
+    const { job_id: jobId } = await response.json();
+    const retryAfter = Number(response.headers.get('Retry-After')) || 2;
+    const deadline = Date.now() + maxWaitMs;
+    while (Date.now() < deadline) {
+        await new Promise((resolve) => setTimeout(resolve, retryAfter * 1000));
+        const job = await getJson(`/calculate-route/jobs/${jobId}/`);
+        if (job.status === 'succeeded') {
+            return job.result;
+        }
+        if (job.status === 'failed') {
+            throw new Error(job.result?.error || job.error || 'Route calculation failed');
+        }
+    }
+    throw new Error(`Route calculation is still queued (job ${jobId})`);
+};
@@ -0,0 +1,85 @@
+"""
+Helpers for the pre-forking production server (see gunicorn.conf.py).
+
+warm_up() runs once in the master process before any worker is forked. Every
+module, the gazetteer, the truck-stop index and the road graph are loaded then,
+and the fallback estimator is fitted from stored routes, so each worker starts
+with them already in memory, shared copy-on-write.
+Nothing that owns a socket, thread or child process is created before the fork.
+The HTTP session, upstream thread pool and render pool are made lazily in each
+worker.
+"""
+import gc
+import logging
+import resource
+import time
+
+from django.db import connections
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up(geocodes=None):
+    """Load shared read-only data and prime caches; returns seconds spent per step"""
+    from routes.cache import geocode_cache
+    from routes.estimator import route_estimator
+    from routes.gazetteer import get_gazetteer
+    from routes.graph import ARRAYS, get_road_graph
+    from routes.pois import get_truck_stop_index
+
+    timings = {}
+
+    def step(name, load):
+        started = time.perf_counter()
+        try:
+            load()
+        except Exception as e:
+            # A missing optional dataset must not stop the server from starting
+            logger.warning(f"Warm-up step {name} failed: {e}")
+        timings[name] = round(time.perf_counter() - started, 3)
+
+    # Importing every view pulls in numpy, the HOS scheduler, the PDF renderer and the rest
+    step('imports', lambda: get_resolver().url_patterns)
+    step('gazetteer', get_gazetteer)
+    step('truck_stops', get_truck_stop_index)
+
+    def road_graph():
+        graph = get_road_graph()
+        # Fault the mapped pages in now; the page cache is shared by every worker
+        for name in ARRAYS:
+            getattr(graph, name).sum()
+
+    step('road_graph', road_graph)
+    step('geocode_cache', lambda: geocode_cache.warm(geocodes))
+    # After the geocode cache, whose memory tier then holds most of the stored routes' places
+    step('route_estimator', route_estimator.warm)
+
+    # Workers must open their own database connections
+    connections.close_all()
+    # Move everything allocated so far out of the collector's reach, so collections in
+    # the workers don't write to (and so un-share) these pages
+    gc.collect()
+    gc.freeze()
+    return timings
+
+
+def process_memory():
+    """This process's memory in MB: rss, and on Linux also pss, shared and private"""
+    try:
+        with open('/proc/self/smaps_rollup') as rollup:
+            fields = {
+                line.split(':')[0]: int(line.split()[1]) for line in rollup if line.split()[-1:] == ['kB']
+            }
+    except OSError:
+        # ru_maxrss is a high-water mark, in KB on Linux and bytes on macOS
+        return {'rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}
+
+    shared = fields.get('Shared_Clean', 0) + fields.get('Shared_Dirty', 0)
+    private = fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)
+    return {
+        'rss_mb': round(fields.get('Rss', 0) / 1024, 1),
+        'pss_mb': round(fields.get('Pss', 0) / 1024, 1),
+        'shared_mb': round(shared / 1024, 1),
+        'private_mb': round(private / 1024, 1),
+    }
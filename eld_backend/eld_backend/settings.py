@@ -10,8 +10,12 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
+import tempfile
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -20,12 +24,18 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-a)+ux^*90myp$8cs^22_x*%#d5jvk@ujt%uz$u_)1i$8(4=f$&'
+SECRET_KEY = os.environ.get(
+    'DJANGO_SECRET_KEY', 'django-insecure-a)+ux^*90myp$8cs^22_x*%#d5jvk@ujt%uz$u_)1i$8(4=f$&'
+)
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# The production profile (gunicorn.conf.py and the Procfile) defaults DJANGO_DEBUG to false
+DEBUG = os.environ.get('DJANGO_DEBUG', 'true').lower() in ('1', 'true', 'yes')
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = [host for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if host]
+if not DEBUG and not ALLOWED_HOSTS:
+    # Otherwise every request would be rejected with a 400
+    raise ImproperlyConfigured('Set DJANGO_ALLOWED_HOSTS when DJANGO_DEBUG is off')
 
 
 # Application definition
@@ -44,6 +54,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'routes.metrics.ServerTimingMiddleware',
+    'routes.profiling.ProfilingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -140,3 +152,107 @@ REST_FRAMEWORK = {
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
 ]
+
+# Geocode cache (in-process LRU in front of the shared routes_geocodecacheentry table)
+GEOCODE_CACHE_TTL = 60 * 60 * 24 * 30  # 30 days
+GEOCODE_CACHE_MEMORY_ENTRIES = 1024
+GEOCODE_CACHE_DB_ENTRIES = 50000
+
+# Route calculation: overlap the three geocodes on a bounded pool and cap
+# the whole upstream round trip (geocodes + /route) per request
+ROUTE_CONCURRENT_GEOCODING = True
+ROUTE_UPSTREAM_WORKERS = 8
+ROUTE_REQUEST_DEADLINE = 40  # seconds
+
+# Batch planning (/api/calculate-route/batch/)
+ROUTE_BATCH_MAX_TRIPS = 500
+ROUTE_BATCH_DEADLINE = 120  # seconds for all of a batch's upstream calls
+
+# Plan jobs (/api/calculate-route/jobs/, run by `python manage.py run_plan_worker`).
+# A worker renews its job's lease every third of PLAN_JOB_LEASE_SECONDS while the
+# plan runs: a running job whose lease expires is taken to have lost its worker
+# and is claimed again
+PLAN_JOB_POLL_INTERVAL = 1.0  # seconds a worker sleeps when the queue is empty
+PLAN_JOB_LEASE_SECONDS = 300
+PLAN_JOB_MAX_ATTEMPTS = 3
+PLAN_JOB_RETENTION_HOURS = 24  # finished jobs are purged after this
+PLAN_JOB_RETRY_AFTER = 2  # seconds, suggested to pollers
+
+# /api/metrics/: latency quantiles cover each stage's most recent samples
+METRICS_QUANTILE_WINDOW = 1024
+
+# Request profiling (routes/profiling.py). Off unless enabled here or asked for with
+# an `X-Profile: <PROFILING_TOKEN>` header; with no token the header only works under DEBUG
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '').lower() in ('1', 'true', 'yes')
+PROFILING_SAMPLE_RATE = 0.01  # share of requests to PROFILING_PATHS profiled while enabled
+PROFILING_PATHS = ('/api/calculate-route',)
+PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN', '')
+PROFILING_MODE = 'sample'  # 'sample' (folded stacks for flame graphs) or 'cprofile' (.prof)
+PROFILING_INTERVAL = 0.005  # seconds between stack samples
+PROFILING_DIR = Path(tempfile.gettempdir()) / 'eld-profiles'
+PROFILING_MAX_FILES = 200  # per endpoint; oldest profiles are deleted first
+
+# Read API page sizes (?limit= is capped at the maximum)
+READ_API_PAGE_SIZE = 20
+READ_API_MAX_PAGE_SIZE = 100
+
+# Route result cache: waypoints are snapped to geohash cells of this precision
+# (5 ~ 4.9 km x 4.9 km) so near-identical lanes reuse one GraphHopper result
+ROUTE_CACHE_GEOHASH_PRECISION = 5
+ROUTE_CACHE_MAX_ENTRIES = 512
+ROUTE_CACHE_TTL = 60 * 60 * 6  # 6 hours
+
+# Simplified (level-of-detail) copies of route paths, one entry per path and tolerance
+GEOMETRY_CACHE_MAX_ENTRIES = 1024
+GEOMETRY_CACHE_TTL = 60 * 60 * 6  # 6 hours
+
+# GraphHopper client: one pooled session per process, bounded retries with
+# jittered backoff, and a circuit breaker that skips straight to the fallback
+# estimate while the upstream keeps failing. GRAPHHOPPER_BASE_URL can point at any
+# GraphHopper-compatible server, e.g. the stand-in used by `manage.py run_benchmarks`
+GRAPHHOPPER_BASE_URL = os.environ.get('GRAPHHOPPER_BASE_URL', 'https://graphhopper.com/api/1')
+GRAPHHOPPER_API_KEY = os.environ.get('GRAPHHOPPER_API_KEY', '8d9e695c-6152-4496-bb88-8f39f13a4d00')
+GRAPHHOPPER_POOL_SIZE = 20
+GRAPHHOPPER_MAX_RETRIES = 2
+GRAPHHOPPER_RETRY_BACKOFF = 0.3  # seconds, also the max jitter
+GRAPHHOPPER_BREAKER_FAILURE_THRESHOLD = 5
+GRAPHHOPPER_BREAKER_RESET_TIMEOUT = 30  # seconds
+# Route bodies at least this large (or of unknown length) are parsed as an event
+# stream with ijson, so the full JSON tree is never built; smaller ones use json
+ROUTE_STREAM_PARSE_MIN_BYTES = 1024 * 1024
+
+# Routing engine: 'graphhopper' (hosted API) or 'local' (the memory-mapped road
+# graph at ROAD_GRAPH_PATH). With ROUTING_FALLBACK = 'local', GraphHopper
+# failures are rerouted on the local graph before falling back to the rough
+# distance estimate. Rebuild the graph with `python manage.py build_road_graph`.
+ROUTING_ENGINE = 'graphhopper'
+ROUTING_FALLBACK = 'local'
+ROAD_GRAPH_PATH = BASE_DIR / 'routes' / 'data' / 'road_graph'
+ROAD_GRAPH_MAX_SNAP_KM = 50  # waypoints farther than this from any road can't be routed locally
+
+# Offline gazetteer used when GraphHopper can't geocode. Accepts the bundled
+# GeoNames TSV or a Census Bureau place gazetteer file (e.g. 2023_Gaz_place_national.txt)
+GAZETTEER_PATH = BASE_DIR / 'routes' / 'data' / 'us_places.tsv.gz'
+
+# Fallback estimator: great-circle legs scaled by circuity and speed factors
+# fitted per lane class from real GraphHopper routes. The built-in priors count
+# as this much observed distance, so a few odd routes can't swing the fit
+ROUTE_ESTIMATOR_PRIOR_WEIGHT_KM = 500
+# Stored GraphHopper routes folded into the fit at server start-up
+ROUTE_ESTIMATOR_WARM_ROUTES = 500
+
+# Truck stops and rest areas that planned breaks, resets and fuel stops are
+# moved to. Accepts a CSV like the bundled one or a GeoJSON export of OpenStreetMap
+# amenity=fuel (hgv=yes), highway=rest_area and highway=services points. None keeps
+# the generic "Rest Area"/"Fuel Station" labels. The bundled CSV is synthetic, so
+# it is only the default under DEBUG (which includes the test suite)
+TRUCK_STOPS_PATH = os.environ.get('TRUCK_STOPS_PATH') or (
+    BASE_DIR / 'routes' / 'data' / 'truck_stops.csv' if DEBUG else None
+)
+TRUCK_STOP_CORRIDOR_MILES = 5   # how far off the route a stop may be
+TRUCK_STOP_WINDOW_MILES = 60    # how far before the planned point a stop may be
+
+# Printable log sheets: rendered in a pool of worker processes (0 renders in the
+# request thread) and cached on disk under a hash of each sheet's content
+LOG_RENDER_WORKERS = 2
+LOG_SHEET_CACHE_DIR = Path(tempfile.gettempdir()) / 'eld-log-sheets'
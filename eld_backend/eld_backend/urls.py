@@ -21,4 +21,5 @@ from django.urls import path, include  # Add 'include' to the import
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('routes.urls')),
+    path('api/', include('eld_logs.urls')),
 ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 05:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eld_logs', '0001_initial'),
+        ('routes', '0004_route_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dailylog',
+            index=models.Index(fields=['route', 'log_date', 'id'], name='dailylog_route_date_idx'),
+        ),
+    ]
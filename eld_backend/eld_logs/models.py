@@ -18,6 +18,9 @@ class DailyLog(models.Model):
     driving_hours = models.FloatField(default=0)
     on_duty_hours = models.FloatField(default=0)
 
+    class Meta:
+        indexes = [models.Index(fields=['route', 'log_date', 'id'], name='dailylog_route_date_idx')]
+
     def __str__(self):
         return f"Log for {self.log_date} - {self.driver_name}"
 
@@ -0,0 +1,252 @@
+# eld_logs/rendering.py
+"""
+Printable driver's daily log sheets.
+
+Each DailyLog is drawn as a standard 24-hour duty-status grid (49 CFR 395.8) on a
+letter-size landscape page, rasterized with Pillow at SHEET_DPI. Pages are plain
+PNGs so each one can be rendered in a worker process and cached on its own; a trip's
+PDF is then written page by page around those PNGs, reusing their compressed pixel
+data as-is. Nothing here imports Django, so worker processes start cheaply.
+"""
+import hashlib
+import json
+import struct
+from io import BytesIO
+
+from PIL import Image, ImageDraw, ImageFont
+
+# Bump when the drawing changes so cached sheets are re-rendered
+RENDER_VERSION = 1
+SHEET_DPI = 150
+PAGE_POINTS = (792, 612)  # letter, landscape
+PAGE_PIXELS = (PAGE_POINTS[0] * SHEET_DPI // 72, PAGE_POINTS[1] * SHEET_DPI // 72)
+
+DUTY_ROWS = (
+    ('off_duty', '1. Off Duty'),
+    ('sleeper_berth', '2. Sleeper Berth'),
+    ('driving', '3. Driving'),
+    ('on_duty_not_driving', '4. On Duty (not driving)'),
+)
+HOUR_LABELS = ['Mid-\nnight'] + [str(h) for h in range(1, 12)] + ['Noon'] + [str(h) for h in range(1, 12)] + ['Mid-\nnight']
+
+GRID_LEFT, GRID_RIGHT, GRID_TOP, ROW_HEIGHT = 390, 1450, 380, 72
+TOTALS_X = 1500
+REMARKS_TOP = GRID_TOP + ROW_HEIGHT * len(DUTY_ROWS) + 70
+
+
+def _minutes(clock):
+    """'HH:MM' as minutes after midnight; the 23:59 end-of-day marker closes the day at 24:00"""
+    hours, minutes = (int(part) for part in clock.split(':'))
+    return 24 * 60 if (hours, minutes) == (23, 59) else hours * 60 + minutes
+
+
+def _fill_gaps(entries):
+    """A sheet must account for all 24 hours: time the plan leaves unrecorded is off duty"""
+    filled, clock = [], 0
+    for entry in sorted(entries, key=lambda entry: _minutes(entry['start'])):
+        start = _minutes(entry['start'])
+        if start > clock:
+            filled.append({'status': 'off_duty', 'start': f'{clock // 60:02d}:{clock % 60:02d}',
+                           'end': entry['start'], 'location': '', 'remarks': ''})
+        filled.append(entry)
+        clock = max(clock, _minutes(entry['end']))
+    if clock < 24 * 60:
+        filled.append({'status': 'off_duty', 'start': f'{clock // 60:02d}:{clock % 60:02d}',
+                       'end': '23:59', 'location': '', 'remarks': ''})
+    return filled
+
+
+def sheet_payload(daily_log, entries, route=None):
+    """Everything drawn on one sheet, as plain data that pickles to a worker and hashes stably"""
+    return {
+        'date': daily_log.log_date.isoformat(),
+        'driver': daily_log.driver_name,
+        'co_driver': daily_log.co_driver_name,
+        'carrier': daily_log.carrier_name,
+        'vehicle': daily_log.vehicle_number,
+        'shipping_document': daily_log.shipping_document,
+        'total_miles': daily_log.total_miles,
+        'from': route.pickup_location if route else '',
+        'to': route.dropoff_location if route else '',
+        'entries': _fill_gaps([
+            {
+                'status': entry.duty_status,
+                'start': entry.start_time.strftime('%H:%M'),
+                'end': entry.end_time.strftime('%H:%M'),
+                'location': entry.location,
+                'remarks': entry.remarks,
+            } for entry in entries
+        ]),
+    }
+
+
+def content_hash(payload):
+    """Stable digest of a sheet's content; equal hashes draw identical pages"""
+    encoded = json.dumps([RENDER_VERSION, SHEET_DPI, payload], sort_keys=True, separators=(',', ':'))
+    return hashlib.blake2b(encoded.encode(), digest_size=16).hexdigest()
+
+
+def _font(size):
+    return ImageFont.load_default(size=size)
+
+
+def _hour_x(minutes):
+    return GRID_LEFT + (GRID_RIGHT - GRID_LEFT) * minutes / (24 * 60)
+
+
+def render_sheet_png(payload):
+    """PNG bytes of one daily log sheet"""
+    image = Image.new('L', PAGE_PIXELS, 255)
+    draw = ImageDraw.Draw(image)
+    small, regular, large = _font(20), _font(26), _font(40)
+
+    draw.text((75, 50), "DRIVER'S DAILY LOG", font=large, fill=0)
+    draw.text((75, 100), '(one calendar day - 24 hours)', font=small, fill=0)
+    draw.text((PAGE_PIXELS[0] - 75, 55), payload['date'], font=large, fill=0, anchor='ra')
+
+    header = [
+        (f"From: {payload['from']}", f"To: {payload['to']}"),
+        (f"Total miles driving today: {payload['total_miles']}", f"Truck/tractor number: {payload['vehicle']}"),
+        (f"Carrier: {payload['carrier']}", f"Driver: {payload['driver']}"
+         + (f"   Co-driver: {payload['co_driver']}" if payload['co_driver'] else '')),
+    ]
+    for row, (left, right) in enumerate(header):
+        y = 160 + row * 45
+        draw.text((75, y), left, font=regular, fill=0)
+        draw.text((850, y), right, font=regular, fill=0)
+
+    # Grid: hour labels, row labels, quarter-hour ticks
+    grid_bottom = GRID_TOP + ROW_HEIGHT * len(DUTY_ROWS)
+    for hour, label in enumerate(HOUR_LABELS):
+        x = _hour_x(hour * 60)
+        draw.multiline_text((x, GRID_TOP - 12), label, font=small, fill=0, anchor='md', align='center')
+        draw.line((x, GRID_TOP, x, grid_bottom), fill=0, width=2)
+    draw.text((TOTALS_X, GRID_TOP - 12), 'Total\nhours', font=small, fill=0, anchor='ld')
+
+    totals = {status: 0.0 for status, _ in DUTY_ROWS}
+    for entry in payload['entries']:
+        totals[entry['status']] = totals.get(entry['status'], 0.0) + (
+            _minutes(entry['end']) - _minutes(entry['start'])) / 60
+
+    for row, (status, label) in enumerate(DUTY_ROWS):
+        top = GRID_TOP + row * ROW_HEIGHT
+        draw.rectangle((GRID_LEFT, top, GRID_RIGHT, top + ROW_HEIGHT), outline=0, width=2)
+        draw.text((75, top + ROW_HEIGHT / 2), label, font=regular, fill=0, anchor='lm')
+        draw.text((TOTALS_X, top + ROW_HEIGHT / 2), f'{totals[status]:.2f}', font=regular, fill=0, anchor='lm')
+        for quarter in range(1, 24 * 4):
+            if quarter % 4:
+                x = _hour_x(quarter * 15)
+                tick = ROW_HEIGHT * (0.4 if quarter % 4 == 2 else 0.25)
+                draw.line((x, top, x, top + tick), fill=0, width=1)
+    draw.text((TOTALS_X, grid_bottom + 12), f'= {sum(totals.values()):.2f}', font=regular, fill=0)
+
+    # Duty line: a run along each status row, joined by verticals at every change
+    rows = {status: row for row, (status, _) in enumerate(DUTY_ROWS)}
+    previous_y = None
+    for entry in payload['entries']:
+        y = GRID_TOP + rows.get(entry['status'], 0) * ROW_HEIGHT + ROW_HEIGHT / 2
+        start, end = _hour_x(_minutes(entry['start'])), _hour_x(_minutes(entry['end']))
+        if previous_y is not None and previous_y != y:
+            draw.line((start, previous_y, start, y), fill=0, width=5)
+        draw.line((start, y, end, y), fill=0, width=5)
+        previous_y = y
+
+    # Remarks: where each change of duty status happened
+    draw.text((75, REMARKS_TOP), 'REMARKS', font=regular, fill=0)
+    draw.line((75, REMARKS_TOP + 38, PAGE_PIXELS[0] - 75, REMARKS_TOP + 38), fill=0, width=2)
+    changes = [entry for entry in payload['entries'] if entry['location'] or entry['remarks']]
+    per_column = max(1, (PAGE_PIXELS[1] - REMARKS_TOP - 160) // 32)
+    columns = 1 if len(changes) <= per_column else 2
+    column_width = (PAGE_PIXELS[0] - 150) / columns
+    for index, entry in enumerate(changes[:per_column * columns]):
+        x = 75 + column_width * (index // per_column)
+        y = REMARKS_TOP + 55 + (index % per_column) * 32
+        text = f"{entry['start']}  {entry['location']}"
+        if entry['remarks']:
+            text += f" - {entry['remarks']}"
+        draw.text((x, y), text[:int(column_width // 10)], font=small, fill=0)
+
+    if payload['shipping_document']:
+        draw.text((75, PAGE_PIXELS[1] - 110), f"Shipping document: {payload['shipping_document']}", font=small, fill=0)
+    draw.text(
+        (75, PAGE_PIXELS[1] - 75), "I certify that these entries are true and correct: ____________________",
+        font=small, fill=0
+    )
+
+    buffer = BytesIO()
+    image.save(buffer, format='PNG', compress_level=6)
+    return buffer.getvalue()
+
+
+def _png_image(png):
+    """(width, height, colors, IDAT stream) of an 8-bit, non-interlaced gray or RGB PNG"""
+    position, width, height, colors, data = 8, 0, 0, 1, []
+    while position < len(png):
+        length, kind = struct.unpack('>I4s', png[position:position + 8])
+        body = png[position + 8:position + 8 + length]
+        if kind == b'IHDR':
+            width, height, depth, color_type, _, _, interlace = struct.unpack('>IIBBBBB', body)
+            if depth != 8 or color_type not in (0, 2) or interlace:
+                raise ValueError('Only 8-bit, non-interlaced gray or RGB PNGs can be embedded')
+            colors = 1 if color_type == 0 else 3
+        elif kind == b'IDAT':
+            data.append(body)
+        position += 12 + length
+    return width, height, colors, b''.join(data)
+
+
+def stream_pdf(pages, page_count):
+    """
+    Yield a PDF one page at a time from an iterable of sheet PNGs. The PNGs' zlib
+    data is embedded unchanged (FlateDecode with the PNG predictor), so no page is
+    decoded or recompressed, and each page is sent as soon as its PNG is ready
+    """
+    offsets = {}
+    written = 0
+
+    def emit(number, header, stream=None):
+        nonlocal written
+        offsets[number] = written
+        chunk = f'{number} 0 obj\n{header}\n'.encode()
+        if stream is not None:
+            chunk += b'stream\n' + stream + b'\nendstream\n'
+        chunk += b'endobj\n'
+        written += len(chunk)
+        return chunk
+
+    # Objects: 1 catalog, 2 page tree, then image, content and page objects for each page
+    start = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+    written = len(start)
+    yield start
+
+    width_pt, height_pt = PAGE_POINTS
+    index = -1
+    for index, png in enumerate(pages):
+        image, content, page = 3 + index * 3, 4 + index * 3, 5 + index * 3
+        width, height, colors, data = _png_image(png)
+        color_space = '/DeviceGray' if colors == 1 else '/DeviceRGB'
+        draw = f'q {width_pt} 0 0 {height_pt} 0 0 cm /Im0 Do Q'.encode()
+        yield emit(image, (
+            f'<< /Type /XObject /Subtype /Image /Width {width} /Height {height} /ColorSpace {color_space} '
+            f'/BitsPerComponent 8 /Filter /FlateDecode '
+            f'/DecodeParms << /Predictor 15 /Colors {colors} /BitsPerComponent 8 /Columns {width} >> '
+            f'/Length {len(data)} >>'
+        ), data)
+        yield emit(content, f'<< /Length {len(draw)} >>', draw)
+        yield emit(page, (
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width_pt} {height_pt}] '
+            f'/Resources << /XObject << /Im0 {image} 0 R >> >> /Contents {content} 0 R >>'
+        ))
+
+    if index + 1 != page_count:
+        raise ValueError(f'Expected {page_count} pages, got {index + 1}')
+    kids = ' '.join(f'{5 + index * 3} 0 R' for index in range(page_count))
+    tail = emit(2, f'<< /Type /Pages /Kids [{kids}] /Count {page_count} >>')
+    tail += emit(1, '<< /Type /Catalog /Pages 2 0 R >>')
+
+    xref_offset = written
+    count = 3 + page_count * 3
+    xref = [f'xref\n0 {count}\n', '0000000000 65535 f \n']
+    xref += [f'{offsets[number]:010d} 00000 n \n' for number in range(1, count)]
+    xref.append(f'trailer\n<< /Size {count} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n')
+    yield tail + ''.join(xref).encode()
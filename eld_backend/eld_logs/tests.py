@@ -1,3 +1,92 @@
-from django.test import TestCase
+import tempfile
+from datetime import date, time, timedelta
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from routes.models import Route
+from .models import DailyLog, LogEntry
+from .rendering import PAGE_PIXELS, content_hash, sheet_payload
+from .services import LogSheetService
+
+
+def create_route_with_logs(days):
+    route = Route.objects.create(
+        current_location='Atlanta, GA', pickup_location='Charlotte, NC', dropoff_location='Seattle, WA',
+        current_cycle_hours=0
+    )
+    for day in range(days):
+        log = DailyLog.objects.create(route=route, log_date=date(2026, 1, 1) + timedelta(days=day))
+        LogEntry.objects.bulk_create([
+            LogEntry(daily_log=log, duty_status='driving', start_time=time(6), end_time=time(17),
+                     location='En Route', total_hours=11),
+            LogEntry(daily_log=log, duty_status='off_duty', start_time=time(17), end_time=time(23, 59),
+                     location='Rest Stop', total_hours=7),
+        ])
+    return route
+
+
+class RouteDailyLogsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.route = create_route_with_logs(4)
+
+    def test_pages_of_logs_with_entries_in_fixed_queries(self):
+        url = reverse('route-daily-logs', args=[self.route.id])
+        # Route, page of logs, their entries
+        with self.assertNumQueries(3):
+            first = self.client.get(url, {'limit': 3})
+        data = first.json()
+        self.assertEqual([log['log_date'] for log in data['results']], ['2026-01-01', '2026-01-02', '2026-01-03'])
+        self.assertEqual(len(data['results'][0]['entries']), 2)
+
+        rest = self.client.get(url, {'limit': 3, 'cursor': data['next_cursor']}).json()
+        self.assertEqual([log['log_date'] for log in rest['results']], ['2026-01-04'])
+        self.assertIsNone(rest['next_cursor'])
+
+        with self.assertNumQueries(1):
+            again = self.client.get(url, {'limit': 3}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(self.client.get(reverse('route-daily-logs', args=[self.route.id + 1])).status_code, 404)
+
+
+@override_settings(LOG_RENDER_WORKERS=0)
+class LogSheetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.route = create_route_with_logs(4)
+
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        override = override_settings(LOG_SHEET_CACHE_DIR=cache_dir.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_sheet_is_a_page_sized_png_and_cached_by_content(self):
+        log = DailyLog.objects.filter(route=self.route).first()
+        url = reverse('daily-log-sheet', args=[log.id])
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertTrue(response.content.startswith(b'\x89PNG'))
+        self.assertEqual(int.from_bytes(response.content[16:20], 'big'), PAGE_PIXELS[0])
+
+        payload = sheet_payload(log, log.entries.all(), self.route)
+        # The 06:00-17:00 log leaves midnight-06:00 unrecorded; it is drawn off duty
+        self.assertEqual(payload['entries'][0]['status'], 'off_duty')
+        self.assertEqual(LogSheetService().cached(content_hash(payload)), response.content)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_trip_pdf_streams_a_page_per_day(self):
+        response = self.client.get(reverse('route-log-sheets-pdf', args=[self.route.id]))
+        self.assertTrue(response.streaming)
+        pdf = b''.join(response.streaming_content)
+        self.assertTrue(pdf.startswith(b'%PDF-'))
+        self.assertTrue(pdf.rstrip().endswith(b'%%EOF'))
+        self.assertIn(b'/Count 4', pdf)
+        self.assertEqual(pdf.count(b'/Subtype /Image'), 4)
+
+        empty = Route.objects.create(
+            current_location='A', pickup_location='B', dropoff_location='C', current_cycle_hours=0
+        )
+        self.assertEqual(self.client.get(reverse('route-log-sheets-pdf', args=[empty.id])).status_code, 404)
@@ -0,0 +1,143 @@
+# eld_logs/timeline.py
+"""
+Pure duty-status timeline engine.
+
+Turns a compliance summary into the day-by-day duty-status sequence that
+ELDLogGeneratorService persists. Nothing here imports Django, so plans can be
+previewed, compared or benchmarked without touching the database.
+"""
+from datetime import datetime, timedelta, time
+
+PICKUP_DROPOFF_TIME = 1.0  # 1 hour each
+MAX_DAILY_DRIVING = 11
+BREAK_AFTER_DRIVING = 8
+BREAK_DURATION = 0.5
+DAY_START = time(6, 0)
+DAY_END = time(23, 59)
+
+# Log entry for each kind of planned stop, and where it goes when no real place was found for it
+STOP_ENTRIES = {
+    'break': ('off_duty', 'Required 30-minute break', 'Rest Area'),
+    'fuel': ('on_duty_not_driving', 'Fuel stop', 'Fuel Station'),
+}
+REST_REMARKS = '10-hour off duty rest'
+REST_LOCATION = 'Rest Stop'
+DRIVING_REMARKS = {'break': 'Driving to required break', 'fuel': 'Driving to fuel stop', None: 'Driving to destination'}
+
+
+class Segment:
+    """One duty-status change on a daily log"""
+
+    __slots__ = ('duty_status', 'start', 'end', 'location', 'remarks', 'total_hours')
+
+    def __init__(self, duty_status, start, end, location, remarks, total_hours):
+        self.duty_status = duty_status
+        self.start = start
+        self.end = end
+        self.location = location
+        self.remarks = remarks
+        self.total_hours = total_hours
+
+    def __repr__(self):
+        return f"Segment({self.duty_status}: {self.start:%H:%M}-{self.end:%H:%M})"
+
+
+class DayPlan:
+    """Totals and segments for one calendar day of a trip"""
+
+    __slots__ = ('log_date', 'total_miles', 'driving_hours', 'on_duty_hours', 'segments', '_clock')
+
+    def __init__(self, log_date, total_miles, driving_hours, on_duty_hours):
+        self.log_date = log_date
+        self.total_miles = total_miles
+        self.driving_hours = driving_hours
+        self.on_duty_hours = on_duty_hours
+        self.segments = []
+        self._clock = datetime.combine(log_date, DAY_START)
+
+    def add(self, duty_status, hours, location, remarks):
+        """Append a segment of the given length starting where the last one ended"""
+        end = self._clock + timedelta(hours=hours)
+        self.segments.append(Segment(duty_status, self._clock, end, location, remarks, hours))
+        self._clock = end
+
+    def close(self, location, remarks):
+        """Fill the rest of the day with off-duty time"""
+        end_of_day = datetime.combine(self.log_date, DAY_END)
+        if self._clock < end_of_day:
+            hours = (end_of_day - self._clock).total_seconds() / 3600
+            self.segments.append(Segment('off_duty', self._clock, end_of_day, location, remarks, hours))
+            self._clock = end_of_day
+
+    def __repr__(self):
+        return f"DayPlan({self.log_date}, {len(self.segments)} segments)"
+
+
+def build_timeline(compliance_data, pickup_location, dropoff_location, start_date=None):
+    """
+    Return the trip's DayPlans, one per shift. The planned stops (compliance_data['stop_plan'],
+    from SegmentHOSScheduler) are logged in order, each at its own driving hour and place
+    """
+    start_date = start_date or datetime.now().date()
+    total_driving = compliance_data['driving_time_hours']
+    total_miles = compliance_data['distance_miles']
+    stops = compliance_data.get('stop_plan')
+    if stops is None:
+        stops = _fixed_stops(total_driving)
+    multi_day = any(stop['type'] == 'rest' for stop in stops)
+
+    days = []
+    day = DayPlan(start_date, 0, 0, 0)
+    day.add('on_duty_not_driving', PICKUP_DROPOFF_TIME, pickup_location, 'Loading and pickup')
+    driven = miles = 0.0
+    for stop in [*stops, None]:
+        until = total_driving if stop is None else min(stop['driving_hours'], total_driving)
+        if until > driven:
+            if multi_day:
+                first = not any(segment.duty_status == 'driving' for segment in day.segments)
+                remarks = f'Driving - Day {len(days) + 1}' + ('' if first else ' continued')
+            else:
+                remarks = DRIVING_REMARKS.get(stop and stop['type'], DRIVING_REMARKS[None])
+            day.add('driving', until - driven, 'En Route', remarks)
+
+        reached = total_miles if stop is None else stop.get('miles', total_miles * until / (total_driving or 1))
+        day.total_miles += reached - miles
+        driven, miles = until, reached
+        if stop is None:
+            break
+
+        if stop['type'] == 'rest':
+            day.close(stop.get('location') or REST_LOCATION, REST_REMARKS)
+            days.append(_with_totals(day))
+            day = DayPlan(start_date + timedelta(days=len(days)), 0, 0, 0)
+        else:
+            duty_status, remarks, location = STOP_ENTRIES[stop['type']]
+            day.add(duty_status, stop.get('duration_hours', BREAK_DURATION), stop.get('location') or location, remarks)
+
+    day.add('on_duty_not_driving', PICKUP_DROPOFF_TIME, dropoff_location, 'Unloading and delivery')
+    day.close(dropoff_location, 'End of duty')
+    days.append(_with_totals(day))
+    return days
+
+
+def _fixed_stops(total_driving):
+    """For summaries without a stop plan: 11-hour driving days with a break 8 hours into each"""
+    stops = []
+    shift_start = 0.0
+    while shift_start < total_driving:
+        if total_driving - shift_start > BREAK_AFTER_DRIVING:
+            stops.append({'type': 'break', 'driving_hours': shift_start + BREAK_AFTER_DRIVING})
+        shift_start += MAX_DAILY_DRIVING
+        if shift_start < total_driving:
+            stops.append({'type': 'rest', 'driving_hours': shift_start})
+    return stops
+
+
+def _with_totals(day):
+    """Fill in a finished day's totals from its segments"""
+    day.total_miles = round(day.total_miles)
+    day.driving_hours = sum(segment.total_hours for segment in day.segments if segment.duty_status == 'driving')
+    day.on_duty_hours = sum(
+        segment.total_hours for segment in day.segments if segment.duty_status == 'on_duty_not_driving'
+    )
+    return day
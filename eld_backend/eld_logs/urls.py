@@ -0,0 +1,9 @@
+# eld_logs/urls.py
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('routes/<int:route_id>/logs/', views.route_daily_logs, name='route-daily-logs'),
+    path('routes/<int:route_id>/logs.pdf', views.route_log_sheets_pdf, name='route-log-sheets-pdf'),
+    path('logs/<int:log_id>/sheet.png', views.daily_log_sheet, name='daily-log-sheet'),
+]
@@ -1,3 +1,87 @@
-from django.shortcuts import render
+# eld_logs/views.py
+from django.http import HttpResponse, StreamingHttpResponse
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
 
-# Create your views here.
+from routes.models import Route
+from routes.pagination import InvalidPage, keyset_page, not_modified, page_size, validators_for, with_validators
+from routes.serializers import DailyLogSerializer
+from .models import DailyLog
+from .rendering import content_hash, sheet_payload, stream_pdf
+from .services import LogSheetService
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def route_daily_logs(request, route_id):
+    """
+    A route's daily logs with their entries, in date order, one keyset page at a time.
+    Logs are written with their route and never edited, so a 304 costs one query
+    """
+    route = Route.objects.filter(pk=route_id).only('id', 'created_at').first()
+    if route is None:
+        return Response({'error': 'Route not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+    cursor = request.GET.get('cursor')
+    try:
+        limit = page_size(request)
+    except InvalidPage as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    etag, last_modified = validators_for(
+        'daily_logs', route.id, route.created_at, cursor, limit, last_modified=route.created_at
+    )
+    response = not_modified(request, etag, last_modified)
+    if response is None:
+        try:
+            logs, next_cursor = keyset_page(
+                DailyLog.objects.filter(route_id=route.id).prefetch_related('entries'), 'log_date', cursor, limit
+            )
+        except InvalidPage as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        response = Response({'results': DailyLogSerializer(logs, many=True).data, 'next_cursor': next_cursor})
+    return with_validators(response, etag, last_modified)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def daily_log_sheet(request, log_id):
+    """One daily log drawn as a printable 24-hour duty-status grid (PNG)"""
+    daily_log = DailyLog.objects.select_related('route').filter(pk=log_id).first()
+    if daily_log is None:
+        return Response({'error': 'Daily log not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+    payload = sheet_payload(daily_log, daily_log.entries.all(), daily_log.route)
+    etag, _ = validators_for('sheet', content_hash(payload))
+    response = not_modified(request, etag, None)
+    if response is None:
+        response = HttpResponse(next(LogSheetService().sheets([payload])), content_type='image/png')
+    return with_validators(response, etag, None)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def route_log_sheets_pdf(request, route_id):
+    """
+    All of a route's daily logs as one PDF, a page per day. Pages are streamed in
+    order as each finishes rendering; unchanged pages come from the sheet cache
+    """
+    route = Route.objects.filter(pk=route_id).first()
+    if route is None:
+        return Response({'error': 'Route not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+    logs = list(DailyLog.objects.filter(route_id=route.id).order_by('log_date', 'id').prefetch_related('entries'))
+    if not logs:
+        return Response({'error': 'This route has no daily logs.'}, status=status.HTTP_404_NOT_FOUND)
+
+    payloads = [sheet_payload(log, log.entries.all(), route) for log in logs]
+    etag, _ = validators_for('sheets', [content_hash(payload) for payload in payloads])
+    response = not_modified(request, etag, None)
+    if response is None:
+        response = StreamingHttpResponse(
+            stream_pdf(LogSheetService().sheets(payloads), len(payloads)), content_type='application/pdf'
+        )
+        response['Content-Disposition'] = f'inline; filename="route-{route.id}-logs.pdf"'
+    return with_validators(response, etag, None)
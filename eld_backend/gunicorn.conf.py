@@ -0,0 +1,61 @@
+"""
+Production server profile: gunicorn eld_backend.wsgi -c gunicorn.conf.py
+
+The app and its read-only data are loaded once in the master (preload_app plus
+the warm-up in when_ready) and then forked, so workers share those pages
+copy-on-write and start serving immediately. Startup time and per-worker memory
+are logged as each worker comes up.
+
+Environment:
+    DJANGO_DEBUG            false unless set; settings then require DJANGO_ALLOWED_HOSTS
+    PORT                    listen port (8000)
+    WEB_CONCURRENCY         worker processes (2 x cores + 1)
+    GUNICORN_THREADS        threads per worker (4); plans spend most of their time waiting on GraphHopper
+    GUNICORN_WORKER_CLASS   'gthread', or 'uvicorn.workers.UvicornWorker' with eld_backend.asgi:application
+                            for the async endpoint
+"""
+import multiprocessing
+import os
+import time
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+preload_app = True
+# Above ROUTE_REQUEST_DEADLINE, so a slow upstream fails the request rather than the worker
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then so slow leaks can't build up; replacements fork from the warm master
+max_requests = 2000
+max_requests_jitter = 200
+accesslog = '-'
+# Applied before the app is preloaded; DEBUG would also honour token-less X-Profile requests
+raw_env = [f"DJANGO_DEBUG={os.environ.get('DJANGO_DEBUG', 'false')}"]
+
+_started = time.monotonic()
+
+
+def when_ready(server):
+    # Runs in the master after the app is preloaded and before the first fork
+    from eld_backend.serving import process_memory, warm_up
+
+    timings = warm_up()
+    server.log.info(
+        f"Warm-up done in {sum(timings.values()):.2f}s {timings}; ready {time.monotonic() - _started:.2f}s "
+        f"after start; master memory {process_memory()}"
+    )
+
+
+def pre_fork(server, worker):
+    worker.forked_at = time.monotonic()
+
+
+def post_worker_init(worker):
+    from eld_backend.serving import process_memory
+
+    worker.log.info(
+        f"Worker {worker.pid} ready {(time.monotonic() - worker.forked_at) * 1000:.0f} ms after fork; "
+        f"memory {process_memory()}"
+    )
@@ -0,0 +1,279 @@
+# routes/benchmarks.py
+"""
+End-to-end benchmarks for the plan pipeline, run with `python manage.py run_benchmarks`.
+
+Each benchmark repeats one operation over the recorded lanes:
+
+    route_service          RouteCalculationService.calculate_route with the geocode cache cold
+                           and the route cache bypassed, so every op makes 3 geocodes and 1 route call
+    hos                    HOSComplianceCalculator.calculate_compliance on the recorded routes
+    stop_planner           SegmentHOSScheduler.plan_stops on a synthetic 5,000 km route with
+                           3,000 steps and 40,000 points, profile and polyline decode included
+    log_generator          ELDLogGeneratorService.build_daily_logs + save_daily_logs
+    calculate_route_view   POST /api/calculate-route/ through every middleware, with
+                           Cache-Control: no-cache (geocodes stay cached; /route is called every time)
+
+GraphHopper is replaced by the local FakeGraphHopper, so upstream latency and
+failures are set by the run.
+
+Each benchmark makes two passes. The timed pass gives throughput and latency
+percentiles. A shorter second pass counts SQL queries (from every thread) and
+the peak memory traced by tracemalloc per op. Tracing slows everything down, so
+it is kept out of the timed pass.
+"""
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+
+from django.db.backends.utils import CursorWrapper
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from eld_logs.services import ELDLogGeneratorService
+from .cache import geocode_cache, route_cache
+from .geo import encode_polyline
+from .models import GeocodeCacheEntry, Route
+from .scheduler import SegmentHOSScheduler
+from .services import HOSComplianceCalculator, RouteCalculationService
+from .upstream import graphhopper_breaker
+
+BENCHMARKS = ('route_service', 'hos', 'log_generator', 'calculate_route_view', 'stop_planner')
+BASELINE = Path(__file__).resolve().parent / 'data' / 'benchmark_baseline.json'
+
+# Cycle hours the HOS and log benchmarks rotate through: fresh, mid-week, close to the 70-hour limit
+CYCLE_HOURS = (0, 35, 62)
+
+# Growth over the baseline allowed before a metric counts as a regression. Query counts must not grow at all
+TIMING_TOLERANCE = 0.25
+ALLOCATION_TOLERANCE = 0.10
+# Noise floors, so sub-millisecond timings and small allocations don't fail on jitter alone
+MIN_TIMING_SLACK_MS = 0.1
+MIN_ALLOCATION_SLACK_KB = 4
+
+TIMING_METRICS = ('p50_ms', 'p95_ms', 'p99_ms')
+
+
+class QueryCounter:
+    """Count SQL statements run on any connection, from any thread"""
+
+    def __init__(self):
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        execute = CursorWrapper._execute_with_wrappers
+
+        def counted(cursor, *args, **kwargs):
+            with self._lock:
+                self.total += 1
+            return execute(cursor, *args, **kwargs)
+
+        # Patched on the class: execute_wrapper() would only see this thread's connection
+        self._patch = mock.patch.object(CursorWrapper, '_execute_with_wrappers', counted)
+        self._patch.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._patch.stop()
+
+
+def synthetic_route(distance_km=5000, steps=3000, points=40000, mph=55, start=(30.0, -120.0), end=(45.0, -75.0)):
+    """route_data for a straight, constant-speed route with evenly split steps and points"""
+    coords = np.linspace(start, end, points)
+    bounds = np.linspace(0, points - 1, steps + 1).astype(int)
+    step_meters = distance_km * 1000 / steps
+    step_ms = step_meters / 1609.34 / mph * 3.6e6
+    return {
+        'distance_meters': distance_km * 1000,
+        'time_seconds': step_ms * steps / 1000,
+        'instructions': [
+            {'text': f'Step {i}', 'distance': step_meters, 'time': step_ms, 'interval': [int(bounds[i]), int(bounds[i + 1])]}
+            for i in range(steps)
+        ],
+        'points': encode_polyline(coords),
+    }
+
+
+def _percentile(ordered, q):
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def measure(op, iterations, warmup=3, setup=None, profile_iterations=5):
+    """
+    Run op(i) and return throughput, latency percentiles, and the mean SQL queries
+    and peak allocated KB per op. setup(i), if given, runs before each op and is
+    left out of every measurement
+    """
+    for i in range(warmup):
+        if setup:
+            setup(i)
+        op(i)
+
+    latencies = []
+    for i in range(iterations):
+        if setup:
+            setup(i)
+        started = time.perf_counter()
+        op(i)
+        latencies.append(time.perf_counter() - started)
+
+    queries = []
+    peaks = []
+    tracemalloc.start()
+    try:
+        with QueryCounter() as counter:
+            for i in range(max(1, min(profile_iterations, iterations))):
+                if setup:
+                    setup(i)
+                queries_before = counter.total
+                tracemalloc.reset_peak()
+                memory_before = tracemalloc.get_traced_memory()[0]
+                op(i)
+                peaks.append(tracemalloc.get_traced_memory()[1] - memory_before)
+                queries.append(counter.total - queries_before)
+    finally:
+        tracemalloc.stop()
+
+    ordered = sorted(latencies)
+    return {
+        'ops_per_s': round(len(latencies) / sum(latencies), 2),
+        **{metric: round(_percentile(ordered, q) * 1000, 3) for metric, q in zip(TIMING_METRICS, (0.5, 0.95, 0.99))},
+        'queries_per_op': round(sum(queries) / len(queries), 2),
+        'alloc_peak_kb': round(sum(peaks) / len(peaks) / 1024, 1),
+    }
+
+
+class BenchmarkSuite:
+    """The plan pipeline benchmarks against a running FakeGraphHopper; writes to the (test) database"""
+
+    def __init__(self, fake, iterations=30, warmup=3, profile_iterations=5):
+        self.fake = fake
+        self.lanes = fake.lanes
+        self.options = {'iterations': iterations, 'warmup': warmup, 'profile_iterations': profile_iterations}
+        self._route_data = None
+
+    def run(self, names=BENCHMARKS):
+        results = {}
+        with override_settings(GRAPHHOPPER_BASE_URL=self.fake.url):
+            for name in names:
+                self._reset()
+                results[name] = getattr(self, f'bench_{name}')()
+        return results
+
+    def _reset(self):
+        geocode_cache.clear()
+        GeocodeCacheEntry.objects.all().delete()
+        route_cache.clear()
+        graphhopper_breaker.reset()
+
+    def _lane(self, i):
+        return self.lanes[i % len(self.lanes)]
+
+    def _routes(self):
+        """RouteCalculationService output for every lane, fetched once"""
+        if self._route_data is None:
+            service = RouteCalculationService()
+            self._route_data = [service.calculate_route(*lane, use_cache=False) for lane in self.lanes]
+        return self._route_data
+
+    def bench_route_service(self):
+        engines = Counter()
+
+        def cold(i):
+            geocode_cache.clear()
+            GeocodeCacheEntry.objects.all().delete()
+
+        def op(i):
+            engines[RouteCalculationService().calculate_route(*self._lane(i), use_cache=False)['engine']] += 1
+
+        result = measure(op, setup=cold, **self.options)
+        # Anything but 'graphhopper' is a fallback: expected only when failures are injected
+        result['engines'] = dict(engines)
+        return result
+
+    def bench_hos(self):
+        routes = self._routes()
+        calculator = HOSComplianceCalculator()
+
+        def op(i):
+            calculator.calculate_compliance(routes[i % len(routes)], CYCLE_HOURS[i % len(CYCLE_HOURS)])
+
+        return measure(op, **self.options)
+
+    def bench_stop_planner(self):
+        route_data = synthetic_route()
+        scheduler = SegmentHOSScheduler()
+
+        def op(i):
+            scheduler.plan_stops(route_data)
+
+        return measure(op, **self.options)
+
+    def bench_log_generator(self):
+        calculator = HOSComplianceCalculator()
+        generator = ELDLogGeneratorService()
+        plans = []
+        for i, (lane, route_data) in enumerate(zip(self.lanes, self._routes())):
+            cycle_hours = CYCLE_HOURS[i % len(CYCLE_HOURS)]
+            route = Route.objects.create(
+                current_location=lane[0], pickup_location=lane[1], dropoff_location=lane[2],
+                current_cycle_hours=cycle_hours
+            )
+            plans.append((route, calculator.calculate_compliance(route_data, cycle_hours)))
+
+        def op(i):
+            route, compliance_data = plans[i % len(plans)]
+            generator.save_daily_logs(generator.build_daily_logs(route, compliance_data))
+
+        return measure(op, **self.options)
+
+    def bench_calculate_route_view(self):
+        client = Client()
+        url = reverse('calculate-route')
+
+        def op(i):
+            lane = self._lane(i)
+            response = client.post(url, {
+                'current_location': lane[0],
+                'pickup_location': lane[1],
+                'dropoff_location': lane[2],
+                'current_cycle_hours': CYCLE_HOURS[i % len(CYCLE_HOURS)],
+            }, content_type='application/json', headers={'Cache-Control': 'no-cache'})
+            if response.status_code != 201:
+                raise RuntimeError(f"calculate-route answered {response.status_code}: {response.content[:200]!r}")
+
+        return measure(op, **self.options)
+
+
+def compare(results, baseline, timings=True, tolerance=TIMING_TOLERANCE, allocation_tolerance=ALLOCATION_TOLERANCE):
+    """Regressions of results against a stored baseline, one line each; timings=False checks only queries and memory"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get('benchmarks', {}).get(name)
+        if base is None:
+            continue
+
+        if timings:
+            for metric in TIMING_METRICS:
+                limit = max(base[metric] * (1 + tolerance), base[metric] + MIN_TIMING_SLACK_MS)
+                if result[metric] > limit:
+                    regressions.append(f"{name} {metric} {result[metric]} > {limit:.3f} (baseline {base[metric]})")
+            floor = base['ops_per_s'] / (1 + tolerance)
+            if result['ops_per_s'] < floor:
+                regressions.append(f"{name} ops_per_s {result['ops_per_s']} < {floor:.2f} (baseline {base['ops_per_s']})")
+
+        if result['queries_per_op'] > base['queries_per_op']:
+            regressions.append(
+                f"{name} queries_per_op {result['queries_per_op']} > {base['queries_per_op']} (baseline)"
+            )
+        limit = max(base['alloc_peak_kb'] * (1 + allocation_tolerance), base['alloc_peak_kb'] + MIN_ALLOCATION_SLACK_KB)
+        if result['alloc_peak_kb'] > limit:
+            regressions.append(
+                f"{name} alloc_peak_kb {result['alloc_peak_kb']} > {limit:.1f} (baseline {base['alloc_peak_kb']})"
+            )
+    return regressions
@@ -0,0 +1,361 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import F
+from django.utils import timezone
+
+from .geo import decode_polyline, encode_polyline, geohash_encode, simplify_polyline
+
+logger = logging.getLogger(__name__)
+
+STATE_ABBREVIATIONS = {
+    'alabama': 'al', 'alaska': 'ak', 'arizona': 'az', 'arkansas': 'ar',
+    'california': 'ca', 'colorado': 'co', 'connecticut': 'ct', 'delaware': 'de',
+    'district of columbia': 'dc', 'florida': 'fl', 'georgia': 'ga', 'hawaii': 'hi',
+    'idaho': 'id', 'illinois': 'il', 'indiana': 'in', 'iowa': 'ia',
+    'kansas': 'ks', 'kentucky': 'ky', 'louisiana': 'la', 'maine': 'me',
+    'maryland': 'md', 'massachusetts': 'ma', 'michigan': 'mi', 'minnesota': 'mn',
+    'mississippi': 'ms', 'missouri': 'mo', 'montana': 'mt', 'nebraska': 'ne',
+    'nevada': 'nv', 'new hampshire': 'nh', 'new jersey': 'nj', 'new mexico': 'nm',
+    'new york': 'ny', 'north carolina': 'nc', 'north dakota': 'nd', 'ohio': 'oh',
+    'oklahoma': 'ok', 'oregon': 'or', 'pennsylvania': 'pa', 'rhode island': 'ri',
+    'south carolina': 'sc', 'south dakota': 'sd', 'tennessee': 'tn', 'texas': 'tx',
+    'utah': 'ut', 'vermont': 'vt', 'virginia': 'va', 'washington': 'wa',
+    'west virginia': 'wv', 'wisconsin': 'wi', 'wyoming': 'wy',
+}
+
+COUNTRY_SUFFIXES = {'us', 'usa', 'united states', 'united states of america'}
+
+
+def normalize_location(location_string):
+    """Build a cache key that ignores case, spacing and state spelling"""
+    text = location_string.lower().replace('.', '')
+    parts = [' '.join(part.split()) for part in text.split(',')]
+    parts = [part for part in parts if part]
+
+    if len(parts) > 1 and parts[-1] in COUNTRY_SUFFIXES:
+        parts.pop()
+
+    # A lone name is a place, not a state: 'New York' and 'NY' are different lookups
+    if len(parts) > 1:
+        parts[-1] = STATE_ABBREVIATIONS.get(parts[-1], parts[-1])
+
+    return ', '.join(parts)
+
+
+class LRUCache:
+    """Thread-safe in-process LRU cache with a per-entry TTL"""
+
+    def __init__(self, max_entries, ttl_seconds):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl_seconds=None):
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class GeocodeCache:
+    """Two-tier geocode cache: per-process LRU in front of a shared DB table"""
+
+    # Prune the DB tier once every this many writes
+    PRUNE_EVERY = 100
+
+    def __init__(self):
+        self.ttl_seconds = getattr(settings, 'GEOCODE_CACHE_TTL', 60 * 60 * 24 * 30)
+        self.db_max_entries = getattr(settings, 'GEOCODE_CACHE_DB_ENTRIES', 50000)
+        self.memory = LRUCache(
+            getattr(settings, 'GEOCODE_CACHE_MEMORY_ENTRIES', 1024),
+            self.ttl_seconds
+        )
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.counters = {
+            'memory_hits': 0,
+            'db_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'db_evictions': 0,
+            'db_errors': 0,
+        }
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def get(self, location_string):
+        """Return cached coordinates for a location, or None on a miss"""
+        return self.get_many([location_string]).get(location_string)
+
+    def get_many(self, location_strings):
+        """Look up several locations with at most one DB round trip per chunk; returns {location: coords}"""
+        found = {}
+        missing = {}
+        for location in location_strings:
+            key = normalize_location(location)
+            coords = self.memory.get(key)
+            if coords is not None:
+                self._count('memory_hits')
+                found[location] = dict(coords)
+            else:
+                missing.setdefault(key, []).append(location)
+
+        if missing:
+            rows = self._db_get_many(list(missing))
+            for key, locations in missing.items():
+                coords = rows.get(key)
+                if coords is None:
+                    self._count('misses', len(locations))
+                    continue
+
+                self._count('db_hits', len(locations))
+                self.memory.set(key, coords)
+                for location in locations:
+                    found[location] = dict(coords)
+
+        return found
+
+    def set(self, location_string, coords):
+        """Store geocoded coordinates in both tiers"""
+        key = normalize_location(location_string)
+        coords = {'lat': coords['lat'], 'lng': coords['lng'], 'name': coords['name']}
+
+        self.memory.set(key, coords)
+        self._db_set(key, coords)
+        self._count('stores')
+
+    # Keep IN (...) lists well under SQLite's bound-parameter limit
+    DB_CHUNK_SIZE = 500
+
+    def _db_get_many(self, keys):
+        from .models import GeocodeCacheEntry
+
+        now = timezone.now()
+        rows = {}
+        try:
+            for start in range(0, len(keys), self.DB_CHUNK_SIZE):
+                chunk = keys[start:start + self.DB_CHUNK_SIZE]
+                entries = GeocodeCacheEntry.objects.filter(
+                    key__in=chunk, expires_at__gt=now
+                ).values('key', 'latitude', 'longitude', 'name')
+                hit_keys = []
+                for entry in entries:
+                    rows[entry['key']] = {'lat': entry['latitude'], 'lng': entry['longitude'], 'name': entry['name']}
+                    hit_keys.append(entry['key'])
+
+                if hit_keys:
+                    GeocodeCacheEntry.objects.filter(key__in=hit_keys).update(
+                        hits=F('hits') + 1, last_used_at=now
+                    )
+        except DatabaseError as e:
+            logger.error(f"Geocode cache read failed for {len(keys)} keys: {e}")
+            self._count('db_errors')
+
+        return rows
+
+    def _db_set(self, key, coords):
+        from .models import GeocodeCacheEntry
+
+        now = timezone.now()
+        try:
+            GeocodeCacheEntry.objects.update_or_create(
+                key=key,
+                defaults={
+                    'latitude': coords['lat'],
+                    'longitude': coords['lng'],
+                    'name': coords['name'][:255],
+                    'last_used_at': now,
+                    'expires_at': now + timedelta(seconds=self.ttl_seconds),
+                }
+            )
+        except DatabaseError as e:
+            logger.error(f"Geocode cache write failed for {key}: {e}")
+            self._count('db_errors')
+            return
+
+        with self._lock:
+            self._writes += 1
+            should_prune = self._writes % self.PRUNE_EVERY == 0
+
+        if should_prune:
+            self.prune()
+
+    def prune(self):
+        """Drop expired rows and trim the DB tier to its size bound"""
+        from .models import GeocodeCacheEntry
+
+        try:
+            expired, _ = GeocodeCacheEntry.objects.filter(expires_at__lte=timezone.now()).delete()
+
+            overflow = GeocodeCacheEntry.objects.count() - self.db_max_entries
+            evicted = 0
+            if overflow > 0:
+                stale_ids = list(
+                    GeocodeCacheEntry.objects.order_by('last_used_at')
+                    .values_list('id', flat=True)[:overflow]
+                )
+                evicted, _ = GeocodeCacheEntry.objects.filter(id__in=stale_ids).delete()
+        except DatabaseError as e:
+            logger.error(f"Geocode cache prune failed: {e}")
+            self._count('db_errors')
+            return
+
+        self._count('db_evictions', expired + evicted)
+
+    def warm(self, limit=None):
+        """Load the most-used DB rows into the in-process tier; returns how many were loaded"""
+        from .models import GeocodeCacheEntry
+
+        limit = self.memory.max_entries if limit is None else limit
+        try:
+            rows = list(
+                GeocodeCacheEntry.objects.filter(expires_at__gt=timezone.now())
+                .order_by('-hits', '-last_used_at')
+                .values_list('key', 'latitude', 'longitude', 'name')[:limit]
+            )
+        except DatabaseError as e:
+            logger.error(f"Geocode cache warm-up failed: {e}")
+            self._count('db_errors')
+            return 0
+
+        # Least used first, so the busiest locations end up most recently used
+        for key, lat, lng, name in reversed(rows):
+            self.memory.set(key, {'lat': lat, 'lng': lng, 'name': name})
+        return len(rows)
+
+    def clear(self):
+        """Empty the in-process tier (the shared DB tier is left alone)"""
+        self.memory.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+
+        lookups = stats['memory_hits'] + stats['db_hits'] + stats['misses']
+        stats['memory_entries'] = len(self.memory)
+        stats['memory_evictions'] = self.memory.evictions
+        stats['hit_ratio'] = round((lookups - stats['misses']) / lookups, 3) if lookups else 0.0
+        return stats
+
+
+# Shared by every RouteCalculationService in this process
+geocode_cache = GeocodeCache()
+
+
+class RouteResultCache:
+    """In-process cache of GraphHopper route results keyed on snapped waypoints"""
+
+    def __init__(self):
+        self.precision = getattr(settings, 'ROUTE_CACHE_GEOHASH_PRECISION', 5)
+        self.memory = LRUCache(
+            getattr(settings, 'ROUTE_CACHE_MAX_ENTRIES', 512),
+            getattr(settings, 'ROUTE_CACHE_TTL', 60 * 60 * 6)
+        )
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'stores': 0}
+
+    def key_for(self, points):
+        """Snap each (lat, lng) waypoint to its geohash cell so nearby lanes share a key"""
+        return '|'.join(geohash_encode(point['lat'], point['lng'], self.precision) for point in points)
+
+    def get(self, points):
+        route = self.memory.get(self.key_for(points))
+        with self._lock:
+            self.counters['hits' if route is not None else 'misses'] += 1
+        return route
+
+    def set(self, points, route):
+        self.memory.set(self.key_for(points), route)
+        with self._lock:
+            self.counters['stores'] += 1
+
+    def clear(self):
+        self.memory.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+
+        stats['entries'] = len(self.memory)
+        stats['evictions'] = self.memory.evictions
+        stats['geohash_precision'] = self.precision
+        return stats
+
+
+# Shared by every RouteCalculationService in this process
+route_cache = RouteResultCache()
+
+
+class SimplifiedGeometryCache:
+    """In-process cache of simplified polylines keyed on the full path and the tolerance"""
+
+    def __init__(self):
+        self.memory = LRUCache(
+            getattr(settings, 'GEOMETRY_CACHE_MAX_ENTRIES', 1024),
+            getattr(settings, 'GEOMETRY_CACHE_TTL', 60 * 60 * 6)
+        )
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0}
+
+    def simplified(self, encoded_points, tolerance_m):
+        """(encoded polyline, point count) of the path simplified to tolerance_m"""
+        key = (hashlib.blake2b(encoded_points.encode('ascii'), digest_size=16).hexdigest(), round(tolerance_m, 1))
+        result = self.memory.get(key)
+        with self._lock:
+            self.counters['hits' if result is not None else 'misses'] += 1
+
+        if result is None:
+            points = simplify_polyline(decode_polyline(encoded_points), tolerance_m)
+            result = (encode_polyline(points), len(points))
+            self.memory.set(key, result)
+        return result
+
+    def clear(self):
+        self.memory.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+
+        stats['entries'] = len(self.memory)
+        stats['evictions'] = self.memory.evictions
+        return stats
+
+
+# Shared by every view in this process
+geometry_cache = SimplifiedGeometryCache()
@@ -0,0 +1,152 @@
+# routes/estimator.py
+import logging
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.db import DatabaseError
+
+from .geo import haversine_m
+
+logger = logging.getLogger(__name__)
+
+# Lane classes by great-circle length: local (< 80 km), regional (< 400 km), long haul
+LANE_CLASSES = ('local', 'regional', 'long_haul')
+LANE_CLASS_BOUNDS_M = np.array([80e3, 400e3])
+
+# Starting factors before any real routes have been seen: road distance per
+# great-circle meter, and average truck speed over the road distance (km/h)
+PRIOR_CIRCUITY = np.array([1.30, 1.22, 1.17])
+PRIOR_SPEED_KPH = np.array([45.0, 72.0, 88.0])
+
+
+class RouteEstimator:
+    """
+    Great-circle distance scaled by circuity and speed factors per lane class,
+    fitted from real routes as they arrive. Every method takes arrays of
+    waypoint pairs so a whole batch is estimated in one NumPy pass
+    """
+
+    def __init__(self, prior_weight_m=None):
+        # The priors count as this much great-circle distance of observed routes
+        prior_weight_m = prior_weight_m or getattr(settings, 'ROUTE_ESTIMATOR_PRIOR_WEIGHT_KM', 500) * 1000
+        self._lock = threading.Lock()
+        self._great_circle_m = np.full(len(LANE_CLASSES), float(prior_weight_m))
+        self._road_m = self._great_circle_m * PRIOR_CIRCUITY
+        self._seconds = self._road_m / (PRIOR_SPEED_KPH / 3.6)
+        self._observations = np.zeros(len(LANE_CLASSES), dtype=np.int64)
+
+    @staticmethod
+    def _pairs(origins, destinations):
+        origins = np.asarray(origins, dtype=np.float64).reshape(-1, 2)
+        destinations = np.asarray(destinations, dtype=np.float64).reshape(-1, 2)
+        great_circle = haversine_m(origins[:, 0], origins[:, 1], destinations[:, 0], destinations[:, 1])
+        return great_circle, np.digitize(great_circle, LANE_CLASS_BOUNDS_M)
+
+    def factors(self):
+        """Current (circuity, speed in m/s) per lane class"""
+        with self._lock:
+            return self._road_m / self._great_circle_m, self._road_m / self._seconds
+
+    def estimate(self, origins, destinations):
+        """Road meters and driving seconds for (n, 2) lat/lng origin and destination arrays"""
+        great_circle, lane_class = self._pairs(origins, destinations)
+        circuity, speed = self.factors()
+        road_m = great_circle * circuity[lane_class]
+        return road_m, road_m / speed[lane_class]
+
+    def observe(self, origins, destinations, road_m, seconds):
+        """Fold real routed legs into the running fit"""
+        great_circle, lane_class = self._pairs(origins, destinations)
+        road_m = np.asarray(road_m, dtype=np.float64).reshape(-1)
+        seconds = np.asarray(seconds, dtype=np.float64).reshape(-1)
+
+        # Legs that snap to the same point or carry no timing would skew the ratios
+        usable = (great_circle > 1000) & (road_m > 0) & (seconds > 0)
+        great_circle, lane_class, road_m, seconds = (
+            great_circle[usable], lane_class[usable], road_m[usable], seconds[usable]
+        )
+
+        with self._lock:
+            np.add.at(self._great_circle_m, lane_class, great_circle)
+            np.add.at(self._road_m, lane_class, road_m)
+            np.add.at(self._seconds, lane_class, seconds)
+            np.add.at(self._observations, lane_class, 1)
+
+    def warm(self, limit=None):
+        """
+        Fold the most recent stored GraphHopper routes into the fit, so a restarted
+        process doesn't start over from the priors. Each route splits into its two
+        legs at the stored step nearest the pickup; returns how many routes were used
+        """
+        from .cache import geocode_cache
+        from .models import RouteGeometry
+
+        limit = getattr(settings, 'ROUTE_ESTIMATOR_WARM_ROUTES', 500) if limit is None else limit
+        try:
+            geometries = list(
+                RouteGeometry.objects.filter(engine='graphhopper').select_related('route')
+                .prefetch_related('route__steps').order_by('-created_at')[:limit]
+            )
+        except DatabaseError as e:
+            logger.error(f"Route estimator warm-up failed: {e}")
+            return 0
+
+        trips = [
+            (geometry.route.current_location, geometry.route.pickup_location, geometry.route.dropoff_location)
+            for geometry in geometries
+        ]
+        geocodes = geocode_cache.get_many({location for trip in trips for location in trip})
+
+        origins, destinations, road_m, seconds = [], [], [], []
+        for geometry, trip in zip(geometries, trips):
+            points = [geocodes.get(location) for location in trip]
+            steps = [step for step in geometry.route.steps.all() if step.latitude is not None]
+            if not all(points) or not steps:
+                continue
+
+            # The step that starts at the pickup opens the second leg
+            step_meters = np.array([step.distance_meters for step in steps])
+            step_seconds = np.array([step.duration_seconds for step in steps])
+            split = int(haversine_m(
+                [step.latitude for step in steps], [step.longitude for step in steps], points[1]['lat'], points[1]['lng']
+            ).argmin())
+
+            coords = [[point['lat'], point['lng']] for point in points]
+            origins += coords[:-1]
+            destinations += coords[1:]
+            road_m += [step_meters[:split].sum(), step_meters[split:].sum()]
+            seconds += [step_seconds[:split].sum(), step_seconds[split:].sum()]
+
+        if origins:
+            self.observe(origins, destinations, road_m, seconds)
+        return len(origins) // 2
+
+    def snapshot(self):
+        """Fitted factors for health checks and monitoring"""
+        circuity, speed = self.factors()
+        with self._lock:
+            observations = self._observations.tolist()
+        return {
+            name: {
+                'circuity': round(float(circuity[i]), 3),
+                'speed_kph': round(float(speed[i] * 3.6), 1),
+                'observations': observations[i],
+            }
+            for i, name in enumerate(LANE_CLASSES)
+        }
+
+
+def route_legs(path):
+    """Per-leg [meters, seconds] of a routed path, split at GraphHopper's via-point instructions (sign 5)"""
+    legs = [[0.0, 0.0]]
+    for step in path.get('instructions') or []:
+        legs[-1][0] += step.get('distance', 0)
+        legs[-1][1] += step.get('time', 0) / 1000
+        if step.get('sign') == 5:
+            legs.append([0.0, 0.0])
+    return legs
+
+
+# Shared by every RouteCalculationService in this process
+route_estimator = RouteEstimator()
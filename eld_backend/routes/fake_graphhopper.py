@@ -0,0 +1,287 @@
+# routes/fake_graphhopper.py
+"""
+Local stand-in for the GraphHopper API, for benchmarks and load tests.
+
+FakeGraphHopper serves /geocoding and /route on a free localhost port. It replays
+payloads from a recordings file (RECORDINGS by default). Each response waits a
+fixed latency plus random jitter. A failure_rate share of requests fail, either
+with a 503 or by dropping the connection. That makes retries, the circuit
+breaker and the fallbacks behave as they would against a flaky upstream. Point
+the app at the server with GRAPHHOPPER_BASE_URL = server.url.
+
+Lookups not in the recordings get GraphHopper's answers: a geocode gets no hits,
+and a route gets a 400.
+
+record_lanes() builds a recordings file. It can record from a real
+GraphHopper-compatible server, or build one offline from the bundled gazetteer
+and the local road graph.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+from .cache import normalize_location
+
+logger = logging.getLogger(__name__)
+
+RECORDINGS = Path(__file__).resolve().parent / 'data' / 'graphhopper_recordings.json'
+
+# (current, pickup, dropoff) lanes that the bundled recordings cover
+LANES = [
+    ('Atlanta, GA', 'Charlotte, NC', 'Jacksonville, FL'),
+    ('Dallas, TX', 'Oklahoma City, OK', 'Denver, CO'),
+    ('Chicago, IL', 'Indianapolis, IN', 'Nashville, TN'),
+    ('Los Angeles, CA', 'Phoenix, AZ', 'El Paso, TX'),
+    ('Seattle, WA', 'Portland, OR', 'Sacramento, CA'),
+    ('Houston, TX', 'San Antonio, TX', 'Albuquerque, NM'),
+    ('Memphis, TN', 'Little Rock, AR', 'Dallas, TX'),
+    ('Kansas City, MO', 'St. Louis, MO', 'Columbus, OH'),
+    ('Salt Lake City, UT', 'Boise, ID', 'Seattle, WA'),
+    ('Philadelphia, PA', 'Baltimore, MD', 'Richmond, VA'),
+    ('Las Vegas, NV', 'Los Angeles, CA', 'San Francisco, CA'),
+    ('Omaha, NE', 'Denver, CO', 'Salt Lake City, UT'),
+    ('Charlotte, NC', 'Richmond, VA', 'Pittsburgh, PA'),
+]
+
+
+NO_HITS = {'hits': [], 'locale': 'default'}
+
+
+def route_key(points):
+    """Recording key for /route point params; rounded to ~10 m so re-geocoded waypoints still match"""
+    rounded = []
+    for point in points:
+        lat, lng = point.split(',')
+        rounded.append(f'{float(lat):.4f},{float(lng):.4f}')
+    return '|'.join(rounded)
+
+
+def load_recordings(path=RECORDINGS):
+    with open(path) as recordings:
+        return json.load(recordings)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Keep-alive, like the real API, so the pooled session reuses connections
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out as separate writes; with Nagle on, the body would wait for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        endpoint = url.path.rstrip('/').rsplit('/', 1)[-1]
+        params = parse_qs(url.query)
+        fake = self.server.fake
+
+        if endpoint not in ('geocoding', 'route'):
+            return self._send(404, {'message': f'Unknown endpoint {url.path}'})
+
+        fake.wait(endpoint)
+        failure = fake.failure()
+        fake.count(endpoint, failure)
+        if failure == 'drop':
+            # The client sees the connection close with no response
+            self.close_connection = True
+            return
+        if failure == 'status':
+            return self._send(503, {'message': 'Service temporarily unavailable'})
+
+        if endpoint == 'geocoding':
+            payload = fake.recordings['geocoding'].get(normalize_location(params.get('q', [''])[0]))
+            if payload is None:
+                fake.count('misses')
+                payload = NO_HITS
+            return self._send(200, payload)
+
+        payload = fake.recordings['route'].get(route_key(params.get('point', [])))
+        if payload is None:
+            fake.count('misses')
+            return self._send(400, {'message': 'Cannot find a recorded route between these points'})
+        return self._send(200, payload)
+
+    def _send(self, status_code, payload):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # One access line per request would drown out benchmark output
+        pass
+
+
+class FakeGraphHopper:
+    """Replays recorded GraphHopper responses on 127.0.0.1 with injected latency and failures"""
+
+    def __init__(self, recordings=None, geocode_latency=0.0, route_latency=0.0, jitter=0.0,
+                 failure_rate=0.0, failure_mode='status', seed=None, port=0):
+        recordings = load_recordings() if recordings is None else recordings
+        if not isinstance(recordings, dict):
+            recordings = load_recordings(recordings)
+        # Encoded once up front, so a replay costs no more than sending the bytes
+        self.recordings = {
+            endpoint: {key: json.dumps(payload).encode() for key, payload in recordings.get(endpoint, {}).items()}
+            for endpoint in ('geocoding', 'route')
+        }
+        self.lanes = [tuple(lane) for lane in recordings.get('lanes', [])]
+        self.latency = {'geocoding': geocode_latency, 'route': route_latency}
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.failure_mode = failure_mode
+        self.counters = {'geocoding': 0, 'route': 0, 'failures': 0, 'misses': 0}
+        self.port = port
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/api/1'
+
+    def start(self):
+        self._server = ThreadingHTTPServer(('127.0.0.1', self.port), _Handler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-graphhopper', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def wait(self, endpoint):
+        with self._lock:
+            delay = self.latency[endpoint] + self._random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def failure(self):
+        """None, or how this request should fail"""
+        with self._lock:
+            if self.failure_rate and self._random.random() < self.failure_rate:
+                return self.failure_mode
+        return None
+
+    def count(self, name, failure=None):
+        with self._lock:
+            self.counters[name] += 1
+            if failure:
+                self.counters['failures'] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters)
+
+
+def record_lanes(lanes=LANES, base_url=None, api_key=None):
+    """
+    Recordings for lanes: fetched from the GraphHopper-compatible server at base_url,
+    or, without one, built from the offline gazetteer and the local road graph
+    """
+    recordings = {
+        'source': base_url or 'offline gazetteer and local road graph',
+        'lanes': [list(lane) for lane in lanes],
+        'geocoding': {},
+        'route': {},
+    }
+    fetch = _upstream_fetcher(base_url, api_key) if base_url else _offline_fetcher()
+
+    for lane in lanes:
+        hits = []
+        for location in lane:
+            key = normalize_location(location)
+            if key not in recordings['geocoding']:
+                recordings['geocoding'][key] = fetch('geocoding', location)
+            hits.extend(recordings['geocoding'][key]['hits'][:1])
+        if len(hits) != len(lane):
+            logger.warning(f"Skipping lane {lane}: not every location geocodes")
+            continue
+
+        points = [f"{hit['point']['lat']},{hit['point']['lng']}" for hit in hits]
+        try:
+            recordings['route'][route_key(points)] = fetch('route', points)
+        except Exception as e:
+            logger.warning(f"Skipping lane {lane}: {e}")
+    return recordings
+
+
+def _upstream_fetcher(base_url, api_key):
+    from .services import RouteCalculationService
+
+    service = RouteCalculationService()
+    service.base_url = base_url.rstrip('/')
+    service.api_key = api_key or service.api_key
+
+    def fetch(endpoint, query):
+        if endpoint == 'geocoding':
+            params = {'q': query, 'key': service.api_key, 'limit': 1, 'locale': 'en'}
+        else:
+            params = service._route_params(query)
+        return service._get(endpoint, params, timeout=30).json()
+
+    return fetch
+
+
+def _offline_fetcher():
+    from .gazetteer import get_gazetteer
+    from .geo import decode_polyline, encode_polyline
+    from .graph import local_route
+
+    gazetteer = get_gazetteer()
+
+    def fetch(endpoint, query):
+        if endpoint == 'geocoding':
+            place = gazetteer.lookup(query)
+            if place is None:
+                return NO_HITS
+            return {
+                'hits': [{'point': {'lat': place['lat'], 'lng': place['lng']}, 'name': place['name'], 'country': 'US'}],
+                'locale': 'default',
+            }
+
+        waypoints = [dict(zip(('lat', 'lng'), map(float, point.split(',')))) for point in query]
+        path = local_route(waypoints)
+        coords = decode_polyline(path['points'])
+        lats, lngs = [lat for lat, _ in coords], [lng for _, lng in coords]
+        # Shaped like a real /route answer, including the fields the app ignores
+        return {
+            'hints': {'visited_nodes.sum': len(coords), 'visited_nodes.average': len(coords)},
+            'info': {'copyrights': ['GraphHopper', 'OpenStreetMap contributors'], 'took': 5},
+            'paths': [{
+                'distance': round(path['distance_meters'], 3),
+                'weight': round(path['time_seconds'], 6),
+                'time': int(path['time_seconds'] * 1000),
+                'transfers': 0,
+                'points_encoded': True,
+                'bbox': [min(lngs), min(lats), max(lngs), max(lats)],
+                'points': path['points'],
+                'instructions': path['instructions'],
+                'legs': [],
+                'details': {},
+                'ascend': 0.0,
+                'descend': 0.0,
+                'snapped_waypoints': encode_polyline([[point['lat'], point['lng']] for point in waypoints]),
+            }],
+        }
+
+    return fetch
+
@@ -0,0 +1,204 @@
+# routes/gazetteer.py
+"""
+Offline gazetteer of US places, used when GraphHopper can't geocode.
+
+Coordinates and populations live in flat NumPy arrays. Three indexes sit on top:
+an exact-match dict of normalized "city, st" keys, a sorted key list for prefix
+matches, and trigram posting lists for fuzzy matches. Two formats load:
+
+- the bundled TSV (name, state, lat, lng, population; GeoNames places >= 500 people)
+- the Census Bureau place gazetteer (USPS, GEOID, ..., NAME, ..., INTPTLAT, INTPTLONG)
+"""
+import bisect
+import csv
+import gzip
+import logging
+import re
+import threading
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .cache import normalize_location
+
+logger = logging.getLogger(__name__)
+
+# Census NAME values carry the legal/statistical area type: "Atlanta city", "Aspen Hill CDP"
+CENSUS_SUFFIX = re.compile(
+    r'\s+(city and borough|consolidated government \(balance\)|metropolitan government \(balance\)|'
+    r'unified government \(balance\)|city|town|township|village|borough|CDP|municipality|comunidad|'
+    r'zona urbana|urbana)$'
+)
+WORD_ABBREVIATIONS = {'saint': 'st', 'sainte': 'ste', 'fort': 'ft', 'mount': 'mt'}
+# Fuzzy matches below this trigram similarity are treated as unknown places
+MIN_SIMILARITY = 0.45
+
+
+def city_key(name):
+    """Normalized place name: lowercased, punctuation dropped, common words shortened"""
+    words = name.lower().replace('.', '').replace('-', ' ').split()
+    return ' '.join(WORD_ABBREVIATIONS.get(word, word) for word in words)
+
+
+def place_key(text):
+    """Normalized "city, st" lookup key"""
+    # A lone "Washington" or "New York" is a place name, not a state
+    if ',' not in text:
+        return city_key(text)
+
+    parts = normalize_location(text).split(', ')
+    parts[0] = city_key(parts[0])
+    return ', '.join(parts)
+
+
+def _trigrams(text):
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _read_rows(path):
+    """Yield (name, state, lat, lng, population) from either supported format"""
+    path = Path(path)
+    opener = gzip.open if path.suffix == '.gz' else open
+    with opener(path, 'rt', encoding='utf-8', newline='') as handle:
+        lines = (line for line in handle if not line.startswith('#'))
+        reader = csv.reader(lines, delimiter='\t')
+        header = [column.strip() for column in next(reader)]
+
+        if 'USPS' in header:
+            usps, name, lat, lng = (header.index(column) for column in ('USPS', 'NAME', 'INTPTLAT', 'INTPTLONG'))
+            for row in reader:
+                yield CENSUS_SUFFIX.sub('', row[name]), row[usps], float(row[lat]), float(row[lng]), 0
+        else:
+            for name, state, lat, lng, population in reader:
+                yield name, state, float(lat), float(lng), int(population or 0)
+
+
+class Gazetteer:
+    """In-memory place index; lookups cost microseconds and never touch the network"""
+
+    def __init__(self, rows):
+        names, states, lat, lng, population = [], [], [], [], []
+        for name, state, place_lat, place_lng, place_population in rows:
+            names.append(name)
+            states.append(state.upper())
+            lat.append(place_lat)
+            lng.append(place_lng)
+            population.append(place_population)
+
+        self.names = names
+        self.state_codes = sorted(set(states))
+        state_index = {state: i for i, state in enumerate(self.state_codes)}
+        self.state = np.fromiter((state_index[state] for state in states), np.uint8, len(states))
+        self.lat = np.asarray(lat, dtype=np.float32)
+        self.lng = np.asarray(lng, dtype=np.float32)
+        self.population = np.asarray(population, dtype=np.int32)
+
+        # Visit places most-populous first so the first key claim wins ties ("Portland" -> OR)
+        by_population = np.argsort(-self.population, kind='stable').tolist()
+        self.exact = {}
+        self.city_only = {}
+        postings = defaultdict(list)
+        city_keys = [''] * len(names)
+        for i in by_population:
+            city = city_key(names[i])
+            city_keys[i] = city
+            self.exact.setdefault(f'{city}, {states[i].lower()}', i)
+            self.city_only.setdefault(city, i)
+            for gram in _trigrams(city):
+                postings[gram].append(i)
+
+        self.trigrams = {gram: np.asarray(rows, dtype=np.int32) for gram, rows in postings.items()}
+        self.trigram_counts = np.fromiter((len(_trigrams(key)) for key in city_keys), np.int16, len(names))
+        order = sorted(range(len(names)), key=city_keys.__getitem__)
+        self.sorted_keys = [city_keys[i] for i in order]
+        self.sorted_rows = np.asarray(order, dtype=np.int32)
+
+    @classmethod
+    def load(cls, path):
+        return cls(_read_rows(path))
+
+    def __len__(self):
+        return len(self.names)
+
+    def lookup(self, location_string):
+        """Coordinates for a "City, ST" string as {'lat', 'lng', 'name'}, or None if unknown"""
+        key = place_key(location_string)
+        if not key:
+            return None
+
+        row = self.exact.get(key)
+        if row is None:
+            city, _, state = key.rpartition(', ')
+            if not city:
+                city, state = state, ''
+            state_id = self.state_codes.index(state.upper()) if state.upper() in self.state_codes else None
+            if state and state_id is None:
+                # Trailing part isn't a state we know, so treat the whole string as the place name
+                city, state_id = key.replace(',', ''), None
+
+            row = self.city_only.get(city) if state_id is None else None
+            if row is None:
+                row = self._prefix_match(city, state_id)
+            if row is None:
+                row = self._fuzzy_match(city, state_id)
+            if row is None:
+                return None
+
+        return {
+            'lat': round(float(self.lat[row]), 5),
+            'lng': round(float(self.lng[row]), 5),
+            'name': f'{self.names[row]}, {self.state_codes[self.state[row]]}',
+        }
+
+    def _best(self, rows, state_id):
+        if state_id is not None:
+            rows = rows[self.state[rows] == state_id]
+        if not len(rows):
+            return None
+        return int(rows[np.argmax(self.population[rows])])
+
+    def _prefix_match(self, city, state_id):
+        """Most populous place whose name starts with the query ("new york" -> New York City)"""
+        start = bisect.bisect_left(self.sorted_keys, city)
+        end = bisect.bisect_left(self.sorted_keys, city + '\uffff', start)
+        if start == end:
+            return None
+        return self._best(self.sorted_rows[start:end], state_id)
+
+    def _fuzzy_match(self, city, state_id):
+        """Best trigram (Jaccard) match, for typos such as Charlote or Jacksonvile"""
+        grams = _trigrams(city)
+        lists = [self.trigrams[gram] for gram in grams if gram in self.trigrams]
+        if not lists:
+            return None
+
+        candidates, shared = np.unique(np.concatenate(lists), return_counts=True)
+        if state_id is not None:
+            in_state = self.state[candidates] == state_id
+            candidates, shared = candidates[in_state], shared[in_state]
+            if not len(candidates):
+                return None
+
+        similarity = shared / (len(grams) + self.trigram_counts[candidates] - shared)
+        best = similarity.max()
+        if best < MIN_SIMILARITY:
+            return None
+        return self._best(candidates[similarity >= best - 1e-9], None)
+
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer():
+    """The configured gazetteer, loaded once per process"""
+    global _gazetteer
+    with _gazetteer_lock:
+        if _gazetteer is None:
+            path = getattr(settings, 'GAZETTEER_PATH', Path(__file__).resolve().parent / 'data' / 'us_places.tsv.gz')
+            _gazetteer = Gazetteer.load(path)
+            logger.info(f"Loaded gazetteer {path}: {len(_gazetteer)} places")
+        return _gazetteer
@@ -0,0 +1,142 @@
+# routes/geo.py
+import numpy as np
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+EARTH_RADIUS_M = 6371008.8
+
+
+def geohash_encode(lat, lng, precision=6):
+    """Encode a coordinate as a geohash string of the given length"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+
+    while len(chars) < precision:
+        # Bits alternate between longitude and latitude, starting with longitude
+        value, bounds = (lng, lng_range) if even else (lat, lat_range)
+        mid = (bounds[0] + bounds[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            bounds[0] = mid
+        else:
+            bits <<= 1
+            bounds[1] = mid
+        even = not even
+
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+
+    return ''.join(chars)
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """Great-circle distance in meters; accepts scalars or broadcastable arrays"""
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(value, dtype=np.float64)) for value in (lat1, lng1, lat2, lng2))
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(h))
+
+
+def decode_polyline(encoded, precision=5, with_elevation=False):
+    """Decode a Google/GraphHopper encoded polyline into an (n, 2) lat/lng array"""
+    dimensions = 3 if with_elevation else 2
+    chunks = np.frombuffer(encoded.encode('ascii'), dtype=np.uint8).astype(np.int64) - 63
+    if not len(chunks):
+        return np.empty((0, 2))
+
+    # Each value is a little-endian run of 5-bit groups; a group below 0x20 ends the run
+    ends = np.flatnonzero(chunks < 0x20)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    value_ids = np.repeat(np.arange(len(ends)), ends - starts + 1)
+    shifts = 5 * (np.arange(len(chunks)) - starts[value_ids])
+    values = np.bincount(value_ids, weights=(chunks & 0x1f) << shifts).astype(np.int64)
+
+    deltas = np.where(values & 1, ~(values >> 1), values >> 1)
+    coords = np.cumsum(deltas.reshape(-1, dimensions), axis=0) / 10 ** precision
+    return coords[:, :2]
+
+
+def encode_polyline(points, precision=5, previous=None):
+    """
+    Encode an (n, 2) lat/lng array as a Google/GraphHopper polyline string. previous is
+    the point encoded just before these, for building one polyline a chunk at a time
+    """
+    values = np.round(np.asarray(points, dtype=np.float64).reshape(-1, 2) * 10 ** precision).astype(np.int64)
+    if not len(values):
+        return ''
+
+    start = 0 if previous is None else np.round(np.asarray(previous, dtype=np.float64) * 10 ** precision).astype(np.int64)
+    deltas = np.diff(values, axis=0, prepend=np.broadcast_to(start, (1, 2))).ravel()
+    zigzag = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+
+    # Each value becomes a little-endian run of 5-bit groups; all but the last carry 0x20.
+    # Lay the groups out as an (n, max groups) byte grid and read back the used cells row by row
+    groups = np.ones(len(zigzag), dtype=np.int8)
+    remaining = zigzag >> 5
+    while remaining.any():
+        groups += remaining > 0
+        remaining >>= 5
+    grid = np.empty((len(zigzag), int(groups.max())), dtype=np.uint8)
+    for k in range(grid.shape[1]):
+        grid[:, k] = ((zigzag >> (5 * k)) & 0x1f) | np.where(groups > k + 1, 0x20, 0)
+    used = np.arange(grid.shape[1]) < groups[:, None]
+    return (grid[used] + 63).tobytes().decode('ascii')
+
+
+def route_points(points):
+    """Coordinates of a GraphHopper path as an (n, 2) float array of lat/lng"""
+    if isinstance(points, str):
+        return decode_polyline(points)
+    if isinstance(points, dict) and points.get('coordinates'):
+        # GeoJSON LineString from points_encoded=false is ordered lng, lat[, elevation]
+        return np.asarray(points['coordinates'], dtype=np.float64)[:, [1, 0]]
+    return np.empty((0, 2))
+
+
+def zoom_tolerance_m(zoom, pixels=0.5):
+    """Ground distance of `pixels` web-mercator pixels at the equator for a map zoom level"""
+    return 2 * np.pi * EARTH_RADIUS_M / 256 / 2 ** zoom * pixels
+
+
+def simplify_polyline(points, tolerance_m):
+    """
+    Douglas-Peucker simplification of an (n, 2) lat/lng array: drop every vertex that
+    lies within tolerance_m of the line kept around it. Endpoints always survive
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(points) < 3 or tolerance_m <= 0:
+        return points
+
+    # Local equirectangular plane in meters; exact enough for pixel-scale tolerances
+    meters_per_degree = EARTH_RADIUS_M * np.pi / 180
+    xy = points * [meters_per_degree, meters_per_degree * np.cos(np.radians(points[:, 0].mean()))]
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+
+    ranges = [(0, len(points) - 1)]
+    while ranges:
+        first, last = ranges.pop()
+        if last - first < 2:
+            continue
+
+        start, direction = xy[first], xy[last] - xy[first]
+        offsets = xy[first + 1:last] - start
+        length = np.hypot(*direction)
+        if length > 0:
+            distance = np.abs(direction[0] * offsets[:, 1] - direction[1] * offsets[:, 0]) / length
+        else:
+            distance = np.hypot(offsets[:, 0], offsets[:, 1])
+
+        farthest = int(distance.argmax())
+        if distance[farthest] > tolerance_m:
+            split = first + 1 + farthest
+            keep[split] = True
+            ranges.append((first, split))
+            ranges.append((split, last))
+
+    return points[keep]
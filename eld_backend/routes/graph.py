@@ -0,0 +1,407 @@
+# routes/graph.py
+"""
+Offline truck routing over a compact road graph.
+
+A compiled graph is a directory of flat .npy arrays plus meta.json:
+
+    lat, lng                node coordinates (float32)
+    offsets, targets        forward CSR adjacency (edge e runs u -> targets[e]
+                            for offsets[u] <= e < offsets[u + 1])
+    length_m, time_s        per-edge length and truck travel time (float32)
+    name_id                 per-edge index into meta['names']
+    rev_offsets, rev_edges  reverse CSR: forward edge ids grouped by target node
+    sources                 per-edge source node, for walking reverse edges
+    cell_keys, cell_nodes   nodes sorted by grid cell, for snapping coordinates
+
+Arrays are opened with mmap_mode='r', so every worker on the host shares one
+copy of the graph through the page cache.
+"""
+import csv
+import heapq
+import json
+import logging
+import math
+import threading
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .geo import EARTH_RADIUS_M, encode_polyline, haversine_m
+
+logger = logging.getLogger(__name__)
+
+GRAPH_FORMAT_VERSION = 1
+# Snapping grid cell size in degrees (~11 km north-south)
+GRID_CELL_DEG = 0.1
+# Keeps grid keys unique: longitude cells never reach this many columns
+GRID_COLUMNS = 4000
+
+# Truck speed caps per OSM highway class (km/h). Posted limits above these
+# are clamped, so the weighting reflects what a loaded tractor-trailer drives.
+TRUCK_SPEED_KPH = {
+    'motorway': 100,
+    'trunk': 88,
+    'primary': 72,
+    'secondary': 64,
+    'tertiary': 56,
+    'unclassified': 48,
+    'residential': 40,
+    'service': 24,
+}
+DEFAULT_TRUCK_SPEED_KPH = 48
+# Edges tagged with any of these hgv values are left out of the truck graph
+TRUCK_FORBIDDEN = {'no', 'destination', 'delivery'}
+
+ARRAYS = (
+    'lat', 'lng', 'offsets', 'targets', 'length_m', 'time_s', 'name_id',
+    'rev_offsets', 'rev_edges', 'sources', 'cell_keys', 'cell_nodes',
+)
+
+
+class NoRouteError(Exception):
+    """Raised when the local graph cannot connect the requested points"""
+
+
+def _haversine_m(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(h))
+
+
+def _cell_key(lat, lng):
+    return np.floor((np.asarray(lat, dtype=np.float64) + 90) / GRID_CELL_DEG).astype(np.int64) * GRID_COLUMNS + \
+        np.floor((np.asarray(lng, dtype=np.float64) + 180) / GRID_CELL_DEG).astype(np.int64)
+
+
+def truck_speed_kph(highway, maxspeed_kph=None):
+    """Travel speed for a truck on a road of this class and posted limit"""
+    road_class = (highway or '').replace('_link', '')
+    cap = TRUCK_SPEED_KPH.get(road_class, DEFAULT_TRUCK_SPEED_KPH)
+    if maxspeed_kph:
+        return min(float(maxspeed_kph), cap)
+    return cap
+
+
+def build_road_graph(nodes, edges, out_dir):
+    """
+    Compile a road network into the memory-mappable graph format.
+
+    nodes: iterable of (node_id, lat, lng)
+    edges: iterable of dicts with from_node, to_node, length_m, highway and
+           optionally maxspeed_kph, name, oneway and hgv
+    Returns the graph's meta dict.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    node_ids, lat, lng = [], [], []
+    for node_id, node_lat, node_lng in nodes:
+        node_ids.append(node_id)
+        lat.append(float(node_lat))
+        lng.append(float(node_lng))
+    index = {node_id: i for i, node_id in enumerate(node_ids)}
+
+    names = ['']
+    name_index = {'': 0}
+    sources, targets, length_m, time_s, name_id = [], [], [], [], []
+    skipped = 0
+    for edge in edges:
+        if (edge.get('hgv') or '').strip().lower() in TRUCK_FORBIDDEN:
+            skipped += 1
+            continue
+
+        u, v = index[edge['from_node']], index[edge['to_node']]
+        length = float(edge['length_m'])
+        seconds = length / (truck_speed_kph(edge['highway'], edge.get('maxspeed_kph')) / 3.6)
+        name = edge.get('name') or ''
+        if name not in name_index:
+            name_index[name] = len(names)
+            names.append(name)
+
+        directions = [(u, v)] if str(edge.get('oneway', '0')).lower() in ('1', 'yes', 'true') else [(u, v), (v, u)]
+        for a, b in directions:
+            sources.append(a)
+            targets.append(b)
+            length_m.append(length)
+            time_s.append(seconds)
+            name_id.append(name_index[name])
+
+    node_count = len(node_ids)
+    sources = np.asarray(sources, dtype=np.int32)
+    targets = np.asarray(targets, dtype=np.int32)
+
+    # Forward CSR: sort edges by source
+    order = np.argsort(sources, kind='stable')
+    sources, targets = sources[order], targets[order]
+    length_m = np.asarray(length_m, dtype=np.float32)[order]
+    time_s = np.asarray(time_s, dtype=np.float32)[order]
+    name_id = np.asarray(name_id, dtype=np.int32)[order]
+    offsets = np.zeros(node_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=node_count), out=offsets[1:])
+
+    # Reverse CSR holds forward edge ids grouped by target
+    rev_edges = np.argsort(targets, kind='stable').astype(np.int32)
+    rev_offsets = np.zeros(node_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(targets, minlength=node_count), out=rev_offsets[1:])
+
+    lat = np.asarray(lat, dtype=np.float32)
+    lng = np.asarray(lng, dtype=np.float32)
+    keys = _cell_key(lat, lng)
+    # Only nodes a truck can drive to or from are snapping candidates
+    connected = np.flatnonzero((np.diff(offsets) > 0) | (np.diff(rev_offsets) > 0))
+    cell_nodes = connected[np.argsort(keys[connected], kind='stable')].astype(np.int32)
+
+    arrays = {
+        'lat': lat, 'lng': lng, 'offsets': offsets, 'targets': targets,
+        'length_m': length_m, 'time_s': time_s, 'name_id': name_id,
+        'rev_offsets': rev_offsets, 'rev_edges': rev_edges, 'sources': sources,
+        'cell_keys': keys[cell_nodes], 'cell_nodes': cell_nodes,
+    }
+    for name, array in arrays.items():
+        np.save(out_dir / f'{name}.npy', array)
+
+    # Fastest possible travel, for an admissible A* heuristic
+    speeds = length_m / np.maximum(time_s, 1e-6)
+    meta = {
+        'version': GRAPH_FORMAT_VERSION,
+        'profile': 'truck',
+        'nodes': node_count,
+        'edges': int(len(targets)),
+        'skipped_edges': skipped,
+        'max_speed_mps': float(speeds.max()) if len(speeds) else 1.0,
+        'names': names,
+    }
+    (out_dir / 'meta.json').write_text(json.dumps(meta))
+    return meta
+
+
+def build_road_graph_from_csv(nodes_csv, edges_csv, out_dir):
+    """Compile nodes.csv (node_id,lat,lng) and edges.csv into out_dir"""
+    with open(nodes_csv, newline='') as nodes_file, open(edges_csv, newline='') as edges_file:
+        nodes = ((row['node_id'], row['lat'], row['lng']) for row in csv.DictReader(nodes_file))
+        return build_road_graph(nodes, csv.DictReader(edges_file), out_dir)
+
+
+class RoadGraph:
+    """A compiled road graph, searched with bidirectional A* on truck travel time"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.meta = json.loads((self.path / 'meta.json').read_text())
+        if self.meta.get('version') != GRAPH_FORMAT_VERSION:
+            raise ValueError(f"Unsupported road graph version {self.meta.get('version')} in {self.path}")
+
+        for name in ARRAYS:
+            # Plain ndarray views over the mapping: same pages, without np.memmap's per-index overhead
+            setattr(self, name, np.load(self.path / f'{name}.npy', mmap_mode='r').view(np.ndarray))
+        self.names = self.meta['names']
+        # Slightly above the true top speed so float32 rounding never makes the heuristic overestimate
+        self.max_speed_mps = self.meta['max_speed_mps'] * 1.001
+
+    @property
+    def node_count(self):
+        return self.meta['nodes']
+
+    def nearest_node(self, lat, lng, max_distance_m):
+        """Closest graph node to a coordinate, searching outward ring by ring through the grid"""
+        row = int(math.floor((lat + 90) / GRID_CELL_DEG))
+        col = int(math.floor((lng + 180) / GRID_CELL_DEG))
+        # Rings needed to cover max_distance_m, on the narrow (longitude) side of a cell
+        cell_m = GRID_CELL_DEG * math.pi / 180 * EARTH_RADIUS_M * max(math.cos(math.radians(lat)), 0.01)
+        max_ring = int(max_distance_m // cell_m) + 1
+
+        best, best_distance = None, math.inf
+        for ring in range(max_ring + 1):
+            # Only the ring's perimeter: interior cells were searched already
+            rows = np.arange(row - ring, row + ring + 1)
+            cols = np.arange(col - ring, col + ring + 1)
+            if ring:
+                cells = np.concatenate((
+                    rows[[0, -1]][:, None] * GRID_COLUMNS + cols,
+                    rows[1:-1][:, None] * GRID_COLUMNS + cols[[0, -1]],
+                ), axis=None)
+            else:
+                cells = np.array([row * GRID_COLUMNS + col])
+
+            starts = np.searchsorted(self.cell_keys, cells)
+            ends = np.searchsorted(self.cell_keys, cells + 1)
+            if (ends > starts).any():
+                candidates = np.concatenate([self.cell_nodes[a:b] for a, b in zip(starts, ends) if b > a])
+                distances = haversine_m(lat, lng, self.lat[candidates], self.lng[candidates])
+                nearest = int(distances.argmin())
+                if distances[nearest] < best_distance:
+                    best, best_distance = int(candidates[nearest]), float(distances[nearest])
+
+            # Anything in the next ring is at least ring * cell_m away
+            if best is not None and best_distance <= ring * cell_m:
+                break
+
+        if best is None or best_distance > max_distance_m:
+            raise NoRouteError(f"No road within {max_distance_m / 1000:.0f} km of ({lat:.4f}, {lng:.4f})")
+        return best, best_distance
+
+    def shortest_path(self, source, target, heuristic=True):
+        """
+        Fastest truck path between two nodes as (seconds, [edge ids], settled node count).
+        Bidirectional A* with the averaged potential, so both searches share one
+        consistent reduced-cost graph and can stop as soon as their frontiers meet.
+        """
+        if source == target:
+            return 0.0, [], 0
+
+        lat, lng, speed = self.lat, self.lng, self.max_speed_mps
+        s_lat, s_lng = float(lat[source]), float(lng[source])
+        t_lat, t_lng = float(lat[target]), float(lng[target])
+        potentials = {}
+
+        def potential(node):
+            value = potentials.get(node)
+            if value is None:
+                if heuristic:
+                    n_lat, n_lng = float(lat[node]), float(lng[node])
+                    value = (_haversine_m(n_lat, n_lng, t_lat, t_lng) - _haversine_m(n_lat, n_lng, s_lat, s_lng)) / (2 * speed)
+                else:
+                    value = 0.0
+                potentials[node] = value
+            return value
+
+        offsets, targets, time_s = self.offsets, self.targets, self.time_s
+        rev_offsets, rev_edges, sources = self.rev_offsets, self.rev_edges, self.sources
+
+        dist = ({source: 0.0}, {target: 0.0})
+        parent = ({source: -1}, {target: -1})
+        settled = (set(), set())
+        heaps = ([(potential(source), source)], [(-potential(target), target)])
+        best, meet = math.inf, None
+
+        while heaps[0] and heaps[1]:
+            if heaps[0][0][0] + heaps[1][0][0] >= best:
+                break
+
+            side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+            _, node = heapq.heappop(heaps[side])
+            if node in settled[side]:
+                continue
+            settled[side].add(node)
+
+            node_dist = dist[side][node]
+            other_dist = dist[1 - side]
+            if side == 0:
+                start, end = int(offsets[node]), int(offsets[node + 1])
+                edge_ids = range(start, end)
+                neighbours = targets[start:end].tolist()
+                costs = time_s[start:end].tolist()
+            else:
+                start, end = int(rev_offsets[node]), int(rev_offsets[node + 1])
+                edge_ids = rev_edges[start:end].tolist()
+                neighbours = sources[edge_ids].tolist()
+                costs = time_s[edge_ids].tolist()
+
+            sign = 1 if side == 0 else -1
+            for edge, neighbour, cost in zip(edge_ids, neighbours, costs):
+                candidate = node_dist + cost
+                if candidate < dist[side].get(neighbour, math.inf):
+                    dist[side][neighbour] = candidate
+                    parent[side][neighbour] = edge
+                    heapq.heappush(heaps[side], (candidate + sign * potential(neighbour), neighbour))
+                    if neighbour in other_dist and candidate + other_dist[neighbour] < best:
+                        best, meet = candidate + other_dist[neighbour], neighbour
+
+        if meet is None:
+            raise NoRouteError(f"Nodes {source} and {target} are not connected")
+
+        forward = []
+        node = meet
+        while parent[0][node] != -1:
+            edge = parent[0][node]
+            forward.append(edge)
+            node = int(sources[edge])
+        forward.reverse()
+
+        node = meet
+        while parent[1][node] != -1:
+            edge = parent[1][node]
+            forward.append(edge)
+            node = int(targets[edge])
+
+        return best, forward, len(settled[0]) + len(settled[1])
+
+    def route(self, waypoints, max_snap_m=50000):
+        """
+        Route through [{'lat', 'lng'}, ...] and return the same fields as a parsed
+        GraphHopper /route path: distance_meters, time_seconds, instructions, points
+        """
+        nodes = [self.nearest_node(point['lat'], point['lng'], max_snap_m)[0] for point in waypoints]
+
+        instructions = []
+        coords = [(float(self.lat[nodes[0]]), float(self.lng[nodes[0]]))]
+        total_m = total_s = 0.0
+        for leg, (source, target) in enumerate(zip(nodes, nodes[1:])):
+            _, edges, _ = self.shortest_path(source, target)
+            edges = np.asarray(edges, dtype=np.int64)
+
+            if len(edges):
+                lengths = self.length_m[edges].astype(np.float64)
+                seconds = self.time_s[edges].astype(np.float64)
+                name_ids = self.name_id[edges]
+                ends = self.targets[edges]
+                coords.extend(zip(self.lat[ends].tolist(), self.lng[ends].tolist()))
+
+                # One instruction per run of edges on the same named road
+                breaks = np.flatnonzero(np.diff(name_ids)) + 1
+                starts = np.concatenate(([0], breaks))
+                stops = np.concatenate((breaks, [len(edges)]))
+                first_point = len(coords) - 1 - len(edges)
+                for start, stop in zip(starts.tolist(), stops.tolist()):
+                    street = self.names[int(name_ids[start])]
+                    verb = 'Head out on' if not instructions else 'Continue onto'
+                    instructions.append({
+                        'text': f'{verb} {street}' if street else 'Continue',
+                        'street_name': street,
+                        'distance': round(float(lengths[start:stop].sum()), 1),
+                        'time': int(seconds[start:stop].sum() * 1000),
+                        'interval': [first_point + start, first_point + stop],
+                        'sign': 0,
+                    })
+                total_m += float(lengths.sum())
+                total_s += float(seconds.sum())
+
+            last_point = len(coords) - 1
+            is_last_leg = leg == len(nodes) - 2
+            instructions.append({
+                'text': 'Arrive at destination' if is_last_leg else f'Waypoint {leg + 1}',
+                'street_name': '',
+                'distance': 0,
+                'time': 0,
+                'interval': [last_point, last_point],
+                'sign': 4 if is_last_leg else 5,
+            })
+
+        return {
+            'distance_meters': total_m,
+            'time_seconds': total_s,
+            'instructions': instructions,
+            'points': encode_polyline(coords),
+        }
+
+
+_road_graph = None
+_road_graph_lock = threading.Lock()
+
+
+def get_road_graph():
+    """The configured road graph, memory-mapped once per process"""
+    global _road_graph
+    with _road_graph_lock:
+        if _road_graph is None:
+            path = getattr(settings, 'ROAD_GRAPH_PATH', Path(__file__).resolve().parent / 'data' / 'road_graph')
+            _road_graph = RoadGraph(path)
+            logger.info(f"Loaded road graph {path}: {_road_graph.node_count} nodes, {_road_graph.meta['edges']} edges")
+        return _road_graph
+
+
+def local_route(waypoints):
+    """Route geocoded waypoints on the local road graph"""
+    max_snap_m = getattr(settings, 'ROAD_GRAPH_MAX_SNAP_KM', 50) * 1000
+    return get_road_graph().route(waypoints, max_snap_m=max_snap_m)
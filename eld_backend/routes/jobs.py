@@ -0,0 +1,148 @@
+# routes/jobs.py
+"""
+Database-backed queue for plan jobs.
+
+POST /api/calculate-route/jobs/ stores the validated request as a PlanJob row and
+answers 202 at once; `python manage.py run_plan_worker` claims rows oldest first and
+runs the same pipeline as /api/calculate-route/. Web workers never wait on
+GraphHopper for queued plans, so an upstream slowdown grows the queue instead of
+tying up the web tier.
+
+A claim is one conditional UPDATE, so any number of worker processes can share the
+table. A claimed job holds a lease, which a heartbeat thread renews while the plan
+runs; if its worker dies the renewals stop, the lease runs out and the job is
+claimed again, up to PLAN_JOB_MAX_ATTEMPTS times. Delivery is therefore at
+least once: a worker that dies right after saving a route leaves that route behind
+when the job is re-run.
+"""
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import PlanJob, Route
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(payload, preview=False, tolerance_m=None, use_cache=True):
+    """Queue a validated calculate-route payload"""
+    return PlanJob.objects.create(payload=payload, preview=preview, tolerance_m=tolerance_m, use_cache=use_cache)
+
+
+def _claimable(now):
+    # Queued jobs, plus running jobs whose worker stopped renewing its lease
+    return Q(status=PlanJob.QUEUED) | Q(status=PlanJob.RUNNING, lease_expires_at__lt=now)
+
+
+def _lease():
+    return timedelta(seconds=getattr(settings, 'PLAN_JOB_LEASE_SECONDS', 300))
+
+
+def claim_next(worker):
+    """Claim the oldest runnable job for this worker, or None if the queue is empty"""
+    lease = _lease()
+    while True:
+        now = timezone.now()
+        job_id = PlanJob.objects.filter(_claimable(now)).order_by('created_at').values_list('id', flat=True).first()
+        if job_id is None:
+            return None
+        # Only one worker's UPDATE can still match; the others see 0 rows and try the next job
+        claimed = PlanJob.objects.filter(_claimable(now), pk=job_id).update(
+            status=PlanJob.RUNNING, worker=worker, attempts=F('attempts') + 1,
+            started_at=now, lease_expires_at=now + lease
+        )
+        if claimed:
+            return PlanJob.objects.get(pk=job_id)
+
+
+def renew(job):
+    """Extend a running job's lease by PLAN_JOB_LEASE_SECONDS; False once this worker no longer holds it"""
+    return bool(PlanJob.objects.filter(pk=job.pk, worker=job.worker, status=PlanJob.RUNNING).update(
+        lease_expires_at=timezone.now() + _lease()
+    ))
+
+
+@contextmanager
+def heartbeat(job):
+    """Renew the job's lease every third of PLAN_JOB_LEASE_SECONDS until the block exits"""
+    interval = _lease().total_seconds() / 3
+    done = threading.Event()
+
+    def beat():
+        try:
+            while not done.wait(interval):
+                if not renew(job):
+                    # Reclaimed after a stall: the other worker's result is the one recorded
+                    logger.warning(f"Plan job {job.id} lost its lease")
+                    return
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, name=f'plan-job-lease-{job.id}', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        done.set()
+        thread.join()
+
+
+def _finish(job, **fields):
+    fields.update(finished_at=timezone.now(), lease_expires_at=None)
+    # Only the current lease holder may record a result
+    PlanJob.objects.filter(pk=job.pk, worker=job.worker, status=PlanJob.RUNNING).update(**fields)
+
+
+def run_job(job):
+    """Plan a claimed job and record its result"""
+    # Deferred import: the views module imports this one
+    from .views import plan_trip
+
+    max_attempts = getattr(settings, 'PLAN_JOB_MAX_ATTEMPTS', 3)
+    if job.attempts > max_attempts:
+        logger.error(f"Plan job {job.id} abandoned after {max_attempts} attempts")
+        _finish(job, status=PlanJob.FAILED, error=f'Abandoned after {max_attempts} attempts')
+        return
+
+    try:
+        route = Route(**job.payload)
+        result, result_status = plan_trip(route, job.preview, job.tolerance_m, use_cache=job.use_cache)
+    except Exception as e:
+        logger.error(f"Plan job {job.id} failed: {str(e)}")
+        _finish(
+            job, status=PlanJob.FAILED, result_status=500,
+            result={'error': f'Route calculation failed: {str(e)}'}, error=str(e)
+        )
+        return
+
+    _finish(
+        job, status=PlanJob.SUCCEEDED if result_status < 400 else PlanJob.FAILED,
+        result=result, result_status=result_status, route=route if route.pk else None,
+        error=result.get('error', '')
+    )
+    logger.info(f"Plan job {job.id} finished with {result_status} after {job.attempts} attempt(s)")
+
+
+def run_next(worker):
+    """Claim and run one job; False when the queue was empty"""
+    job = claim_next(worker)
+    if job is None:
+        return False
+    with heartbeat(job):
+        run_job(job)
+    return True
+
+
+def purge_finished(older_than=None):
+    """Delete finished jobs past PLAN_JOB_RETENTION_HOURS; returns how many were removed"""
+    older_than = older_than or timedelta(hours=getattr(settings, 'PLAN_JOB_RETENTION_HOURS', 24))
+    deleted, _ = PlanJob.objects.filter(
+        status__in=(PlanJob.SUCCEEDED, PlanJob.FAILED), finished_at__lt=timezone.now() - older_than
+    ).delete()
+    return deleted
@@ -0,0 +1,261 @@
+# routes/loadtest.py
+"""
+Closed-loop load generator for a running server (`python manage.py load_test`).
+
+Each step keeps a fixed number of simulated dispatchers busy for a set time.
+Each dispatcher posts a plan, waits for the answer, then posts the next. Steps
+run at rising concurrency, so throughput climbs until the box saturates, then
+flattens while latency keeps growing. The plans are a weighted mix drawn from
+the lanes the GraphHopper stand-in has recorded:
+
+    short     recorded lanes with at most SHORT_LANE_HOURS of driving (single-day logs)
+    multi     longer recorded lanes (multi-day logs, more rows to write)
+    unknown   a current location nobody can geocode (falls back to the rough estimate)
+
+Each response is classified as a plan, a 'db_locked' error (a 5xx naming SQLite's
+"database is locked"), another server error, a client error, a timeout or a
+connection error. Each successful plan's Server-Timing 'db' stage is kept, which
+shows writers queueing for the database lock before the lock errors start.
+"""
+import math
+import random
+import threading
+import time
+from collections import Counter
+from xml.sax.saxutils import escape
+
+import requests
+
+from .cache import normalize_location
+from .fake_graphhopper import route_key
+
+KINDS = ('short', 'multi', 'unknown')
+DEFAULT_MIX = {'short': 5, 'multi': 4, 'unknown': 1}
+# Single-day plans: pickup and dropoff take an hour each, inside the 14-hour window
+SHORT_LANE_HOURS = 10
+ERROR_CLASSES = ('db_locked', 'server_error', 'client_error', 'timeout', 'connection')
+
+
+def lane_mix(recordings):
+    """{kind: [(current, pickup, dropoff), ...]} from a stand-in recordings document"""
+    lanes = {kind: [] for kind in KINDS}
+    geocodes = recordings['geocoding']
+    for lane in recordings['lanes']:
+        hits = [(geocodes.get(normalize_location(location)) or {}).get('hits') for location in lane]
+        if not all(hits):
+            continue
+        route = recordings['route'].get(route_key(f"{hit[0]['point']['lat']},{hit[0]['point']['lng']}" for hit in hits))
+        if route is None:
+            continue
+        hours = route['paths'][0]['time'] / 3.6e6
+        lanes['short' if hours <= SHORT_LANE_HOURS else 'multi'].append(tuple(lane))
+
+    # Only the current location is unknown, so the rest of the plan still exercises the gazetteer
+    known = lanes['short'] + lanes['multi']
+    lanes['unknown'] = [(f'Unmapped Yard {i}, ZZ', pickup, dropoff) for i, (_, pickup, dropoff) in enumerate(known)]
+    return lanes
+
+
+def _percentile(ordered, q):
+    if not ordered:
+        return None
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def _server_timing(header, stage):
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        if name == stage and params.startswith('dur='):
+            return float(params[4:])
+    return None
+
+
+class LoadGenerator:
+    """Runs fixed-concurrency steps of calculate-route plans against base_url"""
+
+    def __init__(self, base_url, lanes, mix=None, think_time=0.0, timeout=60, route_cache=False, seed=1):
+        self.url = f"{base_url.rstrip('/')}/api/calculate-route/"
+        self.lanes = {kind: lanes[kind] for kind, weight in (mix or DEFAULT_MIX).items() if weight and lanes.get(kind)}
+        self.weights = [(mix or DEFAULT_MIX)[kind] for kind in self.lanes]
+        self.think_time = think_time
+        self.timeout = timeout
+        # By default every plan goes upstream; with route_cache, repeated lanes reuse cached routes
+        self.headers = {} if route_cache else {'Cache-Control': 'no-cache'}
+        self.seed = seed
+
+    def run_step(self, concurrency, duration):
+        samples = []
+        lock = threading.Lock()
+        deadline = time.monotonic() + duration
+        started = time.monotonic()
+
+        def dispatcher(slot):
+            rng = random.Random(self.seed * 1000 + concurrency * 100 + slot)
+            session = requests.Session()
+            kinds = list(self.lanes)
+            while time.monotonic() < deadline:
+                kind = rng.choices(kinds, self.weights)[0]
+                sample = self._plan(session, kind, rng.choice(self.lanes[kind]), rng.randint(0, 60))
+                with lock:
+                    samples.append(sample)
+                if self.think_time:
+                    time.sleep(rng.expovariate(1 / self.think_time))
+            session.close()
+
+        threads = [threading.Thread(target=dispatcher, args=(slot,), daemon=True) for slot in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return summarize(concurrency, samples, time.monotonic() - started)
+
+    def _plan(self, session, kind, lane, cycle_hours):
+        payload = {
+            'current_location': lane[0],
+            'pickup_location': lane[1],
+            'dropoff_location': lane[2],
+            'current_cycle_hours': cycle_hours,
+        }
+        started = time.monotonic()
+        try:
+            response = session.post(self.url, json=payload, headers=self.headers, timeout=self.timeout)
+        except requests.Timeout:
+            return {'kind': kind, 'seconds': time.monotonic() - started, 'error': 'timeout'}
+        except requests.RequestException:
+            return {'kind': kind, 'seconds': time.monotonic() - started, 'error': 'connection'}
+
+        sample = {'kind': kind, 'seconds': time.monotonic() - started, 'error': None}
+        if response.status_code >= 500:
+            sample['error'] = 'db_locked' if b'database is locked' in response.content else 'server_error'
+        elif response.status_code >= 400:
+            sample['error'] = 'client_error'
+        else:
+            sample['db_ms'] = _server_timing(response.headers.get('Server-Timing', ''), 'db')
+            sample['engine'] = response.json().get('route_data', {}).get('engine')
+        return sample
+
+
+def summarize(concurrency, samples, elapsed):
+    """One step's throughput, latency percentiles, errors and database wait"""
+    planned = [sample for sample in samples if sample['error'] is None]
+    latencies = sorted(sample['seconds'] * 1000 for sample in planned)
+    db = sorted(sample['db_ms'] for sample in planned if sample.get('db_ms') is not None)
+    errors = Counter(sample['error'] for sample in samples if sample['error'])
+    # Known lanes that still came back on a fallback engine: the upstream pool or breaker gave up
+    degraded = sum(1 for sample in planned if sample['kind'] != 'unknown' and sample.get('engine') != 'graphhopper')
+    return {
+        'concurrency': concurrency,
+        'requests': len(samples),
+        'plans_per_s': round(len(planned) / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': _percentile(latencies, 0.50),
+        'p95_ms': _percentile(latencies, 0.95),
+        'p99_ms': _percentile(latencies, 0.99),
+        'error_rate': round(sum(errors.values()) / len(samples), 4) if samples else 0.0,
+        'errors': {name: errors.get(name, 0) for name in ERROR_CLASSES},
+        'db_locked_rate': round(errors.get('db_locked', 0) / len(samples), 4) if samples else 0.0,
+        'db_p95_ms': _percentile(db, 0.95),
+        'degraded': degraded,
+        'by_kind': {
+            kind: _percentile(sorted(s['seconds'] * 1000 for s in planned if s['kind'] == kind), 0.5)
+            for kind in KINDS
+        },
+    }
+
+
+def saturation(steps, min_gain=0.1, max_error_rate=0.01):
+    """The last step whose throughput still grew by min_gain with few errors, or None"""
+    best = None
+    for step in steps:
+        if step['error_rate'] > max_error_rate:
+            break
+        if best is None or step['plans_per_s'] >= best['plans_per_s'] * (1 + min_gain):
+            best = step
+    return best
+
+
+def text_chart(steps, width=40):
+    """Horizontal bars of throughput, p95 latency and error rate per concurrency step"""
+    lines = []
+    for title, metric, unit in (
+        ('plans/s', 'plans_per_s', ''),
+        ('p95 latency', 'p95_ms', ' ms'),
+        ('error rate', 'error_rate', ''),
+        ('database is locked', 'db_locked_rate', ''),
+        ('db stage p95', 'db_p95_ms', ' ms'),
+    ):
+        values = [step[metric] or 0 for step in steps]
+        top = max(values) or 1
+        lines.append(title)
+        for step, value in zip(steps, values):
+            shown = f'{value:.1%}' if metric.endswith('rate') else f'{value:.1f}{unit}'
+            lines.append(f"  {step['concurrency']:>4} | {'#' * round(width * value / top):<{width}} {shown}")
+    return '\n'.join(lines)
+
+
+# Panel layout for svg_chart, in pixels
+_WIDTH, _PANEL_HEIGHT, _LEFT, _TOP = 720, 220, 70, 40
+_COLORS = ('#1f77b4', '#ff7f0e', '#d62728', '#2ca02c', '#9467bd')
+
+
+def _nice_max(value):
+    """Round an axis maximum up to 1, 2 or 5 times a power of ten"""
+    if value <= 0:
+        return 1
+    magnitude = 10 ** math.floor(math.log10(value))
+    return next(step * magnitude for step in (1, 2, 5, 10) if step * magnitude >= value)
+
+
+def _panel(top, title, steps, series, fraction=False):
+    plot_width = _WIDTH - _LEFT - 30
+    plot_height = _PANEL_HEIGHT - 70
+    y_max = _nice_max(max((v or 0 for _, values in series for v in values), default=0))
+    xs = [_LEFT + (plot_width * i / max(len(steps) - 1, 1)) for i in range(len(steps))]
+
+    def y(value):
+        return top + 30 + plot_height * (1 - (value or 0) / y_max)
+
+    parts = [f'<text x="{_LEFT}" y="{top + 18}" font-weight="bold">{escape(title)}</text>']
+    for tick in range(5):
+        value = y_max * tick / 4
+        label = f'{value:.0%}' if fraction else f'{value:g}'
+        parts.append(f'<line x1="{_LEFT}" x2="{_LEFT + plot_width}" y1="{y(value):.1f}" y2="{y(value):.1f}" stroke="#ddd"/>')
+        parts.append(f'<text x="{_LEFT - 6}" y="{y(value) + 4:.1f}" text-anchor="end">{label}</text>')
+    for x, step in zip(xs, steps):
+        parts.append(f'<text x="{x:.1f}" y="{top + 30 + plot_height + 16}" text-anchor="middle">{step["concurrency"]}</text>')
+    for index, (label, values) in enumerate(series):
+        color = _COLORS[index % len(_COLORS)]
+        points = ' '.join(f'{x:.1f},{y(value):.1f}' for x, value in zip(xs, values))
+        parts.append(f'<polyline points="{points}" fill="none" stroke="{color}" stroke-width="2"/>')
+        parts += [f'<circle cx="{x:.1f}" cy="{y(value):.1f}" r="3" fill="{color}"/>' for x, value in zip(xs, values)]
+        legend_x = _LEFT + 200 + index * 110
+        parts.append(f'<rect x="{legend_x}" y="{top + 8}" width="12" height="12" fill="{color}"/>')
+        parts.append(f'<text x="{legend_x + 16}" y="{top + 18}">{escape(label)}</text>')
+    return parts
+
+
+def svg_chart(steps, title='calculate-route under rising concurrency'):
+    """A standalone SVG with latency, throughput and error panels against concurrency"""
+    panels = [
+        ('Latency (ms)', [(f'p{q}', [step[f'p{q}_ms'] for step in steps]) for q in (50, 95, 99)], False),
+        ('Throughput (plans/s)', [('plans/s', [step['plans_per_s'] for step in steps])], False),
+        ('Error rate', [
+            ('all errors', [step['error_rate'] for step in steps]),
+            ('database is locked', [step['db_locked_rate'] for step in steps]),
+        ], True),
+        ('Database stage p95 (ms)', [('db', [step['db_p95_ms'] for step in steps])], False),
+    ]
+    height = 40 + len(panels) * _PANEL_HEIGHT + 20
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{_WIDTH}" height="{height}" '
+        f'font-family="sans-serif" font-size="12">',
+        f'<rect width="{_WIDTH}" height="{height}" fill="white"/>',
+        f'<text x="{_WIDTH / 2}" y="24" text-anchor="middle" font-size="15">{escape(title)}</text>',
+    ]
+    for index, (panel_title, series, fraction) in enumerate(panels):
+        parts += _panel(40 + index * _PANEL_HEIGHT, panel_title, steps, series, fraction)
+    parts.append(
+        f'<text x="{_WIDTH / 2}" y="{height - 8}" text-anchor="middle">concurrent dispatchers</text>'
+    )
+    parts.append('</svg>')
+    return '\n'.join(parts) + '\n'
+
@@ -0,0 +1,86 @@
+import tempfile
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from routes.graph import NoRouteError, RoadGraph, build_road_graph
+
+HIGHWAY_MIX = ('motorway', 'trunk', 'primary', 'secondary', 'residential')
+
+
+def _grid_network(size, seed):
+    """Synthetic size x size road grid (~2 km spacing) with a random mix of road classes"""
+    rng = np.random.default_rng(seed)
+    spacing = 0.02
+    nodes = [(i * size + j, 33.0 + i * spacing, -90.0 + j * spacing) for i in range(size) for j in range(size)]
+
+    edges = []
+    for i in range(size):
+        for j in range(size):
+            node = i * size + j
+            for neighbour in ((node + 1) if j + 1 < size else None, (node + size) if i + 1 < size else None):
+                if neighbour is None:
+                    continue
+                edges.append({
+                    'from_node': node,
+                    'to_node': neighbour,
+                    # Roads wind: 0-30% longer than the straight line
+                    'length_m': 2000 * (1 + 0.3 * rng.random()),
+                    'highway': HIGHWAY_MIX[rng.integers(len(HIGHWAY_MIX))],
+                    'name': f'Road {i}' if neighbour == node + 1 else f'Avenue {j}',
+                })
+    return nodes, edges
+
+
+class Command(BaseCommand):
+    help = 'Measure local routing latency (bidirectional A* vs bidirectional Dijkstra)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=200, help='Random node pairs to route')
+        parser.add_argument('--grid', type=int, default=0, help='Benchmark a synthetic N x N grid instead of ROAD_GRAPH_PATH')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = settings.ROAD_GRAPH_PATH
+            if options['grid']:
+                started = time.perf_counter()
+                build_road_graph(*_grid_network(options['grid'], options['seed']), tmp)
+                path = tmp
+                self.stdout.write(f"Built {options['grid']}x{options['grid']} grid in {time.perf_counter() - started:.1f}s")
+
+            started = time.perf_counter()
+            graph = RoadGraph(path)
+            load_ms = (time.perf_counter() - started) * 1000
+            self.stdout.write(
+                f"Graph {path}: {graph.node_count} nodes, {graph.meta['edges']} edges, mapped in {load_ms:.1f} ms"
+            )
+
+            rng = np.random.default_rng(options['seed'])
+            # Only nodes with roads open to trucks can be routed from
+            routable = np.flatnonzero(np.diff(graph.offsets) > 0)
+            pairs = rng.choice(routable, size=(options['queries'], 2)).tolist()
+
+            self.stdout.write(f"{'search':<26}{'p50 (ms)':>10}{'p95 (ms)':>10}{'p99 (ms)':>10}{'settled':>10}")
+            for label, heuristic in (('bidirectional A*', True), ('bidirectional Dijkstra', False)):
+                latencies, settled = [], []
+                for source, target in pairs:
+                    started = time.perf_counter()
+                    try:
+                        _, _, nodes = graph.shortest_path(source, target, heuristic=heuristic)
+                    except NoRouteError:
+                        continue
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    settled.append(nodes)
+
+                p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+                self.stdout.write(f"{label:<26}{p50:>10.2f}{p95:>10.2f}{p99:>10.2f}{np.mean(settled):>10.0f}")
+
+            lat, lng = np.asarray(graph.lat), np.asarray(graph.lng)
+            started = time.perf_counter()
+            for node in rng.choice(routable, size=options['queries']).tolist():
+                graph.nearest_node(float(lat[node]) + 0.01, float(lng[node]) + 0.01, 50000)
+            snap_us = (time.perf_counter() - started) / options['queries'] * 1e6
+            self.stdout.write(f"nearest-node snap: {snap_us:.0f} us per lookup")
@@ -0,0 +1,28 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from routes.graph import build_road_graph_from_csv
+
+SAMPLE_DIR = Path(__file__).resolve().parents[2] / 'data' / 'sample_roads'
+
+
+class Command(BaseCommand):
+    help = 'Compile a nodes/edges CSV road network into the memory-mapped truck routing graph'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nodes', default=SAMPLE_DIR / 'nodes.csv', help='CSV with node_id,lat,lng')
+        parser.add_argument(
+            '--edges', default=SAMPLE_DIR / 'edges.csv',
+            help='CSV with from_node,to_node,length_m,highway,maxspeed_kph,name,oneway,hgv'
+        )
+        parser.add_argument('--output', default=None, help='Graph directory (defaults to ROAD_GRAPH_PATH)')
+
+    def handle(self, *args, **options):
+        output = options['output'] or settings.ROAD_GRAPH_PATH
+        meta = build_road_graph_from_csv(options['nodes'], options['edges'], output)
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {output}: {meta['nodes']} nodes, {meta['edges']} directed edges "
+            f"({meta['skipped_edges']} edges closed to trucks)"
+        ))
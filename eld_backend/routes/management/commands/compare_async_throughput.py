@@ -0,0 +1,140 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import httpx
+from django.core.management.base import BaseCommand
+from django.test import AsyncRequestFactory, RequestFactory
+from django.test.utils import setup_databases, teardown_databases
+
+from routes import views
+from routes.services import AsyncRouteCalculationService
+from routes.upstream import get_session
+
+
+def _geocode_payload(query):
+    # Spread fake cities over the map so each one gets distinct coordinates
+    seed = sum(map(ord, query))
+    return {'hits': [{'point': {'lat': 30 + seed % 15, 'lng': -120 + seed % 40}, 'name': query}]}
+
+
+ROUTE_PAYLOAD = {
+    'paths': [{
+        'distance': 1450000.0,
+        'time': 16.5 * 3600 * 1000,
+        'instructions': [{'text': 'Continue onto I-40', 'distance': 1450000.0, 'time': 16.5 * 3600 * 1000}],
+        'points': '',
+    }]
+}
+
+# Every simulated plan must reach the (fake) upstream
+NO_CACHE = {'Cache-Control': 'no-cache'}
+
+
+class Command(BaseCommand):
+    help = 'Compare sync vs async calculate-route throughput under simulated GraphHopper latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Plans to submit per mode')
+        parser.add_argument('--concurrency', type=int, default=100, help='In-flight plans for the async view')
+        parser.add_argument('--sync-workers', type=int, default=1, help='Worker threads serving the sync view')
+        parser.add_argument('--geocode-latency', type=float, default=0.2, help='Simulated /geocoding latency (s)')
+        parser.add_argument('--route-latency', type=float, default=0.5, help='Simulated /route latency (s)')
+
+    def handle(self, *args, **options):
+        self.options = options
+        # Run against a throwaway test database so no plans land in db.sqlite3
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            results = [self._run_sync(), asyncio.run(self._run_async())]
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+        self.stdout.write(
+            f"Simulated upstream latency: geocode {options['geocode_latency']}s, route {options['route_latency']}s; "
+            f"{options['requests']} plans per mode"
+        )
+        self.stdout.write(f"{'mode':<28}{'elapsed (s)':>12}{'plans/s':>10}{'p50 (s)':>10}{'p99 (s)':>10}")
+        for label, elapsed, latencies in results:
+            latencies.sort()
+            p50 = latencies[len(latencies) // 2]
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            self.stdout.write(
+                f"{label:<28}{elapsed:>12.2f}{len(latencies) / elapsed:>10.1f}{p50:>10.2f}{p99:>10.2f}"
+            )
+
+    def _payload(self, mode, index):
+        return json.dumps({
+            'current_location': f'{mode} Origin {index}, TX',
+            'pickup_location': f'{mode} Pickup {index}, OK',
+            'dropoff_location': f'{mode} Dropoff {index}, CA',
+            'current_cycle_hours': 10,
+        })
+
+    def _run_sync(self):
+        geocode_latency = self.options['geocode_latency']
+        route_latency = self.options['route_latency']
+
+        def fake_get(url, params=None, timeout=None):
+            response = mock.Mock(status_code=200)
+            if url.endswith('/geocoding'):
+                time.sleep(geocode_latency)
+                response.json.return_value = _geocode_payload(params['q'])
+            else:
+                time.sleep(route_latency)
+                response.json.return_value = ROUTE_PAYLOAD
+            return response
+
+        factory = RequestFactory()
+
+        def submit(index):
+            started = time.monotonic()
+            request = factory.post(
+                '/api/calculate-route/', self._payload('sync', index),
+                content_type='application/json', headers=NO_CACHE
+            )
+            response = views.calculate_route(request)
+            assert response.status_code == 201, response.data
+            return time.monotonic() - started
+
+        with mock.patch.object(get_session(), 'get', side_effect=fake_get):
+            started = time.monotonic()
+            with ThreadPoolExecutor(max_workers=self.options['sync_workers']) as pool:
+                latencies = list(pool.map(submit, range(self.options['requests'])))
+            elapsed = time.monotonic() - started
+
+        return f"sync view ({self.options['sync_workers']} worker)", elapsed, latencies
+
+    async def _run_async(self):
+        geocode_latency = self.options['geocode_latency']
+        route_latency = self.options['route_latency']
+
+        async def handler(request):
+            if request.url.path.endswith('/geocoding'):
+                await asyncio.sleep(geocode_latency)
+                return httpx.Response(200, json=_geocode_payload(request.url.params['q']))
+            await asyncio.sleep(route_latency)
+            return httpx.Response(200, json=ROUTE_PAYLOAD)
+
+        factory = AsyncRequestFactory()
+        limit = asyncio.Semaphore(self.options['concurrency'])
+
+        async def submit(index):
+            async with limit:
+                started = time.monotonic()
+                request = factory.post(
+                    '/api/calculate-route-async/', self._payload('async', index),
+                    content_type='application/json', headers=NO_CACHE
+                )
+                response = await views.calculate_route_async(request)
+                assert response.status_code == 201, response.content
+                return time.monotonic() - started
+
+        with mock.patch.object(AsyncRouteCalculationService, 'transport', httpx.MockTransport(handler)):
+            started = time.monotonic()
+            latencies = await asyncio.gather(*(submit(i) for i in range(self.options['requests'])))
+            elapsed = time.monotonic() - started
+
+        return f"async view ({self.options['concurrency']} in flight)", elapsed, list(latencies)
@@ -0,0 +1,99 @@
+import json
+from pathlib import Path
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from routes import loadtest
+from routes.fake_graphhopper import RECORDINGS, load_recordings
+
+
+def _mix(value):
+    """--mix short=5,multi=4,unknown=1"""
+    try:
+        mix = {kind: float(weight) for kind, weight in (part.split('=') for part in value.split(','))}
+    except ValueError:
+        raise ValueError(f"expected kind=weight pairs, got {value!r}")
+    unknown = set(mix) - set(loadtest.KINDS)
+    if unknown:
+        raise ValueError(f"unknown lane kinds {sorted(unknown)}; use {', '.join(loadtest.KINDS)}")
+    return mix
+
+
+class Command(BaseCommand):
+    help = (
+        'Load a running server with a mix of calculate-route plans at rising concurrency and chart '
+        'latency, errors and SQLite lock contention (run the server against serve_fake_graphhopper)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Server to load')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32],
+                            help='Concurrent dispatchers for each step, in order')
+        parser.add_argument('--duration', type=float, default=20, help='Seconds per step')
+        parser.add_argument('--mix', type=_mix, default=dict(loadtest.DEFAULT_MIX),
+                            help='Relative weights of lane kinds, e.g. short=5,multi=4,unknown=1')
+        parser.add_argument('--think-time', type=float, default=0.0,
+                            help='Mean pause between a dispatcher\'s plans (s); 0 keeps every dispatcher busy')
+        parser.add_argument('--timeout', type=float, default=60, help='Per-request timeout (s)')
+        parser.add_argument('--route-cache', action='store_true',
+                            help='Let repeated lanes hit the route cache instead of sending Cache-Control: no-cache')
+        parser.add_argument('--recordings', type=Path, default=RECORDINGS,
+                            help='The recordings the stand-in replays, to draw lanes from')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--chart', type=Path, help='Write an SVG chart here')
+        parser.add_argument('--json', type=Path, help='Write every step\'s results here')
+        parser.add_argument('--stop-error-rate', type=float, default=0.5,
+                            help='Stop stepping up once this share of a step\'s requests fail')
+
+    def handle(self, *args, **options):
+        try:
+            requests.get(f"{options['url'].rstrip('/')}/api/health/", timeout=10).raise_for_status()
+        except requests.RequestException as e:
+            raise CommandError(f"Server at {options['url']} is not answering: {e}")
+
+        lanes = loadtest.lane_mix(load_recordings(options['recordings']))
+        generator = loadtest.LoadGenerator(
+            options['url'], lanes, mix=options['mix'], think_time=options['think_time'],
+            timeout=options['timeout'], route_cache=options['route_cache'], seed=options['seed']
+        )
+        self.stdout.write(
+            f"Lanes: {', '.join(f'{len(lanes[kind])} {kind}' for kind in loadtest.KINDS)}; "
+            f"mix {options['mix']}; {options['duration']:g}s per step"
+        )
+        self.stdout.write(
+            f"{'conc':>5}{'reqs':>7}{'plans/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+            f"{'errors':>8}{'locked':>8}{'db p95':>8}{'degraded':>10}"
+        )
+
+        steps = []
+        for concurrency in options['concurrency']:
+            step = generator.run_step(concurrency, options['duration'])
+            steps.append(step)
+            self.stdout.write(
+                f"{concurrency:>5}{step['requests']:>7}{step['plans_per_s']:>9.1f}{self._ms(step['p50_ms']):>9}"
+                f"{self._ms(step['p95_ms']):>9}{self._ms(step['p99_ms']):>9}{step['error_rate']:>8.1%}"
+                f"{step['db_locked_rate']:>8.1%}{self._ms(step['db_p95_ms']):>8}{step['degraded']:>10}"
+            )
+            if step['error_rate'] >= options['stop_error_rate']:
+                self.stdout.write(f"Stopping: {step['error_rate']:.0%} of requests failed ({step['errors']})")
+                break
+
+        self.stdout.write('')
+        self.stdout.write(loadtest.text_chart(steps))
+        knee = loadtest.saturation(steps)
+        if knee is not None:
+            self.stdout.write(self.style.SUCCESS(
+                f"Throughput stops growing past about {knee['concurrency']} concurrent plans "
+                f"({knee['plans_per_s']:.1f} plans/s, p95 {self._ms(knee['p95_ms'])} ms)"
+            ))
+
+        config = {key: options[key] for key in ('url', 'concurrency', 'duration', 'mix', 'think_time', 'route_cache')}
+        if options['json']:
+            options['json'].write_text(json.dumps({'config': config, 'steps': steps}, indent=2) + '\n')
+        if options['chart']:
+            options['chart'].write_text(loadtest.svg_chart(steps))
+            self.stdout.write(f"Chart written to {options['chart']}")
+
+    def _ms(self, value):
+        return '-' if value is None else f'{value:.0f}'
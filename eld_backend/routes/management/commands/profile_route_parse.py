@@ -0,0 +1,142 @@
+import json
+import multiprocessing
+import pickle
+import resource
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from routes import parsing
+from routes.geo import encode_polyline
+
+
+def _synthetic_route(km, spacing_m, encoded, seed):
+    """A GraphHopper /route document for a km-long trip with a point every spacing_m"""
+    rng = np.random.default_rng(seed)
+    count = int(km * 1000 / spacing_m)
+    lat = 34.0 + np.cumsum(rng.normal(0, 0.0004, count))
+    lng = -118.0 + np.linspace(0, km / 90, count)
+    coordinates = np.column_stack((lng, lat, rng.uniform(0, 1500, count))).round(6)
+
+    # A turn every ~12 km, with the keys GraphHopper really sends
+    bounds = np.linspace(0, count - 1, max(int(km / 12), 2) + 1).astype(int)
+    instructions = [{
+        'distance': round(float(rng.uniform(2000, 20000)), 3),
+        'heading': round(float(rng.uniform(0, 360)), 2),
+        'sign': int(rng.choice([0, -2, 2, 7, -7])),
+        'interval': [int(start), int(end)],
+        'text': f'Continue onto Interstate {i % 90} toward Exit {i}',
+        'time': int(rng.uniform(60000, 900000)),
+        'street_name': f'Interstate {i % 90}',
+        'street_ref': f'I {i % 90}',
+        'street_destination': f'Exit {i}: Springfield, Shelbyville',
+        'last_heading': round(float(rng.uniform(0, 360)), 2),
+    } for i, (start, end) in enumerate(zip(bounds[:-1], bounds[1:]))]
+
+    points = encode_polyline(coordinates[:, [1, 0]]) if encoded else {
+        'type': 'LineString', 'coordinates': coordinates.tolist()
+    }
+    return {
+        'hints': {'visited_nodes.sum': 120000, 'visited_nodes.average': 60000.0},
+        'info': {'copyrights': ['GraphHopper', 'OpenStreetMap contributors'], 'took': 212},
+        'paths': [{
+            'distance': km * 1000.0,
+            'weight': km * 50.0,
+            'time': int(km / 85 * 3.6e6),
+            'transfers': 0,
+            'points_encoded': encoded,
+            'bbox': [-118.0, 33.0, -62.0, 36.0],
+            'points': points,
+            'instructions': instructions,
+            'legs': [],
+            'details': {},
+            'ascend': 15000.0,
+            'descend': 14800.0,
+            'snapped_waypoints': encode_polyline([[34.0, -118.0], [34.0, -62.0]]),
+        }],
+    }
+
+
+def _parse(path, mode):
+    if mode == 'response.json()':
+        # What calculate_route used to do: the whole document as Python objects
+        return json.loads(Path(path).read_bytes())['paths'][0]
+    with open(path, 'rb') as handle:
+        return parsing.parse_route_document(handle, streaming=mode == 'ijson streaming')
+
+
+def _rss_kb(field):
+    """VmRSS/VmHWM of this process from /proc; falls back to ru_maxrss off Linux"""
+    try:
+        with open('/proc/self/status') as status:
+            return next(int(line.split()[1]) for line in status if line.startswith(field))
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _measure(path, mode, results):
+    """Runs in a fresh process; reports how far this parse pushed RSS above the idle process"""
+    try:
+        # Reset the high-water mark so process start-up doesn't count
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        pass
+    rss_before = _rss_kb('VmRSS')
+    started = time.perf_counter()
+    result = _parse(path, mode)
+    elapsed = time.perf_counter() - started
+    rss_peak = _rss_kb('VmHWM') - rss_before
+    retained = len(pickle.dumps(result))
+    del result
+
+    # A second, traced pass for the Python heap high-water mark (tracemalloc slows parsing down)
+    tracemalloc.start()
+    _parse(path, mode)
+    _, heap_peak = tracemalloc.get_traced_memory()
+    results.put((elapsed, rss_peak / 1024, heap_peak / 2 ** 20, retained / 2 ** 20))
+
+
+class Command(BaseCommand):
+    help = 'Compare peak RSS and time of full vs streaming parses of a long GraphHopper route'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--km', type=int, default=5000, help='Route length')
+        parser.add_argument('--spacing', type=float, default=25, help='Meters between route points')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        modes = ['response.json()', 'json + trim']
+        if parsing.ijson is not None:
+            modes.append('ijson streaming')
+        else:
+            self.stdout.write('ijson is not installed; only the json parsers are measured')
+
+        # Each parse runs in its own freshly spawned process so peaks can't carry over
+        context = multiprocessing.get_context('spawn')
+        with tempfile.TemporaryDirectory() as tmp:
+            self.stdout.write(
+                f"{'points':<10}{'parser':<18}{'body MB':>9}{'peak RSS +MB':>14}{'heap peak MB':>14}"
+                f"{'kept MB':>9}{'time ms':>9}"
+            )
+            for encoded in (True, False):
+                path = Path(tmp) / f'route-{encoded}.json'
+                document = _synthetic_route(options['km'], options['spacing'], encoded, options['seed'])
+                path.write_text(json.dumps(document))
+                del document
+                size_mb = path.stat().st_size / 2 ** 20
+
+                for mode in modes:
+                    results = context.Queue()
+                    worker = context.Process(target=_measure, args=(str(path), mode, results))
+                    worker.start()
+                    elapsed, rss_mb, heap_mb, kept_mb = results.get()
+                    worker.join()
+                    self.stdout.write(
+                        f"{'encoded' if encoded else 'GeoJSON':<10}{mode:<18}{size_mb:>9.1f}{rss_mb:>14.1f}"
+                        f"{heap_mb:>14.1f}{kept_mb:>9.2f}{elapsed * 1000:>9.0f}"
+                    )
@@ -0,0 +1,139 @@
+import json
+import logging
+import platform
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+from routes import benchmarks
+from routes.fake_graphhopper import RECORDINGS, FakeGraphHopper, load_recordings, record_lanes
+
+# Settings that change what the numbers mean; timings are only compared against a baseline that used the same ones
+CONFIG_OPTIONS = ('iterations', 'geocode_latency', 'route_latency', 'jitter', 'failure_rate', 'failure_mode')
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark route calculation, HOS checks, stop planning, log generation and the calculate-route view '
+        'against a local GraphHopper stand-in, and fail on regressions against the stored baseline'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', nargs='+', choices=benchmarks.BENCHMARKS, help='Run just these benchmarks')
+        parser.add_argument('--iterations', type=int, default=30, help='Timed ops per benchmark')
+        parser.add_argument('--warmup', type=int, default=3, help='Untimed ops before each benchmark')
+        parser.add_argument('--geocode-latency', type=float, default=0.02, help='Stand-in /geocoding latency (s)')
+        parser.add_argument('--route-latency', type=float, default=0.05, help='Stand-in /route latency (s)')
+        parser.add_argument('--jitter', type=float, default=0.0, help='Extra random latency, up to this many seconds')
+        parser.add_argument('--failure-rate', type=float, default=0.0, help='Share of upstream calls that fail')
+        parser.add_argument(
+            '--failure-mode', choices=('status', 'drop'), default='status',
+            help="How injected failures look: a 503 ('status') or a dropped connection ('drop')"
+        )
+        parser.add_argument('--seed', type=int, default=1, help='Seed for jitter and failure injection')
+        parser.add_argument('--recordings', type=Path, default=RECORDINGS, help='GraphHopper recordings to replay')
+        parser.add_argument('--baseline', type=Path, default=benchmarks.BASELINE, help='Baseline to check against')
+        parser.add_argument('--update-baseline', action='store_true', help='Store this run as the new baseline')
+        parser.add_argument('--tolerance', type=float, default=benchmarks.TIMING_TOLERANCE,
+                            help='Allowed timing and throughput regression, as a fraction')
+        parser.add_argument('--json', type=Path, help='Also write the results to this file')
+        parser.add_argument(
+            '--record', metavar='BASE_URL', nargs='?', const='offline',
+            help="Rebuild --recordings from a GraphHopper-compatible server (or 'offline': the gazetteer "
+                 "and local road graph) and exit"
+        )
+        parser.add_argument('--api-key', help='API key for --record (default GRAPHHOPPER_API_KEY)')
+
+    def handle(self, *args, **options):
+        if options['record']:
+            return self._record(options)
+
+        config = {option: options[option] for option in CONFIG_OPTIONS}
+        if options['verbosity'] < 2:
+            # Injected failures and fallbacks log at WARNING/ERROR on every op
+            logging.disable(logging.ERROR)
+
+        fake = FakeGraphHopper(
+            load_recordings(options['recordings']),
+            geocode_latency=options['geocode_latency'],
+            route_latency=options['route_latency'],
+            jitter=options['jitter'],
+            failure_rate=options['failure_rate'],
+            failure_mode=options['failure_mode'],
+            seed=options['seed'],
+        )
+        suite = benchmarks.BenchmarkSuite(fake, options['iterations'], options['warmup'])
+
+        # A throwaway test database, and the test environment so the test client's host is allowed
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with fake:
+                results = suite.run(options['only'] or benchmarks.BENCHMARKS)
+                upstream = fake.stats()
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+            logging.disable(logging.NOTSET)
+
+        self._report(results, upstream, config)
+        document = {
+            'config': config,
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'benchmarks': results,
+        }
+        if options['json']:
+            options['json'].write_text(json.dumps(document, indent=2) + '\n')
+
+        if options['update_baseline']:
+            options['baseline'].write_text(json.dumps(document, indent=2) + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {options['baseline']}"))
+            return
+        self._check(results, config, options)
+
+    def _report(self, results, upstream, config):
+        self.stdout.write(
+            f"Stand-in upstream: geocode {config['geocode_latency']}s, route {config['route_latency']}s, "
+            f"jitter {config['jitter']}s, failure rate {config['failure_rate']} ({config['failure_mode']}); "
+            f"{config['iterations']} ops per benchmark"
+        )
+        self.stdout.write(
+            f"{'benchmark':<24}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries/op':>12}{'peak KB/op':>12}"
+        )
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<24}{result['ops_per_s']:>10.1f}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}"
+                f"{result['p99_ms']:>10.2f}{result['queries_per_op']:>12.1f}{result['alloc_peak_kb']:>12.1f}"
+            )
+        if 'route_service' in results:
+            self.stdout.write(f"Routing engines used: {results['route_service']['engines']}")
+        self.stdout.write(f"Upstream calls: {upstream}")
+
+    def _check(self, results, config, options):
+        if not options['baseline'].exists():
+            self.stdout.write(f"No baseline at {options['baseline']}; run with --update-baseline to store one")
+            return
+
+        baseline = json.loads(options['baseline'].read_text())
+        timings = baseline.get('config') == config and baseline.get('machine') == platform.machine()
+        if not timings:
+            self.stdout.write(self.style.WARNING(
+                f"Baseline was recorded with {baseline.get('config')} on {baseline.get('machine')}; "
+                f"comparing queries and memory only"
+            ))
+
+        regressions = benchmarks.compare(results, baseline, timings=timings, tolerance=options['tolerance'])
+        if regressions:
+            raise CommandError('Regressions against the baseline:\n  ' + '\n  '.join(regressions))
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
+
+    def _record(self, options):
+        base_url = None if options['record'] == 'offline' else options['record']
+        recordings = record_lanes(base_url=base_url, api_key=options['api_key'])
+        options['recordings'].write_text(json.dumps(recordings, indent=1) + '\n')
+        self.stdout.write(
+            f"Recorded {len(recordings['geocoding'])} geocodes and {len(recordings['route'])} routes "
+            f"from {recordings['source']} to {options['recordings']}"
+        )
@@ -0,0 +1,68 @@
+import os
+import signal
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from routes import jobs
+
+PURGE_INTERVAL = 3600  # seconds between sweeps of old finished jobs
+
+
+class Command(BaseCommand):
+    help = 'Run queued plan jobs (POST /api/calculate-route/jobs/) from the database queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=1,
+            help='Jobs run at once in this process; plans mostly wait on GraphHopper, so threads overlap well'
+        )
+        parser.add_argument('--poll-interval', type=float, default=None, help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        poll_interval = options['poll_interval'] or getattr(settings, 'PLAN_JOB_POLL_INTERVAL', 1.0)
+        stopping = threading.Event()
+
+        def stop(signum, frame):
+            # Finish the jobs in hand, then exit
+            self.stdout.write('Stopping after current jobs')
+            stopping.set()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        name = f'{socket.gethostname()}:{os.getpid()}'
+        self.stdout.write(f"Plan worker {name} running {options['concurrency']} job(s) at a time")
+        threads = [
+            threading.Thread(target=self._work, args=(f'{name}:{slot}', poll_interval, options['once'], stopping))
+            for slot in range(max(options['concurrency'], 1))
+        ]
+        for thread in threads:
+            thread.start()
+        # Joined in short steps so the main thread stays free to take signals
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=0.5)
+
+    def _work(self, worker, poll_interval, once, stopping):
+        last_purge = 0.0
+        try:
+            while not stopping.is_set():
+                close_old_connections()
+                if jobs.run_next(worker):
+                    continue
+                if once:
+                    return
+                if time.monotonic() - last_purge > PURGE_INTERVAL:
+                    last_purge = time.monotonic()
+                    purged = jobs.purge_finished()
+                    if purged:
+                        self.stdout.write(f'Purged {purged} finished jobs')
+                stopping.wait(poll_interval)
+        finally:
+            connection.close()
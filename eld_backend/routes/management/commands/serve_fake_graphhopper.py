@@ -0,0 +1,43 @@
+import signal
+import threading
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from routes.fake_graphhopper import RECORDINGS, FakeGraphHopper
+
+
+class Command(BaseCommand):
+    help = (
+        'Serve the recorded GraphHopper stand-in until interrupted, for load tests against a running '
+        'server started with GRAPHHOPPER_BASE_URL pointing at it'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8989)
+        parser.add_argument('--geocode-latency', type=float, default=0.05, help='/geocoding latency (s)')
+        parser.add_argument('--route-latency', type=float, default=0.15, help='/route latency (s)')
+        parser.add_argument('--jitter', type=float, default=0.05, help='Extra random latency, up to this many seconds')
+        parser.add_argument('--failure-rate', type=float, default=0.0, help='Share of calls that fail')
+        parser.add_argument('--failure-mode', choices=('status', 'drop'), default='status')
+        parser.add_argument('--recordings', type=Path, default=RECORDINGS)
+
+    def handle(self, *args, **options):
+        fake = FakeGraphHopper(
+            options['recordings'],
+            geocode_latency=options['geocode_latency'],
+            route_latency=options['route_latency'],
+            jitter=options['jitter'],
+            failure_rate=options['failure_rate'],
+            failure_mode=options['failure_mode'],
+            port=options['port'],
+        )
+        stopping = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+        signal.signal(signal.SIGINT, lambda signum, frame: stopping.set())
+
+        with fake:
+            self.stdout.write(f"GraphHopper stand-in serving {len(fake.lanes)} recorded lanes at {fake.url}")
+            self.stdout.write(f"Start the app with GRAPHHOPPER_BASE_URL={fake.url}")
+            stopping.wait()
+        self.stdout.write(f"Upstream calls: {fake.stats()}")
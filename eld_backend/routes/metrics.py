@@ -0,0 +1,203 @@
+# routes/metrics.py
+"""
+Per-stage latency and upstream counters for plan requests.
+
+Code wraps each stage of a plan in timed('<stage>'). The time is added to the
+current request's Server-Timing header (see ServerTimingMiddleware) and to a
+process-wide histogram. GET /api/metrics/ renders the histograms and counters
+in the Prometheus text format. It also includes p50/p95/p99 over each stage's
+most recent samples.
+
+Metrics are kept per process. Under a multi-worker server each scrape sees the
+worker that answered it.
+"""
+import bisect
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+# Seconds; GraphHopper calls dominate the upper end
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Stage durations of the request being served, or None outside one
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+class LatencyHistogram:
+    """Cumulative buckets for Prometheus plus a window of recent samples for quantiles"""
+
+    def __init__(self, window):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+        self.recent.append(seconds)
+
+    def quantiles(self):
+        ordered = sorted(self.recent)
+        if not ordered:
+            return {}
+        return {q: ordered[min(int(q * len(ordered)), len(ordered) - 1)] for q in QUANTILES}
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.window = getattr(settings, 'METRICS_QUANTILE_WINDOW', 1024)
+        self.histograms = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = LatencyHistogram(self.window)
+            histogram.observe(seconds)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def snapshot(self):
+        """Stage counts and quantiles in milliseconds, for health checks and logs"""
+        with self._lock:
+            return {
+                stage: {
+                    'count': histogram.count,
+                    **{f'p{int(q * 100)}_ms': round(value * 1000, 1) for q, value in histogram.quantiles().items()}
+                } for stage, histogram in sorted(self.histograms.items())
+            }
+
+    def clear(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def render(self):
+        """Everything in the Prometheus text exposition format"""
+        from .cache import geocode_cache, geometry_cache, route_cache
+
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+            quantiles = [(stage, histogram.quantiles()) for stage, histogram in histograms]
+            histograms = [(stage, list(h.counts), h.total, h.count) for stage, h in histograms]
+
+        lines = [
+            '# HELP eld_stage_duration_seconds Time spent in each stage of a plan request',
+            '# TYPE eld_stage_duration_seconds histogram',
+        ]
+        for stage, counts, total, count in histograms:
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'eld_stage_duration_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+            lines.append(f'eld_stage_duration_seconds_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'eld_stage_duration_seconds_count{{stage="{stage}"}} {count}')
+
+        lines += [
+            f'# HELP eld_stage_latency_seconds Stage latency quantiles over the last {self.window} samples',
+            '# TYPE eld_stage_latency_seconds gauge',
+        ]
+        for stage, values in quantiles:
+            for q, value in values.items():
+                lines.append(f'eld_stage_latency_seconds{{stage="{stage}",quantile="{q}"}} {value:.6f}')
+
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# TYPE {name} counter')
+            label_text = ','.join(f'{key}="{label}"' for key, label in labels)
+            lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+
+        lines.append('# TYPE eld_cache_events_total counter')
+        for cache_name, cache in (('geocode', geocode_cache), ('route', route_cache), ('geometry', geometry_cache)):
+            for event, value in sorted(cache.stats().items()):
+                if event.endswith(('hits', 'misses', 'stores', 'evictions', 'errors')):
+                    lines.append(f'eld_cache_events_total{{cache="{cache_name}",event="{event}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def record(stage, seconds):
+    registry.observe(stage, seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage):
+    """Time a block as one plan stage"""
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        record(stage, time.monotonic() - started)
+
+
+def count(name, **labels):
+    """Bump a counter, e.g. count('eld_route_fallbacks_total', engine='local')"""
+    registry.inc(name, **labels)
+
+
+def server_timing(timings):
+    """Server-Timing header value for {stage: seconds}"""
+    return ', '.join(f'{stage};dur={seconds * 1000:.1f}' for stage, seconds in timings.items())
+
+
+class ServerTimingMiddleware:
+    """
+    Collect stage timings for each request. Requests that timed any stage get a
+    Server-Timing header, and their total is recorded as the 'total' stage
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _annotate(self, response, timings, started):
+        if timings:
+            timings['total'] = time.monotonic() - started
+            registry.observe('total', timings['total'])
+            response['Server-Timing'] = server_timing(timings)
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings, started = {}, time.monotonic()
+        token = _request_timings.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_timings.reset(token)
+        return self._annotate(response, timings, started)
+
+    async def __acall__(self, request):
+        timings, started = {}, time.monotonic()
+        token = _request_timings.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_timings.reset(token)
+        return self._annotate(response, timings, started)
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.4 on 2026-10-18 05:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routes', '0002_geocodecacheentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteGeometry',
+            fields=[
+                ('route', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='geometry', serialize=False, to='routes.route')),
+                ('engine', models.CharField(max_length=20)),
+                ('encoded_points', models.TextField(blank=True)),
+                ('point_count', models.IntegerField(default=0)),
+                ('distance_meters', models.FloatField()),
+                ('time_seconds', models.FloatField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='routestep',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='routestep',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-18 05:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routes', '0003_routegeometry'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='route',
+            index=models.Index(fields=['created_at', 'id'], name='route_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.4 on 2026-10-18 06:01
+
+import django.core.serializers.json
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routes', '0004_route_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlanJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('payload', models.JSONField()),
+                ('preview', models.BooleanField(default=False)),
+                ('tolerance_m', models.FloatField(blank=True, null=True)),
+                ('use_cache', models.BooleanField(default=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('worker', models.CharField(blank=True, max_length=100)),
+                ('lease_expires_at', models.DateTimeField(blank=True, null=True)),
+                ('result', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True)),
+                ('result_status', models.IntegerField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('route', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='routes.route')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at'], name='planjob_status_created_idx')],
+            },
+        ),
+    ]
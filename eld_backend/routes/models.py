@@ -1,4 +1,7 @@
 # routes/models.py
+import uuid
+
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from datetime import datetime
 
@@ -14,6 +17,10 @@ class Route(models.Model):
     requires_multi_day = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # Keyset pagination of the read API walks (created_at, id)
+        indexes = [models.Index(fields=['created_at', 'id'], name='route_created_id_idx')]
+
     def __str__(self):
         return f"Route: {self.pickup_location} → {self.dropoff_location}"
 
@@ -23,8 +30,66 @@ class RouteStep(models.Model):
     instruction = models.TextField()
     distance_meters = models.FloatField()
     duration_seconds = models.FloatField()
-    latitude = models.FloatField()
-    longitude = models.FloatField()
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
     
     class Meta:
         ordering = ['step_order']
+
+class RouteGeometry(models.Model):
+    """The routed path kept as one encoded polyline, so a plan can be replayed without the router"""
+    route = models.OneToOneField(Route, on_delete=models.CASCADE, primary_key=True, related_name='geometry')
+    engine = models.CharField(max_length=20)
+    encoded_points = models.TextField(blank=True)  # Google/GraphHopper polyline, precision 5
+    point_count = models.IntegerField(default=0)
+    distance_meters = models.FloatField()
+    time_seconds = models.FloatField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Geometry for route {self.route_id}: {self.point_count} points"
+
+class GeocodeCacheEntry(models.Model):
+    key = models.CharField(max_length=255, unique=True)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    name = models.CharField(max_length=255)
+    hits = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Geocode: {self.key} → ({self.latitude}, {self.longitude})"
+
+class PlanJob(models.Model):
+    """A calculate-route request queued for the plan worker; the table is the queue"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (SUCCEEDED, 'Succeeded'), (FAILED, 'Failed')]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    payload = models.JSONField()  # Validated calculate-route input
+    preview = models.BooleanField(default=False)
+    tolerance_m = models.FloatField(null=True, blank=True)
+    use_cache = models.BooleanField(default=True)
+    attempts = models.IntegerField(default=0)
+    worker = models.CharField(max_length=100, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    result_status = models.IntegerField(null=True, blank=True)  # HTTP status the synchronous endpoint would have used
+    error = models.TextField(blank=True)
+    route = models.ForeignKey(Route, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # Workers claim the oldest queued job
+        indexes = [models.Index(fields=['status', 'created_at'], name='planjob_status_created_idx')]
+
+    def __str__(self):
+        return f"Plan job {self.id}: {self.status}"
@@ -0,0 +1,87 @@
+# routes/pagination.py
+"""
+Keyset pagination and conditional-GET helpers for the read API.
+
+Pages are cut on (field, id) rather than OFFSET, so page N costs the same as page 1
+and rows inserted meanwhile can't shift later pages. Cursors are opaque to clients.
+"""
+import base64
+import hashlib
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+# Bump when the read API's JSON shape changes so clients don't keep stale copies
+REPRESENTATION_VERSION = 1
+
+
+class InvalidPage(ValueError):
+    """Bad cursor or page size in a read API request"""
+
+
+def encode_cursor(value, pk):
+    return base64.urlsafe_b64encode(f'{value.isoformat()}|{pk}'.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        value, _, pk = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode().rpartition('|')
+        return value, int(pk)
+    except ValueError:
+        raise InvalidPage('Invalid cursor')
+
+
+def page_size(request):
+    """?limit= bounded by READ_API_MAX_PAGE_SIZE"""
+    try:
+        limit = int(request.GET.get('limit') or getattr(settings, 'READ_API_PAGE_SIZE', 20))
+    except ValueError:
+        raise InvalidPage('limit must be an integer')
+    if limit < 1:
+        raise InvalidPage('limit must be positive')
+    return min(limit, getattr(settings, 'READ_API_MAX_PAGE_SIZE', 100))
+
+
+def keyset_page(queryset, field, cursor, limit, descending=False):
+    """One page of queryset ordered on (field, id) as (rows, next cursor or None), in one query"""
+    direction = '-' if descending else ''
+    queryset = queryset.order_by(f'{direction}{field}', f'{direction}id')
+    try:
+        if cursor:
+            # A well-formed cursor can still carry a value the field won't parse, which filter() rejects
+            value, pk = decode_cursor(cursor)
+            after = 'lt' if descending else 'gt'
+            queryset = queryset.filter(Q(**{f'{field}__{after}': value}) | Q(**{field: value, f'id__{after}': pk}))
+        # One extra row tells whether another page exists
+        rows = list(queryset[:limit + 1])
+    except ValidationError:
+        raise InvalidPage('Invalid cursor')
+
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(getattr(rows[-1], field), rows[-1].pk)
+
+
+def validators_for(*parts, last_modified=None):
+    """(ETag, Last-Modified timestamp) for a representation identified by parts"""
+    digest = hashlib.blake2b(repr((REPRESENTATION_VERSION,) + parts).encode(), digest_size=12).hexdigest()
+    # HTTP dates have whole-second resolution
+    return quote_etag(digest), int(last_modified.timestamp()) if last_modified else None
+
+
+def not_modified(request, etag, last_modified):
+    """The 304 response for a matching If-None-Match/If-Modified-Since, or None"""
+    return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+def with_validators(response, etag, last_modified):
+    """Stamp validators on a response and ask clients to revalidate before reusing it"""
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'no-cache'
+    return response
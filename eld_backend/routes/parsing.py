@@ -0,0 +1,149 @@
+# routes/parsing.py
+"""
+Selective parser for GraphHopper /route documents.
+
+A long route document can hold thousands of instructions, each with a dozen keys,
+and, with points_encoded=false, hundreds of thousands of coordinate lists. Only
+the first path's distance, time, points and a few instruction fields are used, so
+with ijson installed the document is read as a stream of events and nothing else
+is ever materialized: coordinates go straight into a float array and are
+re-encoded as a polyline. Without ijson the whole document is parsed with json
+and trimmed to the same shape.
+
+Streaming trades CPU for memory (every event passes through Python), so callers
+only stream bodies large enough for the full tree to matter.
+"""
+import json
+from array import array
+
+import numpy as np
+
+from .geo import encode_polyline
+
+try:
+    import ijson
+except ImportError:  # Optional: fall back to json.load
+    ijson = None
+
+# The instruction fields the scheduler, POI placement and RouteStep rows read
+INSTRUCTION_FIELDS = frozenset(('text', 'street_name', 'distance', 'time', 'interval', 'sign'))
+
+_PATH = 'paths.item'
+_INSTRUCTION = f'{_PATH}.instructions.item'
+_COORDINATE = f'{_PATH}.points.coordinates.item'
+_VALUE_EVENTS = frozenset(('string', 'number', 'boolean', 'null'))
+# Streamed coordinates are encoded this many values at a time
+_COORDINATE_CHUNK = 3 * 8192
+
+
+def _points_from_geojson(points):
+    coordinates = points.get('coordinates') if isinstance(points, dict) else None
+    if not coordinates:
+        return ''
+    return encode_polyline(np.asarray(coordinates, dtype=np.float64)[:, [1, 0]])
+
+
+def _trim(path):
+    points = path.get('points')
+    return {
+        'distance': path['distance'],
+        'time': path['time'],
+        'instructions': [
+            {key: value for key, value in step.items() if key in INSTRUCTION_FIELDS}
+            for step in path.get('instructions') or []
+        ],
+        'points': points if isinstance(points, str) else _points_from_geojson(points),
+    }
+
+
+def _parse_loaded(source):
+    data = json.loads(source) if isinstance(source, (bytes, str)) else json.load(source)
+    if not data.get('paths'):
+        raise ValueError("No route found")
+    return _trim(data['paths'][0])
+
+
+def _parse_streaming(source):
+    path = None
+    paths_seen = 0
+    step = None
+    interval = None
+    coordinates = array('d')
+    dimensions = 0
+    current_width = 0
+    encoded = []
+    previous = None
+
+    def flush():
+        nonlocal coordinates, previous
+        whole = len(coordinates) - len(coordinates) % dimensions
+        if not whole:
+            return
+        lat_lng = np.frombuffer(coordinates, dtype=np.float64, count=whole).reshape(-1, dimensions)[:, [1, 0]]
+        encoded.append(encode_polyline(lat_lng, previous=previous))
+        previous = lat_lng[-1]
+        coordinates = coordinates[whole:]
+
+    for prefix, event, value in ijson.parse(source, use_float=True):
+        if prefix == _PATH and event == 'start_map':
+            paths_seen += 1
+            if paths_seen == 1:
+                path = {'instructions': []}
+            continue
+        if paths_seen != 1:
+            # Alternative routes (and anything outside paths) are skipped without being built
+            continue
+
+        if prefix.startswith(_COORDINATE):
+            if event == 'number':
+                coordinates.append(value)
+                current_width += 1
+            elif event == 'end_array' and prefix == _COORDINATE:
+                # Width of the first coordinate: 2, or 3 with elevation
+                dimensions = dimensions or current_width
+                current_width = 0
+                if len(coordinates) >= _COORDINATE_CHUNK:
+                    flush()
+        elif prefix.startswith(_INSTRUCTION):
+            if prefix == _INSTRUCTION:
+                if event == 'start_map':
+                    step = {}
+                elif event == 'end_map':
+                    path['instructions'].append(step)
+            else:
+                field = prefix[len(_INSTRUCTION) + 1:]
+                if field == 'interval.item':
+                    interval.append(int(value))
+                elif field == 'interval' and event == 'start_array':
+                    interval = step['interval'] = []
+                elif field in INSTRUCTION_FIELDS and event in _VALUE_EVENTS:
+                    step[field] = value
+        elif prefix in (f'{_PATH}.distance', f'{_PATH}.time', f'{_PATH}.points') and event in _VALUE_EVENTS:
+            path[prefix[len(_PATH) + 1:]] = value
+
+    if path is None:
+        raise ValueError("No route found")
+
+    if not isinstance(path.get('points'), str):
+        if dimensions:
+            flush()
+        path['points'] = ''.join(encoded)
+    return {
+        'distance': path['distance'],
+        'time': path['time'],
+        'instructions': path['instructions'],
+        'points': path['points'],
+    }
+
+
+def parse_route_document(source, streaming=True):
+    """
+    First path of a GraphHopper /route document as {'distance', 'time', 'instructions',
+    'points'}, with points always an encoded polyline. source is bytes or a binary
+    file-like object (e.g. a streamed response body). streaming=False, or ijson missing,
+    parses with json instead: faster for small bodies, but the whole tree is built first.
+    Raises ValueError if there is no path
+    """
+    if streaming and ijson is not None:
+        return _parse_streaming(source)
+    return _parse_loaded(source)
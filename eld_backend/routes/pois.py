@@ -0,0 +1,271 @@
+# routes/pois.py
+"""
+Spatial index of truck stops and rest areas, used to put planned breaks, 10-hour
+resets and fuel stops at real places along the route.
+
+Stops are held in flat arrays sorted by grid cell, so a bounding-box lookup is a
+handful of binary searches. Two formats load: the bundled CSV (name, kind, lat,
+lng, city, state, highway) and GeoJSON point exports from OpenStreetMap
+(amenity=fuel with hgv=yes, highway=rest_area, highway=services).
+"""
+import csv
+import json
+import logging
+import math
+import threading
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .geo import EARTH_RADIUS_M
+
+logger = logging.getLogger(__name__)
+
+METERS_PER_MILE = 1609.34
+KINDS = ('truck_stop', 'fuel', 'rest_area')
+# Which kinds of place can host each planned stop: fueling needs pumps, a
+# 10-hour reset needs truck parking, a 30-minute break can happen at any of them
+STOP_KINDS = {
+    'fuel': ('truck_stop', 'fuel'),
+    'rest': ('truck_stop', 'rest_area'),
+    'break': ('truck_stop', 'rest_area', 'fuel'),
+}
+GRID_CELL_DEG = 0.25
+GRID_COLUMNS = 2000
+SAMPLE_SPACING_MILES = 0.25
+
+
+def _cell_rows_cols(lat, lng):
+    return (
+        np.floor((np.asarray(lat, dtype=np.float64) + 90) / GRID_CELL_DEG).astype(np.int64),
+        np.floor((np.asarray(lng, dtype=np.float64) + 180) / GRID_CELL_DEG).astype(np.int64),
+    )
+
+
+def _read_csv(path):
+    with open(path, newline='', encoding='utf-8') as handle:
+        for row in csv.DictReader(line for line in handle if not line.startswith('#')):
+            yield row['name'], row['kind'], float(row['lat']), float(row['lng']), row.get('city', ''), row.get('state', '')
+
+
+def _read_geojson(path):
+    features = json.loads(Path(path).read_text(encoding='utf-8')).get('features', [])
+    for feature in features:
+        tags = feature.get('properties') or {}
+        geometry = feature.get('geometry') or {}
+        if geometry.get('type') != 'Point':
+            continue
+
+        truck_fuel = tags.get('amenity') == 'fuel' and tags.get('hgv') in ('yes', 'designated')
+        if tags.get('highway') == 'services' or (truck_fuel and tags.get('parking:hgv') == 'yes'):
+            kind = 'truck_stop'
+        elif truck_fuel:
+            kind = 'fuel'
+        elif tags.get('highway') == 'rest_area':
+            kind = 'rest_area'
+        else:
+            continue
+
+        lng, lat = geometry['coordinates'][:2]
+        name = tags.get('name') or tags.get('brand') or kind.replace('_', ' ').title()
+        yield name, kind, float(lat), float(lng), tags.get('addr:city', ''), tags.get('addr:state', '')
+
+
+class TruckStopIndex:
+    """Grid index over truck stops with a route-corridor query"""
+
+    def __init__(self, rows):
+        names, kinds, lat, lng, places = [], [], [], [], []
+        for name, kind, stop_lat, stop_lng, city, state in rows:
+            names.append(name)
+            kinds.append(KINDS.index(kind))
+            lat.append(stop_lat)
+            lng.append(stop_lng)
+            places.append(', '.join(part for part in (city, state) if part))
+
+        cell_rows, cell_cols = _cell_rows_cols(lat, lng)
+        keys = cell_rows * GRID_COLUMNS + cell_cols
+        order = np.argsort(keys, kind='stable')
+        self.cell_keys = keys[order]
+        self.lat = np.asarray(lat, dtype=np.float64)[order]
+        self.lng = np.asarray(lng, dtype=np.float64)[order]
+        self.kind = np.asarray(kinds, dtype=np.uint8)[order]
+        self.names = [names[i] for i in order]
+        self.places = [places[i] for i in order]
+
+    @classmethod
+    def load(cls, path):
+        path = Path(path)
+        reader = _read_geojson if path.suffix in ('.json', '.geojson') else _read_csv
+        return cls(reader(path))
+
+    def __len__(self):
+        return len(self.names)
+
+    def in_bbox(self, lat_min, lat_max, lng_min, lng_max):
+        """Indexes of stops whose grid cell overlaps the box"""
+        (row_min, row_max), (col_min, col_max) = _cell_rows_cols([lat_min, lat_max], [lng_min, lng_max])
+        # Each grid row is one contiguous run of keys
+        rows = np.arange(row_min, row_max + 1) * GRID_COLUMNS
+        starts = np.searchsorted(self.cell_keys, rows + col_min)
+        ends = np.searchsorted(self.cell_keys, rows + col_max + 1)
+        if not (ends > starts).any():
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([np.arange(a, b) for a, b in zip(starts, ends) if b > a])
+
+    def corridor(self, points, vertex_miles, radius_miles, kinds=KINDS):
+        """
+        Stops within radius_miles of a polyline, as (indexes, along-route miles, miles off route).
+        vertex_miles holds the route mileage at each polyline vertex
+        """
+        empty = np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        vertex_miles = np.asarray(vertex_miles, dtype=np.float64)
+        if not len(points) or not len(self):
+            return empty
+        if len(points) == 1:
+            # A single vertex is a zero-length segment
+            points, vertex_miles = np.repeat(points, 2, axis=0), np.repeat(vertex_miles, 2)
+
+        pad_lat = radius_miles * METERS_PER_MILE / EARTH_RADIUS_M * 180 / math.pi
+        pad_lng = pad_lat / max(math.cos(math.radians(np.abs(points[:, 0]).max())), 0.01)
+        lat, lng = points[:, 0], points[:, 1]
+        candidates = self.in_bbox(lat.min() - pad_lat, lat.max() + pad_lat, lng.min() - pad_lng, lng.max() + pad_lng)
+        allowed = np.zeros(len(KINDS), dtype=bool)
+        allowed[[KINDS.index(kind) for kind in kinds]] = True
+        candidates = candidates[allowed[self.kind[candidates]]]
+        if not len(candidates):
+            return empty
+
+        # Only segments whose padded bounding box reaches a candidate can be within the radius
+        stop_lat, stop_lng = self.lat[candidates], self.lng[candidates]
+        seg_lat_min, seg_lat_max = np.minimum(lat[:-1], lat[1:]), np.maximum(lat[:-1], lat[1:])
+        seg_lng_min, seg_lng_max = np.minimum(lng[:-1], lng[1:]), np.maximum(lng[:-1], lng[1:])
+        segments = np.flatnonzero(
+            (seg_lat_max >= stop_lat.min() - pad_lat) & (seg_lat_min <= stop_lat.max() + pad_lat) &
+            (seg_lng_max >= stop_lng.min() - pad_lng) & (seg_lng_min <= stop_lng.max() + pad_lng)
+        )
+        if not len(segments):
+            return empty
+
+        # Project onto a local plane (meters) and measure each stop against each nearby segment
+        meters_per_degree = EARTH_RADIUS_M * math.pi / 180
+        scale = np.array([meters_per_degree, meters_per_degree * math.cos(math.radians(stop_lat.mean()))])
+        start = points[segments] * scale
+        direction = points[segments + 1] * scale - start
+        stops = np.column_stack((stop_lat, stop_lng)) * scale
+
+        length_sq = np.maximum((direction ** 2).sum(axis=1), 1e-9)
+        # (stops x segments) projection of each stop onto each segment, clamped to the segment
+        t = np.clip(((stops[:, None, :] - start[None]) * direction[None]).sum(axis=2) / length_sq, 0.0, 1.0)
+        nearest = start[None] + t[..., None] * direction[None]
+        distance = np.sqrt(((stops[:, None, :] - nearest) ** 2).sum(axis=2))
+
+        closest = distance.argmin(axis=1)
+        rows = np.arange(len(candidates))
+        offset_m = distance[rows, closest]
+        segment = segments[closest]
+        along = vertex_miles[segment] + t[rows, closest] * (vertex_miles[segment + 1] - vertex_miles[segment])
+
+        keep = offset_m <= radius_miles * METERS_PER_MILE
+        return candidates[keep], along[keep], offset_m[keep] / METERS_PER_MILE
+
+    def describe(self, index, along_miles=None, offset_miles=None):
+        stop = {
+            'name': self.names[index],
+            'kind': KINDS[self.kind[index]],
+            'place': self.places[index],
+            'lat': round(float(self.lat[index]), 5),
+            'lng': round(float(self.lng[index]), 5),
+        }
+        if along_miles is not None:
+            stop['route_miles'] = round(float(along_miles), 1)
+            stop['miles_off_route'] = round(float(offset_miles), 2)
+        return stop
+
+
+def point_miles(profile):
+    """
+    Route mileage at each vertex of the profile's polyline. Miles are spread evenly
+    over each instruction's point interval, the same mapping RouteProfile.locate uses
+    """
+    count = len(profile.points)
+    intervals = profile.intervals
+    if count < 2 or not intervals[-1, 1]:
+        return np.linspace(0.0, profile.total_miles, count)
+
+    knots = np.append(intervals[:, 0], intervals[-1, 1])
+    return np.interp(np.arange(count), knots, profile.cum_miles)
+
+
+class StopPlacer:
+    """
+    Finds a real truck stop for a planned stop. The place must sit on the route
+    corridor, at or before the planned position (a driver can stop early, not
+    late), within window_miles of it
+    """
+
+    def __init__(self, profile, index=None, radius_miles=None, window_miles=None):
+        self.index = get_truck_stop_index() if index is None else index
+        self.radius_miles = radius_miles or getattr(settings, 'TRUCK_STOP_CORRIDOR_MILES', 5)
+        self.window_miles = window_miles or getattr(settings, 'TRUCK_STOP_WINDOW_MILES', 60)
+
+        # Thin dense polylines to about one vertex per SAMPLE_SPACING_MILES: the corridor is
+        # miles wide, so finer geometry only adds work
+        vertex_miles = point_miles(profile)
+        if len(vertex_miles) < 2:
+            self.points, self.vertex_miles = profile.points[:0], vertex_miles[:0]
+            return
+        last_vertex = len(vertex_miles) - 1
+        sample = np.unique(np.searchsorted(vertex_miles, np.arange(0.0, vertex_miles[-1], SAMPLE_SPACING_MILES)))
+        sample = np.append(sample[sample < last_vertex], last_vertex)
+        self.points, self.vertex_miles = profile.points[sample], vertex_miles[sample]
+
+    def place(self, stop_type, miles):
+        """The latest usable place for a stop due at the given route miles, or None"""
+        if len(self.vertex_miles) < 2 or not len(self.index):
+            return None
+
+        # Only the stretch of road the driver covers just before the planned stop
+        first = max(int(np.searchsorted(self.vertex_miles, miles - self.window_miles, side='right')) - 1, 0)
+        last = min(int(np.searchsorted(self.vertex_miles, miles, side='left')) + 1, len(self.vertex_miles))
+        candidates, along, offset = self.index.corridor(
+            self.points[first:last], self.vertex_miles[first:last], self.radius_miles, STOP_KINDS[stop_type]
+        )
+
+        usable = (along <= miles + 0.5) & (along >= miles - self.window_miles)
+        if not usable.any():
+            return None
+
+        # Latest stop before the planned point; ties go to the one closest to the road
+        choice = np.lexsort((offset[usable], -along[usable]))[0]
+        return self.index.describe(candidates[usable][choice], along[usable][choice], offset[usable][choice])
+
+    @staticmethod
+    def serves(poi, stop_type):
+        return poi is not None and poi['kind'] in STOP_KINDS[stop_type]
+
+    @staticmethod
+    def label(poi):
+        return f"{poi['name']}, {poi['place']}" if poi['place'] else poi['name']
+
+
+_truck_stop_index = None
+_truck_stop_lock = threading.Lock()
+
+
+def get_truck_stop_index():
+    """The configured truck-stop dataset, loaded once per process"""
+    global _truck_stop_index
+    with _truck_stop_lock:
+        if _truck_stop_index is None:
+            path = getattr(settings, 'TRUCK_STOPS_PATH', None)
+            if path is None:
+                # No dataset configured: planned stops keep their generic labels
+                _truck_stop_index = TruckStopIndex([])
+                logger.info("TRUCK_STOPS_PATH is not set; planned stops are not matched to truck stops")
+            else:
+                _truck_stop_index = TruckStopIndex.load(path)
+                logger.info(f"Loaded {len(_truck_stop_index)} truck stops from {path}")
+        return _truck_stop_index
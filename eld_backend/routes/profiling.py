@@ -0,0 +1,260 @@
+# routes/profiling.py
+"""
+Opt-in request profiler.
+
+ProfilingMiddleware profiles a random PROFILING_SAMPLE_RATE share of requests to
+PROFILING_PATHS while PROFILING_ENABLED is set. It also profiles any request that
+carries `X-Profile: <PROFILING_TOKEN>`, so a single live request can be profiled
+without a redeploy. When neither applies, a request costs one flag check and one
+header lookup.
+
+The default 'sample' mode is a statistical profiler. One background thread reads
+the stack of every profiled request thread every PROFILING_INTERVAL seconds and
+counts collapsed stacks. The result is written in the folded format that
+flamegraph.pl, speedscope and inferno read. While a request waits on SQL or
+GraphHopper, its samples get a synthetic [sql] or [http ...] leaf frame. That
+includes time spent waiting on geocodes running in the upstream pool. A JSON
+summary next to each profile gives exact query and HTTP call counts and times.
+'cprofile' mode writes a cProfile .prof file (for snakeviz or flameprof) with
+the same summary.
+
+Profiles are written to PROFILING_DIR/<url name>/, keeping the newest
+PROFILING_MAX_FILES per endpoint.
+"""
+import contextvars
+import cProfile
+import hmac
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# The profile of the request being served, or None
+_active = contextvars.ContextVar('active_profile', default=None)
+
+
+class RequestProfile:
+    """What one profiled request spent its time on"""
+
+    def __init__(self, thread_id):
+        self.thread_id = thread_id
+        self.stacks = Counter()
+        self.calls = {'sql': [0, 0.0], 'http': [0, 0.0]}
+        self.waiting = Counter()  # Open [sql]/[http ...] spans, from any thread
+        self._lock = threading.Lock()
+
+    def enter(self, label):
+        with self._lock:
+            self.waiting[label] += 1
+
+    def leave(self, kind, label, seconds):
+        with self._lock:
+            self.waiting[label] -= 1
+            if not self.waiting[label]:
+                del self.waiting[label]
+            self.calls[kind][0] += 1
+            self.calls[kind][1] += seconds
+
+    def sample(self, frame):
+        stack = []
+        while frame is not None:
+            stack.append(f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}")
+            frame = frame.f_back
+        stack.reverse()
+        with self._lock:
+            stack += sorted(self.waiting)
+            self.stacks[';'.join(stack)] += 1
+
+    def snapshot(self):
+        """A copy of the sampled stacks; the sampler may still be adding to them"""
+        with self._lock:
+            return Counter(self.stacks)
+
+    def summary(self):
+        with self._lock:
+            calls = {kind: list(totals) for kind, totals in self.calls.items()}
+        return {kind: {'count': count, 'ms': round(seconds * 1000, 1)} for kind, (count, seconds) in calls.items()}
+
+
+@contextmanager
+def outbound(kind, target):
+    """Attribute a blocking call (kind 'sql' or 'http') to the profiled request, if there is one"""
+    profile = _active.get()
+    if profile is None:
+        yield
+        return
+
+    label = f'[{kind} {target}]' if target else f'[{kind}]'
+    profile.enter(label)
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        profile.leave(kind, label, time.monotonic() - started)
+
+
+def _sql_wrapper(execute, sql, params, many, context):
+    with outbound('sql', None):
+        return execute(sql, params, many, context)
+
+
+class StackSampler:
+    """One thread that samples the stacks of every request being profiled"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.profiles = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add(self, profile):
+        with self._lock:
+            self.profiles.add(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='request-sampler', daemon=True)
+                self._thread.start()
+
+    def remove(self, profile):
+        with self._lock:
+            self.profiles.discard(profile)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                profiles = list(self.profiles)
+                if not profiles:
+                    # Nothing to do until the next profiled request starts a new thread
+                    self._thread = None
+                    return
+            frames = sys._current_frames()
+            for profile in profiles:
+                frame = frames.get(profile.thread_id)
+                if frame is not None:
+                    profile.sample(frame)
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def get_sampler():
+    """The process-wide stack sampler"""
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None:
+            _sampler = StackSampler(getattr(settings, 'PROFILING_INTERVAL', 0.005))
+        return _sampler
+
+
+class ProfilingMiddleware:
+    """Profile sampled or explicitly requested requests; everything else passes straight through"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'PROFILING_ENABLED', False)
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0.01)
+        self.paths = tuple(getattr(settings, 'PROFILING_PATHS', ('/api/calculate-route',)))
+        self.token = getattr(settings, 'PROFILING_TOKEN', '')
+        self.mode = getattr(settings, 'PROFILING_MODE', 'sample')
+        self.directory = Path(getattr(settings, 'PROFILING_DIR', Path(tempfile.gettempdir()) / 'eld-profiles'))
+        self.max_files = getattr(settings, 'PROFILING_MAX_FILES', 200)
+        self._sequence = itertools.count(1)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _wanted(self, request):
+        # META rather than request.headers, which would build the whole header map
+        requested = request.META.get('HTTP_X_PROFILE')
+        if requested:
+            # Without a token only a development server honours the header
+            return hmac.compare_digest(requested, self.token) if self.token else settings.DEBUG
+        return self.enabled and request.path.startswith(self.paths) and random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self._wanted(request):
+            return self.get_response(request)
+        return self._profiled(request)
+
+    async def __acall__(self, request):
+        # The event loop thread interleaves many requests, so its stacks can't be attributed to one
+        return await self.get_response(request)
+
+    def _profiled(self, request):
+        profile = RequestProfile(threading.get_ident())
+        profiler = cProfile.Profile() if self.mode == 'cprofile' else None
+        token = _active.set(profile)
+        started = time.monotonic()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(_sql_wrapper))
+                if profiler is not None:
+                    profiler.enable()
+                else:
+                    get_sampler().add(profile)
+                try:
+                    response = self.get_response(request)
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+                    else:
+                        get_sampler().remove(profile)
+        finally:
+            _active.reset(token)
+
+        wall = time.monotonic() - started
+        try:
+            name = self._write(request, response, profile, profiler, wall)
+            response['X-Profile-Id'] = name
+        except OSError as e:
+            logger.warning(f"Could not write profile for {request.path}: {e}")
+        return response
+
+    def _write(self, request, response, profile, profiler, wall):
+        endpoint = request.resolver_match.url_name if request.resolver_match else 'unresolved'
+        directory = self.directory / (endpoint or 'unnamed')
+        directory.mkdir(parents=True, exist_ok=True)
+        name = f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{next(self._sequence)}"
+
+        stacks = profile.snapshot()
+        if profiler is not None:
+            profiler.dump_stats(directory / f'{name}.prof')
+        else:
+            folded = ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+            (directory / f'{name}.folded').write_text(folded)
+        (directory / f'{name}.json').write_text(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'mode': self.mode,
+            'wall_ms': round(wall * 1000, 1),
+            'samples': sum(stacks.values()),
+            **profile.summary(),
+        }, indent=2))
+        self._rotate(directory)
+        return name
+
+    def _rotate(self, directory):
+        summaries = sorted(directory.glob('*.json'), key=lambda path: path.stat().st_mtime)
+        for stale in summaries[:max(len(summaries) - self.max_files, 0)]:
+            for path in directory.glob(f'{stale.stem}.*'):
+                path.unlink(missing_ok=True)
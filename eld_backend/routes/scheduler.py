@@ -0,0 +1,183 @@
+# routes/scheduler.py
+import numpy as np
+
+from .geo import route_points
+
+METERS_PER_MILE = 1609.34
+# Float slack when comparing accumulated hours against HOS limits
+EPSILON = 1e-9
+
+
+class RouteProfile:
+    """
+    Cumulative driving time and distance along a route, one entry per instruction
+    boundary, so any driving-hour offset can be mapped back to a place on the path
+    """
+
+    def __init__(self, route_data):
+        instructions = route_data.get('instructions') or []
+        step_hours = np.fromiter((step.get('time', 0) for step in instructions), float, len(instructions)) / 3.6e6
+        step_miles = np.fromiter((step.get('distance', 0) for step in instructions), float, len(instructions)) / METERS_PER_MILE
+
+        if not step_hours.sum() > 0:
+            # No usable instruction list: treat the whole route as a single step
+            step_hours = np.array([route_data['time_seconds'] / 3600])
+            step_miles = np.array([route_data['distance_meters'] / METERS_PER_MILE])
+            instructions = [{}]
+
+        self.instructions = instructions
+        self.cum_hours = np.concatenate(([0.0], np.cumsum(step_hours)))
+        self.cum_miles = np.concatenate(([0.0], np.cumsum(step_miles)))
+        self.points = route_points(route_data.get('points'))
+
+        # Point-index span of each instruction; missing intervals collapse onto point 0
+        self.intervals = np.array(
+            [step.get('interval', (0, 0)) for step in instructions], dtype=np.int64
+        ).reshape(-1, 2)
+
+    @property
+    def total_hours(self):
+        return float(self.cum_hours[-1])
+
+    @property
+    def total_miles(self):
+        return float(self.cum_miles[-1])
+
+    def miles_to_hours(self, miles):
+        return np.interp(miles, self.cum_miles, self.cum_hours)
+
+    def hours_to_miles(self, driving_hours):
+        return np.interp(driving_hours, self.cum_hours, self.cum_miles)
+
+    def locate(self, driving_hours):
+        """Vectorized lookup of where the truck is after the given driving hours"""
+        driving_hours = np.atleast_1d(np.asarray(driving_hours, dtype=float))
+        last_step = len(self.instructions) - 1
+
+        steps = np.clip(np.searchsorted(self.cum_hours, driving_hours, side='right') - 1, 0, last_step)
+        step_start = self.cum_hours[steps]
+        step_length = self.cum_hours[steps + 1] - step_start
+        fraction = np.divide(
+            driving_hours - step_start, step_length,
+            out=np.zeros_like(driving_hours), where=step_length > 0
+        ).clip(0.0, 1.0)
+
+        miles = np.interp(driving_hours, self.cum_hours, self.cum_miles)
+
+        lat = lng = None
+        if len(self.points):
+            first, last = self.intervals[steps, 0], self.intervals[steps, 1]
+            position = np.clip(first + fraction * (last - first), 0, len(self.points) - 1)
+            lower = np.floor(position).astype(np.int64)
+            upper = np.minimum(lower + 1, len(self.points) - 1)
+            weight = (position - lower)[:, None]
+            coords = self.points[lower] * (1 - weight) + self.points[upper] * weight
+            lat, lng = coords[:, 0], coords[:, 1]
+
+        return [
+            {
+                'driving_hours': round(float(driving_hours[i]), 3),
+                'miles': round(float(miles[i]), 1),
+                'lat': None if lat is None else round(float(lat[i]), 5),
+                'lng': None if lng is None else round(float(lng[i]), 5),
+                'instruction_index': int(steps[i]),
+                'street_name': self.instructions[steps[i]].get('street_name', ''),
+            }
+            for i in range(len(driving_hours))
+        ]
+
+
+class SegmentHOSScheduler:
+    """Places breaks, 10-hour resets and fuel stops at real positions along a route"""
+
+    def __init__(self):
+        self.MAX_DRIVING_HOURS = 11
+        self.MAX_DUTY_HOURS = 14
+        self.REQUIRED_BREAK_AFTER_HOURS = 8
+        self.REQUIRED_BREAK_DURATION = 0.5
+        self.MIN_OFF_DUTY_HOURS = 10
+        self.FUEL_INTERVAL_MILES = 1000
+        self.FUEL_STOP_DURATION = 0.5
+        self.PICKUP_DROPOFF_TIME = 1.0
+
+    def plan_stops(self, route_data, profile=None, placer=None):
+        """
+        Return the ordered stops required to drive the route legally. With a placer
+        (pois.StopPlacer), each stop moves back to the real place it picks and the
+        clocks run on from there, so every later stop follows from where the driver
+        actually stopped
+        """
+        profile = profile or RouteProfile(route_data)
+        total = profile.total_hours
+
+        def fuel_due(miles):
+            # Driving hours at which the tank next needs filling
+            return float(profile.miles_to_hours(miles)) if miles < profile.total_miles else np.inf
+
+        next_fuel = fuel_due(self.FUEL_INTERVAL_MILES)
+
+        # HOS clocks: driving since last 30-min interruption, driving this shift, and
+        # the 14-hour duty window (which starts with the 1-hour pickup)
+        driven = since_break = shift_driving = 0.0
+        window = self.PICKUP_DROPOFF_TIME
+        stops = []
+
+        while True:
+            to_break = self.REQUIRED_BREAK_AFTER_HOURS - since_break
+            to_reset = min(self.MAX_DRIVING_HOURS - shift_driving, self.MAX_DUTY_HOURS - window)
+            to_fuel = next_fuel - driven
+            step = max(0.0, min(to_break, to_reset, to_fuel))
+
+            if driven + step >= total - EPSILON:
+                break
+
+            if step >= to_reset - EPSILON:
+                stop_type, duration = 'rest', self.MIN_OFF_DUTY_HOURS
+            elif step >= to_fuel - EPSILON:
+                # Fueling is 30 minutes off the wheel, which also satisfies the break rule
+                stop_type, duration = 'fuel', self.FUEL_STOP_DURATION
+            else:
+                stop_type, duration = 'break', self.REQUIRED_BREAK_DURATION
+
+            poi = None
+            if placer is not None:
+                poi = placer.place(stop_type, float(profile.hours_to_miles(driven + step)))
+                at = float(profile.miles_to_hours(poi['route_miles'])) if poi else None
+                # Stopping early is legal; a place at or behind the last stop makes no progress
+                if poi and driven + EPSILON < at:
+                    step = min(at - driven, step)
+                else:
+                    poi = None
+
+            driven += step
+            since_break += step
+            shift_driving += step
+            window += step
+
+            if stop_type == 'rest':
+                since_break = shift_driving = window = 0.0
+            else:
+                window += duration
+                since_break = 0.0
+            stops.append((stop_type, driven, duration, poi))
+
+            # A stop that also lands on the fuel threshold refuels there, at the same place if it has pumps
+            if stop_type != 'fuel' and next_fuel <= driven + EPSILON:
+                pumps = poi if placer is not None and placer.serves(poi, 'fuel') else None
+                stops.append(('fuel', driven, self.FUEL_STOP_DURATION, pumps))
+                stop_type = 'fuel'
+            if stop_type == 'fuel':
+                # The next fill is due a full tank from wherever this one happened
+                next_fuel = fuel_due(float(profile.hours_to_miles(driven)) + self.FUEL_INTERVAL_MILES)
+
+        if not stops:
+            return []
+
+        positions = profile.locate([hours for _, hours, _, _ in stops])
+        planned = []
+        for (stop_type, _, duration, poi), position in zip(stops, positions):
+            stop = {'type': stop_type, 'duration_hours': duration, **position}
+            if poi is not None:
+                stop.update(poi=poi, location=placer.label(poi), lat=poi['lat'], lng=poi['lng'])
+            planned.append(stop)
+        return planned
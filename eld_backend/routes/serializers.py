@@ -15,6 +15,16 @@ class RouteSerializer(serializers.ModelSerializer):
         model = Route
         fields = '__all__'
 
+class RouteSummarySerializer(serializers.ModelSerializer):
+    """Route fields without the step list, for listings"""
+    class Meta:
+        model = Route
+        fields = [
+            'id', 'current_location', 'pickup_location', 'dropoff_location', 'current_cycle_hours',
+            'total_distance', 'estimated_driving_time', 'total_duty_time', 'is_compliant',
+            'requires_multi_day', 'created_at',
+        ]
+
 class RouteInputSerializer(serializers.ModelSerializer):
     class Meta:
         model = Route
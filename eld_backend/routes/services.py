@@ -1,20 +1,113 @@
 # routes/services.py
+import asyncio
+import contextvars
+import copy
+import httpx
 import requests
 from datetime import datetime, timedelta
-import math
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from .cache import geocode_cache, normalize_location, route_cache
+from .estimator import route_estimator, route_legs
+from .gazetteer import get_gazetteer
+from .geo import encode_polyline, route_points
+from .graph import local_route
+from .metrics import count, timed
+from .profiling import outbound
+from .models import RouteGeometry, RouteStep
+from .parsing import parse_route_document
+from .pois import StopPlacer
+from .scheduler import RouteProfile, SegmentHOSScheduler
+from .upstream import CircuitOpenError, get_async_client, get_session, graphhopper_breaker
 
 logger = logging.getLogger(__name__)
 
+# Fallback trip when the locations can't be placed at all
+UNKNOWN_ROUTE_METERS = 800 * 1000
+UNKNOWN_ROUTE_SPEED_MPS = 80 / 3.6
+
+_upstream_executor = None
+_upstream_executor_lock = threading.Lock()
+
+
+def get_upstream_executor():
+    """Bounded thread pool for GraphHopper calls, shared by every request in this process"""
+    global _upstream_executor
+    with _upstream_executor_lock:
+        if _upstream_executor is None:
+            _upstream_executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'ROUTE_UPSTREAM_WORKERS', 8),
+                thread_name_prefix='graphhopper'
+            )
+        return _upstream_executor
+
+
+def _remaining(deadline):
+    return max(0.0, deadline - time.monotonic())
+
+
+def _record_upstream_status(endpoint, status_code):
+    # Throttling and server errors count against the breaker; 4xx answers mean GraphHopper is up
+    if status_code == 429 or status_code >= 500:
+        graphhopper_breaker.record_failure()
+    else:
+        graphhopper_breaker.record_success()
+    if status_code >= 400:
+        count('eld_upstream_errors_total', upstream='graphhopper', endpoint=endpoint, error=f'http_{status_code}')
+
+
 class RouteCalculationService:
     def __init__(self):
-        # Your GraphHopper API key
-        self.api_key = "8d9e695c-6152-4496-bb88-8f39f13a4d00"
-        self.base_url = "https://graphhopper.com/api/1"
+        self.api_key = getattr(settings, 'GRAPHHOPPER_API_KEY', '')
+        self.base_url = getattr(settings, 'GRAPHHOPPER_BASE_URL', 'https://graphhopper.com/api/1')
+        self.session = get_session()
+
+    def _get(self, endpoint, params, timeout, stream=False):
+        """GET from GraphHopper through the pooled session and circuit breaker"""
+        if not graphhopper_breaker.allow_request():
+            count('eld_upstream_errors_total', upstream='graphhopper', endpoint=endpoint, error='circuit_open')
+            raise CircuitOpenError("GraphHopper circuit is open; skipping upstream call")
+
+        try:
+            with outbound('http', f'graphhopper/{endpoint}'):
+                response = self.session.get(f"{self.base_url}/{endpoint}", params=params, timeout=timeout, stream=stream)
+        except requests.RequestException as e:
+            graphhopper_breaker.record_failure()
+            count('eld_upstream_errors_total', upstream='graphhopper', endpoint=endpoint, error=type(e).__name__)
+            raise
+        except BaseException:
+            # Otherwise a half-open probe that never got an answer would keep the circuit half-open for good
+            graphhopper_breaker.abandon_probe()
+            raise
+
+        _record_upstream_status(endpoint, response.status_code)
+        try:
+            response.raise_for_status()
+        except requests.HTTPError:
+            # Callers only close responses they get back: a streamed error body would hold its pooled connection
+            response.close()
+            raise
+        return response
     
-    def geocode_location(self, location_string):
+    def geocode_location(self, location_string, timeout=10):
         """Convert address string to coordinates"""
-        url = f"{self.base_url}/geocoding"
+        cached = geocode_cache.get(location_string)
+        if cached is not None:
+            return cached
+
+        coords, from_upstream = self._fetch_geocode(location_string, timeout)
+        if from_upstream:
+            # Only real upstream hits are cached; offline fallbacks are retried next time
+            geocode_cache.set(location_string, coords)
+        return coords
+
+    def _fetch_geocode(self, location_string, timeout):
+        """Geocode through GraphHopper; returns (coords, came_from_upstream)"""
         params = {
             'q': location_string,
             'key': self.api_key,
@@ -23,9 +116,7 @@ class RouteCalculationService:
         }
         
         try:
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+            data = self._get('geocoding', params, timeout).json()
             
             if data.get('hits') and len(data['hits']) > 0:
                 hit = data['hits'][0]
@@ -33,142 +124,457 @@ class RouteCalculationService:
                     'lat': hit['point']['lat'],
                     'lng': hit['point']['lng'],
                     'name': hit.get('name', location_string)
-                }
+                }, True
             else:
                 logger.warning(f"No geocoding results for: {location_string}")
-                return self._get_mock_coordinates(location_string)
+                return self._offline_geocode(location_string), False
                 
         except Exception as e:
             logger.error(f"Geocoding error for {location_string}: {e}")
-            print(f"Geocoding error: {e}")
-            return self._get_mock_coordinates(location_string)
-
-    def _get_mock_coordinates(self, location_string):
-        """Return mock coordinates for common cities"""
-        mock_coords = {
-            'Atlanta, GA': {'lat': 33.7490, 'lng': -84.3880, 'name': 'Atlanta, GA'},
-            'Charlotte, NC': {'lat': 35.2271, 'lng': -80.8431, 'name': 'Charlotte, NC'},
-            'Jacksonville, FL': {'lat': 30.3322, 'lng': -81.6557, 'name': 'Jacksonville, FL'},
-            'Chicago, IL': {'lat': 41.8781, 'lng': -87.6298, 'name': 'Chicago, IL'},
-            'Denver, CO': {'lat': 39.7392, 'lng': -104.9903, 'name': 'Denver, CO'},
-            'Los Angeles, CA': {'lat': 34.0522, 'lng': -118.2437, 'name': 'Los Angeles, CA'},
-            'New York, NY': {'lat': 40.7128, 'lng': -74.0060, 'name': 'New York, NY'},
-            'Seattle, WA': {'lat': 47.6062, 'lng': -122.3321, 'name': 'Seattle, WA'},
-            'Miami, FL': {'lat': 25.7617, 'lng': -80.1918, 'name': 'Miami, FL'},
-            'Dallas, TX': {'lat': 32.7767, 'lng': -96.7970, 'name': 'Dallas, TX'},
-            'Phoenix, AZ': {'lat': 33.4484, 'lng': -112.0740, 'name': 'Phoenix, AZ'},
-            'Houston, TX': {'lat': 29.7604, 'lng': -95.3698, 'name': 'Houston, TX'},
-            'San Antonio, TX': {'lat': 29.4241, 'lng': -98.4936, 'name': 'San Antonio, TX'},
-            'Tampa, FL': {'lat': 27.9506, 'lng': -82.4572, 'name': 'Tampa, FL'},
-            'Orlando, FL': {'lat': 28.5383, 'lng': -81.3792, 'name': 'Orlando, FL'}
-        }
-        
-        if location_string in mock_coords:
-            print(f"Using mock coordinates for {location_string}")
-            return mock_coords[location_string]
-        
-        for city, coords in mock_coords.items():
-            if location_string.lower() in city.lower() or city.lower() in location_string.lower():
-                print(f"Using mock coordinates for {location_string} -> {city}")
-                return coords
-        
-        print(f"Using default coordinates for unknown location: {location_string}")
-        return {'lat': 39.8283, 'lng': -98.5795, 'name': location_string}
-    
-    def calculate_route(self, current_location, pickup_location, dropoff_location):
+            return self._offline_geocode(location_string), False
+
+    def _geocode_concurrently(self, locations, deadline, strict=True):
+        """
+        Geocode several locations at once, overlapping the upstream calls.
+        Locations still pending at the deadline raise TimeoutError, or fall back to
+        the offline gazetteer when strict is False
+        """
+        results = {}
+        futures = {}
+        executor = get_upstream_executor()
+
+        results.update(geocode_cache.get_many(list(dict.fromkeys(locations))))
+        for location in dict.fromkeys(locations):
+            if location in results:
+                continue
+
+            timeout = min(10, _remaining(deadline))
+            if not timeout:
+                # A zero timeout would only make requests raise; treat it like a call that never answered
+                if strict:
+                    for future in futures:
+                        future.cancel()
+                    raise TimeoutError("Geocoding exceeded the request deadline")
+                logger.error(f"Geocoding timed out for {location}")
+                results[location] = self._offline_geocode(location)
+                continue
+
+            # Run in the caller's context, so profiling can attribute the wait to this request
+            futures[executor.submit(contextvars.copy_context().run, self._fetch_geocode, location, timeout)] = location
+
+        if futures:
+            done, not_done = wait(futures, timeout=_remaining(deadline))
+            for future in not_done:
+                future.cancel()
+            if not_done and strict:
+                raise TimeoutError("Geocoding exceeded the request deadline")
+
+            # Cache writes stay on the calling thread so pool threads never touch the DB
+            for future, location in futures.items():
+                if future in not_done:
+                    logger.error(f"Geocoding timed out for {location}")
+                    results[location] = self._offline_geocode(location)
+                    continue
+                coords, from_upstream = future.result()
+                if from_upstream:
+                    geocode_cache.set(location, coords)
+                results[location] = coords
+
+        return [results[location] for location in locations]
+
+    def _offline_geocode(self, location_string):
+        """Coordinates from the bundled gazetteer, or None for places it doesn't know"""
+        coords = get_gazetteer().lookup(location_string)
+        count('eld_geocode_fallbacks_total', source='gazetteer', found=str(coords is not None).lower())
+        if coords is None:
+            logger.warning(f"Location not found in offline gazetteer: {location_string}")
+        else:
+            logger.info(f"Using offline gazetteer for {location_string} -> {coords['name']}")
+        return coords
+
+    def calculate_route(self, current_location, pickup_location, dropoff_location, concurrent=None, use_cache=True):
         """Calculate optimized route through all points"""
+        if concurrent is None:
+            concurrent = getattr(settings, 'ROUTE_CONCURRENT_GEOCODING', True)
+        deadline = time.monotonic() + getattr(settings, 'ROUTE_REQUEST_DEADLINE', 40)
+        current = pickup = dropoff = None
+
         try:
             # Geocode all locations
-            current = self.geocode_location(current_location)
-            pickup = self.geocode_location(pickup_location) 
-            dropoff = self.geocode_location(dropoff_location)
+            with timed('geocode'):
+                if concurrent:
+                    current, pickup, dropoff = self._geocode_concurrently(
+                        [current_location, pickup_location, dropoff_location], deadline
+                    )
+                else:
+                    current = self.geocode_location(current_location)
+                    pickup = self.geocode_location(pickup_location) 
+                    dropoff = self.geocode_location(dropoff_location)
             
             if not all([current, pickup, dropoff]):
                 raise ValueError("Could not geocode one or more locations")
             
             # Calculate route: current -> pickup -> dropoff
-            waypoints = [
-                f"{current['lat']},{current['lng']}",
-                f"{pickup['lat']},{pickup['lng']}",
-                f"{dropoff['lat']},{dropoff['lng']}"
-            ]
-            
-            url = f"{self.base_url}/route"
-            params = {
-                'point': waypoints,
-                'vehicle': 'truck',
-                'key': self.api_key,
-                'instructions': 'true',
-                'calc_points': 'true',
-                'type': 'json'
+            waypoints = self._build_waypoints(current, pickup, dropoff)
+            timeout = min(30, _remaining(deadline)) if concurrent else 30
+            with timed('route'):
+                path = self._route_path(current, pickup, dropoff, timeout, use_cache)
+            return self._build_route_result(path, waypoints, current, pickup, dropoff)
+                
+        except Exception as e:
+            return self._fallback_route(
+                current_location, pickup_location, dropoff_location, e, points=[current, pickup, dropoff]
+            )
+
+    def calculate_routes(self, trips, use_cache=True):
+        """
+        Route many (current, pickup, dropoff) trips at once. Locations and lanes shared
+        across the batch are geocoded and routed only once, on the bounded upstream pool
+        """
+        deadline = time.monotonic() + getattr(settings, 'ROUTE_BATCH_DEADLINE', 120)
+
+        # One upstream lookup per normalized location
+        representatives = {}
+        for trip in trips:
+            for location in trip:
+                representatives.setdefault(normalize_location(location), location)
+        unique_locations = list(representatives.values())
+        geocoded = dict(zip(unique_locations, self._geocode_concurrently(unique_locations, deadline, strict=False)))
+
+        def geocodes_for(trip):
+            return [geocoded[representatives[normalize_location(location)]] for location in trip]
+
+        # One /route call per distinct lane
+        lanes = {}
+        for trip in trips:
+            points = geocodes_for(trip)
+            if all(points):
+                lanes.setdefault(tuple(self._build_waypoints(*points)), points)
+
+        executor = get_upstream_executor()
+        futures = {
+            executor.submit(
+                contextvars.copy_context().run, self._route_path, *points, min(30, _remaining(deadline)), use_cache
+            ): lane
+            for lane, points in lanes.items()
+        }
+        done, not_done = wait(futures, timeout=_remaining(deadline))
+        for future in not_done:
+            future.cancel()
+
+        paths = {}
+        errors = {}
+        for future, lane in futures.items():
+            if future in not_done:
+                errors[lane] = TimeoutError("Route request exceeded the batch deadline")
+            elif future.exception() is not None:
+                errors[lane] = future.exception()
+            else:
+                paths[lane] = future.result()
+
+        results = []
+        failed = []
+        for position, trip in enumerate(trips):
+            points = geocodes_for(trip)
+            if not all(points):
+                results.append(None)
+                failed.append((position, trip, ValueError("Could not geocode one or more locations"), None))
+                continue
+
+            lane = tuple(self._build_waypoints(*points))
+            if lane in paths:
+                results.append(self._build_route_result(paths[lane], list(lane), *points))
+            else:
+                results.append(None)
+                failed.append((position, trip, errors[lane], points))
+
+        # Every trip left without a routed path is estimated in one pass
+        if failed:
+            positions, failed_trips, failed_errors, failed_points = zip(*failed)
+            for position, route in zip(positions, self._fallback_routes(failed_trips, failed_errors, failed_points)):
+                results[position] = route
+
+        logger.info(
+            f"Batch routed {len(trips)} trips with {len(unique_locations)} unique locations "
+            f"and {len(lanes)} unique lanes"
+        )
+        return results
+
+    def _route_path(self, current, pickup, dropoff, timeout, use_cache=True):
+        """Route fields for geocoded waypoints, from the route cache or the configured engine"""
+        path = route_cache.get([current, pickup, dropoff]) if use_cache else None
+        if path is None:
+            if self._routing_engine() == 'local':
+                path = self._local_path(current, pickup, dropoff)
+            else:
+                try:
+                    if timeout <= 0:
+                        raise TimeoutError("Route request exceeded the request deadline")
+
+                    waypoints = self._build_waypoints(current, pickup, dropoff)
+                    # Streamed: large bodies are parsed as they arrive and never held as a whole
+                    with self._get('route', self._route_params(waypoints), timeout, stream=True) as response:
+                        response.raw.decode_content = True
+                        path = self._parse_route_response(response.raw, response.headers.get('Content-Length'))
+                    self._observe(current, pickup, dropoff, path)
+                except Exception as e:
+                    # Fallback paths aren't cached, so the next request retries GraphHopper
+                    return self._local_fallback_path(current, pickup, dropoff, e)
+            route_cache.set([current, pickup, dropoff], path)
+        return path
+
+    def _routing_engine(self):
+        return getattr(settings, 'ROUTING_ENGINE', 'graphhopper')
+
+    def _local_path(self, current, pickup, dropoff):
+        """Route on the memory-mapped local road graph"""
+        return {**local_route([current, pickup, dropoff]), 'engine': 'local'}
+
+    def _local_fallback_path(self, current, pickup, dropoff, error):
+        """Reroute on the local graph after a GraphHopper failure, or re-raise the failure"""
+        if getattr(settings, 'ROUTING_FALLBACK', 'local') != 'local':
+            raise error
+
+        logger.warning(f"GraphHopper route failed ({error}); routing on the local road graph")
+        count('eld_route_fallbacks_total', engine='local')
+        try:
+            path = self._local_path(current, pickup, dropoff)
+        except Exception as local_error:
+            logger.error(f"Local routing failed: {local_error}")
+            raise error
+        return {**path, 'error': str(error)}
+
+    def _build_waypoints(self, current, pickup, dropoff):
+        return [
+            f"{current['lat']},{current['lng']}",
+            f"{pickup['lat']},{pickup['lng']}",
+            f"{dropoff['lat']},{dropoff['lng']}"
+        ]
+
+    def _route_params(self, waypoints):
+        return {
+            'point': waypoints,
+            'vehicle': 'truck',
+            'key': self.api_key,
+            'instructions': 'true',
+            'calc_points': 'true',
+            # Encoded polylines are ~5x smaller than GeoJSON coordinate arrays, on the wire and in the route cache
+            'points_encoded': 'true',
+            'type': 'json'
+        }
+
+    def _parse_route_response(self, body, length=None):
+        """Pull the cacheable route fields out of a GraphHopper /route body (bytes or a binary stream)"""
+        # Event streaming keeps memory flat but is slower than json, so small or already-buffered bodies are loaded whole
+        min_bytes = getattr(settings, 'ROUTE_STREAM_PARSE_MIN_BYTES', 1024 * 1024)
+        streaming = not isinstance(body, bytes) and (length is None or int(length) >= min_bytes)
+        path = parse_route_document(body, streaming=streaming)
+        return {
+            'distance_meters': path['distance'],
+            'time_seconds': path['time'] / 1000,
+            'instructions': path['instructions'],
+            'points': path['points'],
+            'engine': 'graphhopper'
+        }
+
+    def _build_route_result(self, path, waypoints, current, pickup, dropoff):
+        """Combine route fields with this request's own geocodes"""
+        return {
+            **path,
+            # path may be the route cache's own copy: callers get instructions they are free to change
+            'instructions': copy.deepcopy(path['instructions']),
+            'waypoints': waypoints,
+            'geocoded_locations': {
+                'current': current,
+                'pickup': pickup,
+                'dropoff': dropoff
             }
-            
-            response = requests.get(url, params=params, timeout=30)
-            response.raise_for_status()
+        }
+
+    def _fallback_route(self, current_location, pickup_location, dropoff_location, error, points=None):
+        """Estimate a route when no routing engine can be used"""
+        return self._fallback_routes([(current_location, pickup_location, dropoff_location)], [error], [points])[0]
+
+    def _fallback_routes(self, trips, errors, points):
+        """Estimate several (current, pickup, dropoff) trips at once, with one estimator call for all their legs"""
+        points = list(points)
+        for position, (trip, error) in enumerate(zip(trips, errors)):
+            logger.error(f"Route calculation error: {error}")
+            count('eld_route_fallbacks_total', engine='estimate')
+            if not points[position] or not all(points[position]):
+                points[position] = [self._offline_geocode(location) for location in trip]
+
+        # Great-circle legs scaled by the circuity and speed fitted from real routes
+        located = [position for position, trip_points in enumerate(points) if all(trip_points)]
+        legs = {}
+        if located:
+            coords = [[[point['lat'], point['lng']] for point in points[position]] for position in located]
+            leg_meters, leg_seconds = route_estimator.estimate(
+                [leg for trip_coords in coords for leg in trip_coords[:-1]],
+                [leg for trip_coords in coords for leg in trip_coords[1:]]
+            )
+            legs = dict(zip(located, zip(leg_meters.reshape(len(located), -1).tolist(),
+                                         leg_seconds.reshape(len(located), -1).tolist())))
+
+        routes = []
+        for position, (locations, error) in enumerate(zip(trips, errors)):
+            if position in legs:
+                leg_meters, leg_seconds = legs[position]
+                waypoints = self._build_waypoints(*points[position])
+            else:
+                leg_meters = [UNKNOWN_ROUTE_METERS * 0.4, UNKNOWN_ROUTE_METERS * 0.6]
+                leg_seconds = [meters / UNKNOWN_ROUTE_SPEED_MPS for meters in leg_meters]
+                waypoints = []
+
+            routes.append({
+                'distance_meters': sum(leg_meters),
+                'time_seconds': sum(leg_seconds),
+                'instructions': [{'text': f'Start from {locations[0]}', 'distance': 0, 'time': 0}] + [
+                    {'text': f'Drive to {location}', 'distance': meters, 'time': seconds * 1000}
+                    for location, meters, seconds in zip(locations[1:], leg_meters, leg_seconds)
+                ],
+                'waypoints': waypoints,
+                'engine': 'estimate',
+                'error': str(error)
+            })
+        return routes
+
+    def _observe(self, current, pickup, dropoff, path):
+        """Feed a real GraphHopper route's legs into the fallback estimator"""
+        legs = route_legs(path)
+        if len(legs) != 2:
+            return
+
+        coords = [[point['lat'], point['lng']] for point in (current, pickup, dropoff)]
+        route_estimator.observe(coords[:-1], coords[1:], [leg[0] for leg in legs], [leg[1] for leg in legs])
+
+class AsyncRouteCalculationService(RouteCalculationService):
+    """
+    Non-blocking variant of RouteCalculationService for async views.
+    Coroutines carry an a- prefix, so the inherited sync methods keep their signatures
+    """
+
+    # Optional httpx transport override (used to simulate upstream latency)
+    transport = None
+
+    async def _aget(self, client, endpoint, params, timeout):
+        """Non-blocking GET from GraphHopper through the circuit breaker"""
+        if not graphhopper_breaker.allow_request():
+            count('eld_upstream_errors_total', upstream='graphhopper', endpoint=endpoint, error='circuit_open')
+            raise CircuitOpenError("GraphHopper circuit is open; skipping upstream call")
+
+        try:
+            with outbound('http', f'graphhopper/{endpoint}'):
+                response = await client.get(f"{self.base_url}/{endpoint}", params=params, timeout=timeout)
+        except httpx.HTTPError as e:
+            graphhopper_breaker.record_failure()
+            count('eld_upstream_errors_total', upstream='graphhopper', endpoint=endpoint, error=type(e).__name__)
+            raise
+        except BaseException:
+            # Cancelled by the request deadline: release the probe, as in the sync _get
+            graphhopper_breaker.abandon_probe()
+            raise
+
+        _record_upstream_status(endpoint, response.status_code)
+        response.raise_for_status()
+        return response
+
+    async def ageocode_location(self, location_string, client, timeout=10):
+        """Convert address string to coordinates without blocking the event loop"""
+        cached = await sync_to_async(geocode_cache.get)(location_string)
+        if cached is not None:
+            return cached
+
+        coords, from_upstream = await self._afetch_geocode(location_string, client, timeout)
+        if from_upstream:
+            await sync_to_async(geocode_cache.set)(location_string, coords)
+        return coords
+
+    async def _afetch_geocode(self, location_string, client, timeout):
+        params = {
+            'q': location_string,
+            'key': self.api_key,
+            'limit': 1,
+            'locale': 'en'
+        }
+
+        try:
+            response = await self._aget(client, 'geocoding', params, timeout)
             data = response.json()
-            
-            if 'paths' in data and data['paths']:
-                path = data['paths'][0]
+
+            if data.get('hits'):
+                hit = data['hits'][0]
                 return {
-                    'distance_meters': path['distance'],
-                    'time_seconds': path['time'] / 1000,
-                    'instructions': path.get('instructions', []),
-                    'points': path.get('points', {}),
-                    'waypoints': waypoints,
-                    'geocoded_locations': {
-                        'current': current,
-                        'pickup': pickup,
-                        'dropoff': dropoff
-                    }
-                }
+                    'lat': hit['point']['lat'],
+                    'lng': hit['point']['lng'],
+                    'name': hit.get('name', location_string)
+                }, True
             else:
-                raise ValueError("No route found")
-                
+                logger.warning(f"No geocoding results for: {location_string}")
+                return await self._aoffline_geocode(location_string), False
+
         except Exception as e:
-            logger.error(f"Route calculation error: {e}")
-            print(f"GraphHopper API Error: {e}")
-            
-            # Calculate realistic distance based on locations
-            distance_km = self._calculate_mock_distance(current_location, pickup_location, dropoff_location)
-            distance_meters = distance_km * 1000
-            time_seconds = (distance_km / 80) * 3600  # Assume 80 km/h average speed
-            
-            return {
-                'distance_meters': distance_meters,
-                'time_seconds': time_seconds,
-                'instructions': [
-                    {'text': f'Start from {current_location}', 'distance': 0, 'time': 0},
-                    {'text': f'Drive to {pickup_location}', 'distance': distance_meters * 0.4, 'time': time_seconds * 0.4 * 1000},
-                    {'text': f'Drive to {dropoff_location}', 'distance': distance_meters * 0.6, 'time': time_seconds * 0.6 * 1000}
-                ],
-                'waypoints': [],
-                'error': str(e)
-            }
+            logger.error(f"Geocoding error for {location_string}: {e}")
+            return await self._aoffline_geocode(location_string), False
 
-    def _calculate_mock_distance(self, current, pickup, dropoff):
-        """Calculate rough distance based on location names"""
-        # Simple heuristic based on common routes
-        route_distances = {
-            ('Atlanta', 'Charlotte', 'Jacksonville'): 600,
-            ('Chicago', 'Denver', 'Los Angeles'): 2400,
-            ('New York', 'Seattle', 'Los Angeles'): 4800,
-            ('Dallas', 'Houston', 'San Antonio'): 500,
-            ('Miami', 'Tampa', 'Orlando'): 400
-        }
-        
-        # Try to match route pattern
-        route_key = tuple([self._extract_city(current), self._extract_city(pickup), self._extract_city(dropoff)])
-        
-        for pattern, distance in route_distances.items():
-            if all(city in str(route_key) for city in pattern):
-                return distance
-        
-        # Default fallback
-        return 800  # 800 km default
+    async def _aoffline_geocode(self, location_string):
+        # The gazetteer loads on first use and fuzzy-matches names: both are CPU-bound
+        return await sync_to_async(self._offline_geocode, thread_sensitive=False)(location_string)
+
+    async def calculate_route(self, current_location, pickup_location, dropoff_location, use_cache=True):
+        """Calculate optimized route through all points"""
+        deadline = getattr(settings, 'ROUTE_REQUEST_DEADLINE', 40)
+
+        try:
+            return await asyncio.wait_for(
+                self._calculate_route(
+                    get_async_client(self.transport), current_location, pickup_location, dropoff_location, use_cache
+                ),
+                timeout=deadline
+            )
+        except Exception as e:
+            # The estimate may geocode offline, so it runs off the event loop too
+            return await sync_to_async(self._fallback_route, thread_sensitive=False)(
+                current_location, pickup_location, dropoff_location, e
+            )
+
+    async def _calculate_route(self, client, current_location, pickup_location, dropoff_location, use_cache):
+        with timed('geocode'):
+            current, pickup, dropoff = await asyncio.gather(
+                self.ageocode_location(current_location, client),
+                self.ageocode_location(pickup_location, client),
+                self.ageocode_location(dropoff_location, client)
+            )
+
+        if not all([current, pickup, dropoff]):
+            raise ValueError("Could not geocode one or more locations")
 
-    def _extract_city(self, location_string):
-        """Extract city name from location string"""
-        return location_string.split(',')[0].strip()
+        waypoints = self._build_waypoints(current, pickup, dropoff)
+
+        # The route cache and the estimator are synchronous and lock-guarded: a contended lock there
+        # would stall every request on the event loop, so calls into them run on a worker thread
+        with timed('route'):
+            path = None
+            if use_cache:
+                path = await sync_to_async(route_cache.get, thread_sensitive=False)([current, pickup, dropoff])
+            if path is None:
+                if self._routing_engine() == 'local':
+                    # Graph search is CPU-bound: keep it off the event loop
+                    path = await sync_to_async(self._local_path, thread_sensitive=False)(current, pickup, dropoff)
+                else:
+                    try:
+                        response = await self._aget(client, 'route', self._route_params(waypoints), 30)
+                        # Parsing a large route is CPU-bound too
+                        path = await sync_to_async(self._parse_route_response, thread_sensitive=False)(response.content)
+                        await sync_to_async(self._observe, thread_sensitive=False)(current, pickup, dropoff, path)
+                    except Exception as e:
+                        path = await sync_to_async(self._local_fallback_path, thread_sensitive=False)(
+                            current, pickup, dropoff, e
+                        )
+                        return self._build_route_result(path, waypoints, current, pickup, dropoff)
+                await sync_to_async(route_cache.set, thread_sensitive=False)([current, pickup, dropoff], path)
+
+        return self._build_route_result(path, waypoints, current, pickup, dropoff)
 
 class HOSComplianceCalculator:
     def __init__(self):
@@ -191,20 +597,25 @@ class HOSComplianceCalculator:
         # Add pickup and dropoff time 
         total_on_duty_time = driving_time_hours + (2 * self.PICKUP_DROPOFF_TIME)
         
-        # Calculate fuel stops (every 1000 miles)
-        fuel_stops_needed = max(0, math.ceil(distance_miles / 1000) - 1)
+        # Walk the route's instructions to place breaks, resets and fuel stops (every 1000 miles),
+        # each at a real truck stop or rest area just before where it falls due
+        profile = RouteProfile(route_data)
+        stop_plan = SegmentHOSScheduler().plan_stops(route_data, profile, StopPlacer(profile))
+        fuel_stops_needed = sum(1 for stop in stop_plan if stop['type'] == 'fuel')
         fuel_stop_time = fuel_stops_needed * 0.5  # 30 minutes per fuel stop
         total_on_duty_time += fuel_stop_time
         
-        # Check if 30-minute break is required
-        required_breaks = []
-        if driving_time_hours > self.REQUIRED_BREAK_AFTER_HOURS:
-            required_breaks.append({
+        # 30-minute breaks, at the point on the route where each one falls due
+        required_breaks = [
+            {
                 'type': 'required_break',
                 'duration': self.REQUIRED_BREAK_DURATION,
-                'after_driving_hours': self.REQUIRED_BREAK_AFTER_HOURS,
-                'location': 'Rest Area'
-            })
+                'after_driving_hours': stop['driving_hours'],
+                'location': stop.get('location') or stop['street_name'] or 'Rest Area',
+                'lat': stop['lat'],
+                'lng': stop['lng']
+            } for stop in stop_plan if stop['type'] == 'break'
+        ]
         
         # Check compliance
         compliance_issues = []
@@ -232,6 +643,49 @@ class HOSComplianceCalculator:
             'distance_miles': distance_miles,
             'fuel_stops_needed': fuel_stops_needed,
             'required_breaks': required_breaks,
+            'stop_plan': stop_plan,
             'projected_cycle_hours': projected_cycle_hours,
             'requires_multi_day': requires_multi_day
         }
+
+
+class RouteGeometryService:
+    """Keeps a plan's routed path and turn-by-turn steps so it can be replayed or audited later"""
+
+    def build(self, route, route_data):
+        """Unsaved (RouteGeometry, [RouteStep, ...]) for a route and the route data it was planned from"""
+        points = route_data.get('points')
+        coords = route_points(points)
+        # GraphHopper and the local engine already send precision-5 polylines; store those untouched
+        encoded = points if isinstance(points, str) else encode_polyline(coords)
+        geometry = RouteGeometry(
+            route=route,
+            engine=route_data.get('engine', 'graphhopper'),
+            encoded_points=encoded,
+            point_count=len(coords),
+            distance_meters=route_data['distance_meters'],
+            time_seconds=route_data['time_seconds']
+        )
+
+        instructions = route_data.get('instructions') or []
+        # Each step is pinned to the first point of its interval
+        first_points = [(step.get('interval') or (None,))[0] for step in instructions]
+        steps = []
+        for order, (step, first) in enumerate(zip(instructions, first_points)):
+            located = first is not None and 0 <= first < len(coords)
+            steps.append(RouteStep(
+                route=route,
+                step_order=order,
+                instruction=step.get('text', ''),
+                distance_meters=step.get('distance', 0),
+                duration_seconds=step.get('time', 0) / 1000,
+                latitude=float(coords[first, 0]) if located else None,
+                longitude=float(coords[first, 1]) if located else None
+            ))
+        return geometry, steps
+
+    def save(self, records):
+        """Persist built (RouteGeometry, steps) pairs with two bulk inserts inside one transaction"""
+        with transaction.atomic(savepoint=False):
+            RouteGeometry.objects.bulk_create([geometry for geometry, _ in records])
+            RouteStep.objects.bulk_create([step for _, steps in records for step in steps])
@@ -1,3 +1,1551 @@
-from django.test import TestCase
+import asyncio
+import base64
+import heapq
+import io
+import json
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, time as dt_time, timedelta
+from pathlib import Path
+from unittest import mock, skipIf
+from xml.etree import ElementTree
 
-# Create your tests here.
+import httpx
+import numpy as np
+import requests
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from eld_logs.models import DailyLog
+from eld_logs.services import ELDLogGeneratorService
+from eld_logs.timeline import build_timeline
+from . import jobs, loadtest
+from .benchmarks import BenchmarkSuite, compare, measure, synthetic_route
+from .cache import GeocodeCache, LRUCache, geocode_cache, normalize_location, route_cache
+from .estimator import RouteEstimator, route_estimator, route_legs
+from .fake_graphhopper import FakeGraphHopper, load_recordings
+from .gazetteer import Gazetteer, get_gazetteer
+from .geo import decode_polyline, encode_polyline, simplify_polyline, zoom_tolerance_m
+from .graph import RoadGraph, build_road_graph_from_csv
+from .metrics import registry as metrics_registry
+from .models import GeocodeCacheEntry, PlanJob, Route, RouteGeometry, RouteStep
+from .parsing import ijson, parse_route_document
+from .pois import StopPlacer, TruckStopIndex
+from .profiling import RequestProfile, outbound
+from .scheduler import RouteProfile, SegmentHOSScheduler
+from .services import AsyncRouteCalculationService, HOSComplianceCalculator, RouteCalculationService
+from .upstream import CircuitBreaker, graphhopper_breaker
+
+SAMPLE_ROADS = Path(__file__).resolve().parent / 'data' / 'sample_roads'
+ATLANTA = {'lat': 33.749, 'lng': -84.388, 'name': 'Atlanta, GA'}
+CHARLOTTE = {'lat': 35.2271, 'lng': -80.8431, 'name': 'Charlotte, NC'}
+JACKSONVILLE = {'lat': 30.3322, 'lng': -81.6557, 'name': 'Jacksonville, FL'}
+
+
+def _route_data(driving_hours):
+    """Route as RouteCalculationService would return it, at ~55 mph"""
+    return {
+        'distance_meters': driving_hours * 55 * 1609.34,
+        'time_seconds': driving_hours * 3600,
+        'instructions': [
+            {'text': 'Continue onto I-85', 'distance': driving_hours * 55 * 1609.34, 'time': driving_hours * 3.6e6,
+             'interval': [0, 2]},
+            {'text': 'Arrive at destination', 'distance': 0, 'time': 0, 'interval': [2, 2]},
+        ],
+        'points': encode_polyline([[33.749, -84.388], [35.2271, -80.8431], [30.3322, -81.6557]]),
+        'waypoints': ['33.749,-84.388', '35.2271,-80.8431', '30.3322,-81.6557'],
+    }
+
+
+class CalculateRouteQueryBudgetTests(TestCase):
+    """The calculate-route response must be served without re-reading the logs it just wrote"""
+
+    # SAVEPOINT, INSERT route, INSERT geometry, bulk INSERT steps, bulk INSERT logs,
+    # bulk INSERT entries, RELEASE
+    QUERY_BUDGET = 7
+
+    def _post(self, driving_hours, query_budget=QUERY_BUDGET, preview=False):
+        payload = {
+            'current_location': 'Atlanta, GA',
+            'pickup_location': 'Charlotte, NC',
+            'dropoff_location': 'Jacksonville, FL',
+            'current_cycle_hours': 0,
+        }
+        with mock.patch(
+            'routes.views.RouteCalculationService.calculate_route',
+            return_value=_route_data(driving_hours)
+        ):
+            with self.assertNumQueries(query_budget):
+                response = self.client.post(
+                    reverse('calculate-route') + ('?preview=true' if preview else ''),
+                    payload, content_type='application/json'
+                )
+
+        self.assertEqual(response.status_code, 200 if preview else 201)
+        return response.json()
+
+    def test_single_day_trip(self):
+        data = self._post(driving_hours=6)
+
+        self.assertEqual(len(data['daily_logs']), 1)
+        self.assertTrue(data['daily_logs'][0]['entries'])
+
+    def test_multi_day_trips_share_the_same_budget(self):
+        for driving_hours, days in ((20, 2), (60, 6), (110, 10)):
+            with self.subTest(driving_hours=driving_hours):
+                data = self._post(driving_hours)
+
+                self.assertEqual(len(data['daily_logs']), days)
+                for log in data['daily_logs']:
+                    self.assertIsNotNone(log['id'])
+                    self.assertTrue(log['entries'])
+
+    def test_preview_returns_the_plan_without_writing(self):
+        data = self._post(driving_hours=30, query_budget=0, preview=True)
+
+        self.assertTrue(data['preview'])
+        self.assertIsNone(data['route_id'])
+        self.assertEqual(len(data['daily_logs']), 3)
+        self.assertTrue(all(log['entries'] for log in data['daily_logs']))
+        self.assertFalse(Route.objects.exists())
+        self.assertFalse(DailyLog.objects.exists())
+
+    def test_geometry_is_stored_and_served_encoded(self):
+        route_id = self._post(driving_hours=6)['route_id']
+
+        with self.assertNumQueries(2):
+            data = self.client.get(reverse('route-geometry', args=[route_id])).json()
+        self.assertEqual(data['points'], _route_data(6)['points'])
+        self.assertEqual(data['point_count'], 3)
+        self.assertEqual([step['instruction'] for step in data['steps']], ['Continue onto I-85', 'Arrive at destination'])
+        self.assertEqual((data['steps'][1]['latitude'], data['steps'][1]['longitude']), (30.3322, -81.6557))
+
+        decoded = self.client.get(reverse('route-geometry', args=[route_id]) + '?decoded=true').json()
+        self.assertEqual(decoded['points'][0], [33.749, -84.388])
+        self.assertEqual(self.client.get(reverse('route-geometry', args=[route_id + 1])).status_code, 404)
+
+    def test_geometry_level_of_detail(self):
+        route_id = self._post(driving_hours=6)['route_id']
+        url = reverse('route-geometry', args=[route_id])
+
+        # At zoom 1 a pixel spans ~40 km, so the Charlotte corner (hundreds of km off the chord) survives
+        coarse = self.client.get(url + '?zoom=1').json()
+        self.assertEqual(coarse['point_count'], 3)
+        straight = self.client.get(url + '?tolerance=1000000').json()
+        self.assertEqual(straight['point_count'], 2)
+        self.assertEqual(self.client.get(url + '?zoom=40').status_code, 400)
+        self.assertEqual(self.client.get(url + '?tolerance=abc').status_code, 400)
+
+    def test_stage_timings_in_server_timing_and_metrics(self):
+        metrics_registry.clear()
+        payload = {
+            'current_location': 'Atlanta, GA',
+            'pickup_location': 'Charlotte, NC',
+            'dropoff_location': 'Jacksonville, FL',
+            'current_cycle_hours': 0,
+        }
+        with mock.patch(
+            'routes.views.RouteCalculationService.calculate_route', return_value=_route_data(20)
+        ), mock.patch('routes.views.RouteCalculationService._offline_geocode', return_value=None):
+            response = self.client.post(reverse('calculate-route'), payload, content_type='application/json')
+            # An unplaceable trip falls back to the rough estimate
+            RouteCalculationService()._fallback_route('Nowhere', 'Nowhere', 'Nowhere', ValueError('no route'))
+
+        stages = [part.split(';')[0] for part in response['Server-Timing'].split(', ')]
+        self.assertEqual(stages, ['hos', 'logs', 'db', 'response', 'total'])
+        self.assertNotIn('Server-Timing', self.client.get(reverse('route-list')))
+
+        text = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('eld_stage_duration_seconds_count{stage="db"} 1', text)
+        self.assertIn('eld_stage_duration_seconds_bucket{stage="total",le="+Inf"} 1', text)
+        self.assertIn('eld_stage_latency_seconds{stage="hos",quantile="0.99"}', text)
+        self.assertIn('eld_route_fallbacks_total{engine="estimate"} 1', text)
+
+
+class BatchPlanningTests(TestCase):
+    """POST /api/calculate-route/batch/ with the upstream calls mocked at the service boundary"""
+
+    PLACES = {'atlanta, ga': ATLANTA, 'charlotte, nc': CHARLOTTE, 'jacksonville, fl': JACKSONVILLE}
+
+    def setUp(self):
+        geocode_cache.clear()
+        route_cache.clear()
+
+    def _trip(self, current='Atlanta, GA', pickup='Charlotte, NC', dropoff='Jacksonville, FL', cycle_hours=0):
+        return {'current_location': current, 'pickup_location': pickup, 'dropoff_location': dropoff,
+                'current_cycle_hours': cycle_hours}
+
+    def _post(self, trips, route_path=None):
+        def fetch_geocode(location, timeout):
+            coords = self.PLACES.get(normalize_location(location))
+            return (dict(coords), True) if coords else (None, False)
+
+        route = {key: value for key, value in _route_data(20).items() if key != 'waypoints'}
+        with mock.patch.object(RouteCalculationService, '_fetch_geocode', side_effect=fetch_geocode) as geocodes, \
+                mock.patch.object(RouteCalculationService, '_route_path',
+                                  side_effect=route_path or (lambda *args: dict(route, engine='graphhopper'))) as routes:
+            response = self.client.post(reverse('calculate-route-batch'), {'trips': trips}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json(), geocodes, routes
+
+    def test_shared_locations_and_lanes_are_resolved_once_and_failures_stay_per_trip(self):
+        trips = [
+            self._trip(),
+            self._trip(current='  atlanta,  GA '),
+            self._trip(pickup='Jacksonville, FL', dropoff='Charlotte, NC', cycle_hours=30),
+            self._trip(current='Nowhere, ZZ'),
+            {'current_location': 'Atlanta, GA'},
+        ]
+        with mock.patch.object(RouteCalculationService, '_offline_geocode', return_value=None):
+            data, geocodes, routes = self._post(trips)
+
+        self.assertEqual(geocodes.call_count, 4)
+        self.assertEqual(routes.call_count, 2)
+        self.assertEqual(data['summary'], {'trips': 5, 'succeeded': 4, 'failed': 1})
+        results = data['results']
+        self.assertEqual([result['index'] for result in results], [0, 1, 2, 3, 4])
+        self.assertEqual([result['status'] for result in results], [201, 201, 201, 201, 400])
+        self.assertIn('pickup_location', results[4]['errors'])
+        # An unplaceable trip still gets a plan, on the rough estimate
+        self.assertEqual(results[3]['route_data']['engine'], 'estimate')
+        self.assertEqual(Route.objects.count(), 4)
+
+    def test_planning_failure_of_one_trip_does_not_fail_the_rest(self):
+        calculate = HOSComplianceCalculator.calculate_compliance
+
+        def failing(calculator, route_data, cycle_hours):
+            if cycle_hours == 13:
+                raise ValueError('bad cycle')
+            return calculate(calculator, route_data, cycle_hours)
+
+        with mock.patch.object(HOSComplianceCalculator, 'calculate_compliance', failing):
+            data, _, _ = self._post([self._trip(), self._trip(cycle_hours=13)])
+
+        self.assertEqual([result['status'] for result in data['results']], [201, 500])
+        self.assertIn('bad cycle', data['results'][1]['error'])
+        self.assertEqual(Route.objects.count(), 1)
+
+    def test_plans_are_written_in_one_transaction_whatever_the_batch_size(self):
+        for coords in self.PLACES.values():
+            geocode_cache.memory.set(normalize_location(coords['name']), coords)
+
+        # SAVEPOINT, then one bulk INSERT each for routes, geometry, steps, logs and entries, RELEASE
+        for size in (1, 4):
+            with self.subTest(size=size), self.assertNumQueries(7):
+                data, _, _ = self._post([self._trip(cycle_hours=cycle) for cycle in range(size)])
+            self.assertEqual(data['summary']['succeeded'], size)
+
+    @override_settings(ROUTE_BATCH_DEADLINE=0.3)
+    def test_lanes_past_the_batch_deadline_fall_back(self):
+        def route_path(current, pickup, dropoff, timeout, use_cache):
+            if pickup['name'] == 'Jacksonville, FL':
+                time.sleep(1)
+            return dict(_route_data(20), engine='graphhopper')
+
+        data, _, _ = self._post(
+            [self._trip(), self._trip(pickup='Jacksonville, FL', dropoff='Charlotte, NC')], route_path=route_path
+        )
+
+        self.assertEqual([result['status'] for result in data['results']], [201, 201])
+        self.assertEqual([result['route_data']['engine'] for result in data['results']], ['graphhopper', 'estimate'])
+
+    @override_settings(ROUTE_BATCH_MAX_TRIPS=2)
+    def test_rejects_empty_and_oversized_batches(self):
+        url = reverse('calculate-route-batch')
+        for body in ({'trips': []}, {'trips': [self._trip()] * 3}, [self._trip()]):
+            with self.subTest(body=body):
+                self.assertEqual(self.client.post(url, body, content_type='application/json').status_code, 400)
+
+
+class ConcurrentGeocodingTests(TestCase):
+    """_geocode_concurrently against the sequential geocode_location path"""
+
+    def setUp(self):
+        geocode_cache.clear()
+        self.service = RouteCalculationService()
+
+    def _fetch(self, location, timeout):
+        coords = BatchPlanningTests.PLACES.get(normalize_location(location))
+        return (dict(coords), True) if coords else (self.service._offline_geocode(location), False)
+
+    def test_matches_the_sequential_path(self):
+        # An upstream hit, a repeat, a spelling variant, a gazetteer-only place and an unknown one
+        locations = ['Atlanta, GA', 'Charlotte, NC', 'Atlanta, GA', 'atlanta, georgia', 'Boise, ID', 'Nowhere, ZZ']
+        with mock.patch.object(self.service, '_fetch_geocode', side_effect=self._fetch):
+            concurrent = self.service._geocode_concurrently(locations, time.monotonic() + 10, strict=False)
+            geocode_cache.clear()
+            GeocodeCacheEntry.objects.all().delete()
+            sequential = [self.service.geocode_location(location) for location in locations]
+
+        self.assertEqual(concurrent, sequential)
+        self.assertEqual(concurrent[0], ATLANTA)
+        self.assertEqual(concurrent[4]['name'], self.service._offline_geocode('Boise, ID')['name'])
+        self.assertIsNone(concurrent[5])
+
+    def test_locations_pending_at_the_deadline(self):
+        def slow_charlotte(location, timeout):
+            if location.startswith('Charlotte'):
+                time.sleep(0.5)
+            return self._fetch(location, timeout)
+
+        locations = ['Atlanta, GA', 'Charlotte, NC']
+        # Loads the gazetteer up front, so the timing below is only the wait
+        charlotte = self.service._offline_geocode('Charlotte, NC')
+        with mock.patch.object(self.service, '_fetch_geocode', side_effect=slow_charlotte):
+            with self.assertRaises(TimeoutError):
+                self.service._geocode_concurrently(locations, time.monotonic() + 0.1)
+            geocode_cache.clear()
+            started = time.monotonic()
+            results = self.service._geocode_concurrently(locations, time.monotonic() + 0.1, strict=False)
+
+        self.assertLess(time.monotonic() - started, 0.4)
+        self.assertEqual(results, [ATLANTA, charlotte])
+
+    def test_nothing_is_sent_once_the_deadline_has_passed(self):
+        executor = mock.Mock()
+        with mock.patch('routes.services.get_upstream_executor', return_value=executor):
+            with self.assertRaises(TimeoutError):
+                self.service._geocode_concurrently(['Atlanta, GA'], time.monotonic() - 1)
+            results = self.service._geocode_concurrently(['Atlanta, GA'], time.monotonic() - 1, strict=False)
+
+        executor.submit.assert_not_called()
+        self.assertEqual(results, [self.service._offline_geocode('Atlanta, GA')])
+
+
+class AsyncCalculateRouteTests(TestCase):
+    """calculate-route-async against a mocked httpx transport standing in for GraphHopper"""
+
+    def setUp(self):
+        geocode_cache.clear()
+        route_cache.clear()
+        graphhopper_breaker.reset()
+        self.addCleanup(graphhopper_breaker.reset)
+        self.calls = []
+        self.route_status = 200
+        transport = mock.patch.object(AsyncRouteCalculationService, 'transport', httpx.MockTransport(self._graphhopper))
+        transport.start()
+        self.addCleanup(transport.stop)
+        observe = mock.patch.object(RouteCalculationService, '_observe')
+        observe.start()
+        self.addCleanup(observe.stop)
+
+    def _graphhopper(self, request):
+        endpoint = request.url.path.rsplit('/', 1)[-1]
+        self.calls.append(endpoint)
+        if endpoint == 'geocoding':
+            coords = BatchPlanningTests.PLACES.get(normalize_location(request.url.params['q']))
+            hits = [{'point': {'lat': coords['lat'], 'lng': coords['lng']}, 'name': coords['name']}] if coords else []
+            return httpx.Response(200, json={'hits': hits})
+
+        route = _route_data(20)
+        return httpx.Response(self.route_status, json={'paths': [{
+            'distance': route['distance_meters'], 'time': route['time_seconds'] * 1000, 'points_encoded': True,
+            'points': route['points'], 'instructions': route['instructions'],
+        }]})
+
+    async def _post(self):
+        response = await self.async_client.post(
+            reverse('calculate-route-async'), PlanJobTests.PAYLOAD, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    async def test_plans_through_graphhopper_then_serves_repeats_from_cache(self):
+        data = await self._post()
+
+        self.assertEqual(sorted(self.calls), ['geocoding', 'geocoding', 'geocoding', 'route'])
+        self.assertEqual(data['route_data']['engine'], 'graphhopper')
+        self.assertEqual(data['route_data']['waypoints'], _route_data(20)['waypoints'])
+        self.assertEqual(len(data['daily_logs']), 2)
+        self.assertEqual(await Route.objects.acount(), 1)
+
+        await self._post()
+        self.assertEqual(len(self.calls), 4)
+        self.assertEqual(await Route.objects.acount(), 2)
+
+    async def test_blocking_work_stays_off_the_event_loop(self):
+        on_loop = {}
+
+        def record(name, original):
+            def call(*args, **kwargs):
+                try:
+                    asyncio.get_running_loop()
+                    on_loop[name] = True
+                except RuntimeError:
+                    on_loop.setdefault(name, False)
+                return original(*args, **kwargs)
+            return call
+
+        patches = [
+            mock.patch.object(HOSComplianceCalculator, 'calculate_compliance',
+                              record('hos', HOSComplianceCalculator.calculate_compliance)),
+            mock.patch.object(ELDLogGeneratorService, 'build_daily_logs',
+                              record('logs', ELDLogGeneratorService.build_daily_logs)),
+            mock.patch.object(route_cache, 'get', record('cache_get', route_cache.get)),
+            mock.patch.object(route_cache, 'set', record('cache_set', route_cache.set)),
+            mock.patch.object(RouteCalculationService, '_observe', record('observe', lambda *args: None)),
+            mock.patch.object(RouteCalculationService, '_offline_geocode',
+                              record('offline_geocode', RouteCalculationService._offline_geocode)),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        # Unknown to the stand-in geocoder, so it goes to the gazetteer
+        with mock.patch.dict(BatchPlanningTests.PLACES, {'atlanta, ga': None}):
+            await self._post()
+
+        self.assertEqual(on_loop, dict.fromkeys(
+            ('hos', 'logs', 'cache_get', 'cache_set', 'observe', 'offline_geocode'), False
+        ))
+
+    async def test_upstream_route_errors_fall_back(self):
+        self.route_status = 503
+        data = await self._post()
+
+        self.assertEqual(data['route_data']['engine'], 'local')
+        self.assertEqual(route_cache.stats()['entries'], 0)
+
+
+class RouteResultCacheTests(TestCase):
+    """GraphHopper routes cached on geohash-snapped waypoints"""
+
+    def setUp(self):
+        route_cache.clear()
+        graphhopper_breaker.reset()
+        observe = mock.patch.object(RouteCalculationService, '_observe')
+        observe.start()
+        self.addCleanup(observe.stop)
+
+    def _graphhopper_route(self, *args, **kwargs):
+        route = _route_data(20)
+        body = json.dumps({'paths': [{
+            'distance': route['distance_meters'], 'time': route['time_seconds'] * 1000, 'points_encoded': True,
+            'points': route['points'], 'instructions': route['instructions'],
+        }]}).encode()
+        response = requests.Response()
+        response.status_code = 200
+        response.raw = io.BytesIO(body)
+        response.headers['Content-Length'] = str(len(body))
+        return response
+
+    def _nudged(self, point, meters):
+        # ~111 km per degree of latitude
+        return dict(point, lat=point['lat'] + meters / 111000)
+
+    def _calculate(self, points, use_cache=True):
+        service = RouteCalculationService()
+        with mock.patch.object(service, '_geocode_concurrently', return_value=points):
+            return service.calculate_route('Atlanta, GA', 'Charlotte, NC', 'Jacksonville, FL', use_cache=use_cache)
+
+    def test_nearby_waypoints_share_one_geohash_cell(self):
+        points = [ATLANTA, CHARLOTTE, JACKSONVILLE]
+        nearby = [self._nudged(point, 100) for point in points]
+        self.assertEqual(route_cache.key_for(nearby), route_cache.key_for(points))
+        self.assertNotEqual(route_cache.key_for([self._nudged(ATLANTA, 20000), CHARLOTTE, JACKSONVILLE]),
+                            route_cache.key_for(points))
+
+        hits = route_cache.stats()['hits']
+        with mock.patch.object(RouteCalculationService, '_get', side_effect=self._graphhopper_route) as upstream:
+            first = self._calculate(points)
+            second = self._calculate(nearby)
+
+        self.assertEqual(upstream.call_count, 1)
+        self.assertEqual(second['distance_meters'], first['distance_meters'])
+        # Each request still reports its own geocodes
+        self.assertEqual(second['geocoded_locations']['current'], nearby[0])
+        self.assertEqual(route_cache.stats()['hits'], hits + 1)
+
+    def test_responses_do_not_share_the_cached_instructions(self):
+        points = [ATLANTA, CHARLOTTE, JACKSONVILLE]
+        with mock.patch.object(RouteCalculationService, '_get', side_effect=self._graphhopper_route):
+            first = self._calculate(points)
+            first['instructions'][0]['text'] = 'Changed'
+            first['instructions'].append({'text': 'Extra'})
+            second = self._calculate(points)
+
+        self.assertEqual([step['text'] for step in second['instructions']], ['Continue onto I-85', 'Arrive at destination'])
+
+    def test_no_cache_requests_bypass_the_route_cache(self):
+        with mock.patch.object(RouteCalculationService, '_geocode_concurrently',
+                               return_value=[ATLANTA, CHARLOTTE, JACKSONVILLE]), \
+                mock.patch.object(RouteCalculationService, '_get', side_effect=self._graphhopper_route) as upstream:
+            for cache_control, calls in (('no-cache', 1), ('max-age=0, No-Cache', 2), ('', 2)):
+                with self.subTest(cache_control=cache_control):
+                    response = self.client.post(
+                        reverse('calculate-route'), PlanJobTests.PAYLOAD, content_type='application/json',
+                        HTTP_CACHE_CONTROL=cache_control
+                    )
+                    self.assertEqual(response.status_code, 201)
+                    self.assertEqual(response.json()['route_data']['engine'], 'graphhopper')
+                    self.assertEqual(upstream.call_count, calls)
+
+
+class SimplifyPolylineTests(SimpleTestCase):
+    def test_drops_vertices_within_tolerance(self):
+        rng = np.random.default_rng(7)
+        # 2,000 points along 35N with ~10 m of jitter, then a sharp turn north
+        east = np.column_stack((35 + rng.normal(0, 1e-4, 2000), np.linspace(-100, -95, 2000)))
+        north = np.column_stack((np.linspace(35, 37, 500), np.full(500, -95.0)))
+        points = np.vstack((east, north))
+
+        simplified = simplify_polyline(points, zoom_tolerance_m(10))
+        self.assertLess(len(simplified), 20)
+        np.testing.assert_array_equal(simplified[[0, -1]], points[[0, -1]])
+        # The corner is kept
+        self.assertTrue(np.any(np.hypot(simplified[:, 0] - 35, simplified[:, 1] + 95) < 0.01))
+        self.assertEqual(len(simplify_polyline(points, 0)), len(points))
+
+
+class PolylineDecodeTests(SimpleTestCase):
+    def test_decodes_the_reference_polyline(self):
+        # The example from Google's encoded polyline format documentation
+        np.testing.assert_allclose(
+            decode_polyline('_p~iF~ps|U_ulLnnqC_mqNvxq`@'), [[38.5, -120.2], [40.7, -120.95], [43.252, -126.453]]
+        )
+        self.assertEqual(decode_polyline('').shape, (0, 2))
+
+    def test_round_trips_encoded_points_and_drops_elevation(self):
+        rng = np.random.default_rng(3)
+        points = np.round(np.column_stack((rng.uniform(-80, 80, 500), rng.uniform(-179, 179, 500))), 5)
+        np.testing.assert_allclose(decode_polyline(encode_polyline(points)), points, atol=1e-9)
+
+        # GraphHopper's 3D polylines interleave an elevation delta after each point's lat/lng deltas
+        points_3d = [[38.5, -120.2, 320.0], [40.7, -120.95, 290.5], [43.252, -126.453, 12.25]]
+        encoded = ''
+        for value in np.diff(np.round(np.array(points_3d) * 1e5).astype(int), axis=0, prepend=0).ravel():
+            value = ~(value << 1) if value < 0 else value << 1
+            while value >= 0x20:
+                encoded += chr((0x20 | (value & 0x1f)) + 63)
+                value >>= 5
+            encoded += chr(value + 63)
+        np.testing.assert_allclose(
+            decode_polyline(encoded, with_elevation=True), [point[:2] for point in points_3d]
+        )
+
+
+class SegmentHOSSchedulerTests(SimpleTestCase):
+    """Stops on straight 50 mph synthetic routes, where driving hour h sits at fraction h / total of the line"""
+
+    MPH = 50
+
+    def _route(self, hours):
+        return synthetic_route(distance_km=hours * self.MPH * 1.60934, steps=100, points=1001, mph=self.MPH)
+
+    def _plan(self, hours, scheduler=None):
+        return (scheduler or SegmentHOSScheduler()).plan_stops(self._route(hours))
+
+    def test_short_trip_needs_no_stops(self):
+        self.assertEqual(self._plan(7.5), [])
+
+    def test_breaks_resets_and_fuel_stops(self):
+        stops = self._plan(25)
+
+        # Break after 8 h driving, reset at 11 h; the next 1,000 miles (hour 20) refuels after a break at 19 h,
+        # then the second shift's 11 h runs out at 22 h
+        self.assertEqual(
+            [(stop['type'], stop['driving_hours']) for stop in stops],
+            [('break', 8.0), ('rest', 11.0), ('break', 19.0), ('fuel', 20.0), ('rest', 22.0)]
+        )
+        self.assertEqual([stop['duration_hours'] for stop in stops], [0.5, 10, 0.5, 0.5, 10])
+        self.assertEqual([stop['miles'] for stop in stops], [400.0, 550.0, 950.0, 1000.0, 1100.0])
+
+    def test_fuel_stop_counts_as_the_break(self):
+        # At 125 mph the 1,000-mile fuel stop comes at hour 8, where the break is due: one stop, not two
+        self.MPH = 125
+        stops = self._plan(10)
+        self.assertEqual([(stop['type'], stop['driving_hours']) for stop in stops], [('fuel', 8.0)])
+
+    def test_fourteen_hour_window_forces_the_reset(self):
+        scheduler = SegmentHOSScheduler()
+        # A long pickup leaves only 14 - 4 - 0.5 = 9.5 h of window after the first break
+        scheduler.PICKUP_DROPOFF_TIME = 4.0
+        stops = self._plan(12, scheduler)
+
+        self.assertEqual([(stop['type'], stop['driving_hours']) for stop in stops], [('break', 8.0), ('rest', 9.5)])
+
+    def test_stops_are_placed_along_the_path(self):
+        start, end = np.array([30.0, -120.0]), np.array([45.0, -75.0])
+        total = 25
+        for stop in self._plan(total):
+            with self.subTest(stop=stop['type'], hours=stop['driving_hours']):
+                expected = start + (end - start) * stop['driving_hours'] / total
+                self.assertAlmostEqual(stop['lat'], expected[0], delta=1e-3)
+                self.assertAlmostEqual(stop['lng'], expected[1], delta=1e-3)
+                self.assertEqual(stop['instruction_index'], int(stop['driving_hours'] / total * 100))
+
+    def test_route_without_instructions_is_one_step(self):
+        profile = RouteProfile({'distance_meters': 1000 * 1609.34, 'time_seconds': 20 * 3600})
+
+        self.assertAlmostEqual(profile.total_miles, 1000)
+        [position] = profile.locate(10)
+        self.assertEqual((position['miles'], position['lat'], position['instruction_index']), (500.0, None, 0))
+
+
+class ReadApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.routes = [
+            Route.objects.create(
+                current_location='Atlanta, GA', pickup_location=f'Stop {i}', dropoff_location='Jacksonville, FL',
+                current_cycle_hours=i
+            ) for i in range(5)
+        ]
+
+    def test_keyset_pages_walk_every_route_newest_first(self):
+        seen, cursor = [], ''
+        while True:
+            with self.assertNumQueries(1):
+                data = self.client.get(reverse('route-list'), {'limit': 2, 'cursor': cursor}).json()
+            seen += [route['id'] for route in data['results']]
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+
+        self.assertEqual(seen, [route.id for route in reversed(self.routes)])
+        self.assertNotIn('steps', data['results'][0])
+        self.assertEqual(self.client.get(reverse('route-list'), {'cursor': 'not-a-cursor'}).status_code, 400)
+
+    def test_well_formed_cursor_with_a_bad_value_is_rejected(self):
+        cursor = base64.urlsafe_b64encode(b'garbage|5').decode()
+        for url in (reverse('route-list'), reverse('route-daily-logs', args=[self.routes[0].id])):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url, {'cursor': cursor}).status_code, 400)
+
+    def test_conditional_requests_return_304(self):
+        for url, queries in ((reverse('route-list'), 1), (reverse('route-detail', args=[self.routes[0].id]), 2)):
+            with self.subTest(url=url):
+                with self.assertNumQueries(queries):
+                    first = self.client.get(url)
+                self.assertEqual(first.status_code, 200)
+
+                again = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+                self.assertEqual(again.status_code, 304)
+                since = self.client.get(url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+                self.assertEqual(since.status_code, 304)
+
+        # A new route changes the first page
+        etag = self.client.get(reverse('route-list'))['ETag']
+        Route.objects.create(
+            current_location='Atlanta, GA', pickup_location='New', dropoff_location='Miami, FL', current_cycle_hours=0
+        )
+        self.assertEqual(self.client.get(reverse('route-list'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class PlanJobTests(TestCase):
+    PAYLOAD = {
+        'current_location': 'Atlanta, GA',
+        'pickup_location': 'Charlotte, NC',
+        'dropoff_location': 'Jacksonville, FL',
+        'current_cycle_hours': 0,
+    }
+
+    def _submit(self):
+        response = self.client.post(reverse('plan-job-submit'), self.PAYLOAD, content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        return response
+
+    def test_job_is_queued_then_planned_by_a_worker(self):
+        response = self._submit()
+        status_url = response['Location']
+        self.assertEqual(self.client.get(status_url).json()['status'], PlanJob.QUEUED)
+        self.assertFalse(Route.objects.exists())
+
+        with mock.patch('routes.views.RouteCalculationService.calculate_route', return_value=_route_data(20)):
+            self.assertTrue(jobs.run_next('test-worker'))
+        self.assertFalse(jobs.run_next('test-worker'))
+
+        data = self.client.get(status_url).json()
+        self.assertEqual(data['status'], PlanJob.SUCCEEDED)
+        self.assertEqual(data['result_status'], 201)
+        self.assertEqual(data['route_id'], Route.objects.get().id)
+        self.assertEqual(data['result']['route_id'], data['route_id'])
+        self.assertEqual(len(data['result']['daily_logs']), 2)
+
+    def test_failures_and_abandoned_leases(self):
+        self.assertEqual(self.client.post(reverse('plan-job-submit'), {}, content_type='application/json').status_code, 400)
+
+        self._submit()
+        with mock.patch('routes.views.RouteCalculationService.calculate_route', side_effect=RuntimeError('boom')):
+            jobs.run_next('test-worker')
+        failed = PlanJob.objects.get()
+        self.assertEqual((failed.status, failed.result_status), (PlanJob.FAILED, 500))
+
+        # A worker that died mid-job: once the lease runs out the job is claimed again, up to the attempt limit
+        job_id = self._submit().json()['job_id']
+        PlanJob.objects.filter(pk=job_id).update(
+            status=PlanJob.RUNNING, attempts=3, lease_expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        jobs.run_next('test-worker')
+        abandoned = PlanJob.objects.get(pk=job_id)
+        self.assertEqual((abandoned.status, abandoned.attempts), (PlanJob.FAILED, 4))
+        self.assertEqual(self.client.get(reverse('plan-job-status', args=[job_id])).json()['status'], PlanJob.FAILED)
+
+    def test_running_jobs_renew_their_lease(self):
+        job_id = self._submit().json()['job_id']
+        job = jobs.claim_next('test-worker')
+        PlanJob.objects.filter(pk=job_id).update(lease_expires_at=timezone.now() + timedelta(seconds=1))
+
+        self.assertTrue(jobs.renew(job))
+        lease = PlanJob.objects.get(pk=job_id).lease_expires_at
+        self.assertGreater(lease, timezone.now() + timedelta(seconds=290))
+        # Once another worker has reclaimed the job, this one can't extend it
+        PlanJob.objects.filter(pk=job_id).update(worker='other-worker')
+        self.assertFalse(jobs.renew(job))
+
+    @override_settings(PLAN_JOB_LEASE_SECONDS=0.3)
+    def test_heartbeat_renews_while_the_job_runs(self):
+        self._submit()
+        with mock.patch('routes.jobs.renew', return_value=True) as renew, \
+                mock.patch('routes.jobs.run_job', side_effect=lambda job: time.sleep(0.35)):
+            self.assertTrue(jobs.run_next('test-worker'))
+            beats = renew.call_count
+            time.sleep(0.25)
+
+        # Every 0.1 s while the plan ran, then no more
+        self.assertGreaterEqual(beats, 2)
+        self.assertEqual(renew.call_count, beats)
+
+
+class LRUCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        clock = mock.patch('routes.cache.time', mock.Mock(monotonic=lambda: self.now))
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def test_entries_expire_after_their_ttl(self):
+        cache = LRUCache(max_entries=10, ttl_seconds=60)
+        cache.set('a', 1)
+        cache.set('b', 2, ttl_seconds=600)
+
+        self.now += 59
+        self.assertEqual(cache.get('a'), 1)
+        self.now += 1
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('b'), 2)
+        self.assertEqual(len(cache), 1)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = LRUCache(max_entries=2, ttl_seconds=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c')), (1, 3))
+        self.assertEqual(cache.evictions, 1)
+
+
+class GeocodeCacheTests(TestCase):
+    def _entry(self, key, expires_in=timedelta(days=1), last_used_at=None):
+        now = timezone.now()
+        return GeocodeCacheEntry.objects.create(
+            key=key, latitude=1.0, longitude=2.0, name=key,
+            last_used_at=last_used_at or now, expires_at=now + expires_in
+        )
+
+    def test_keys_ignore_case_spacing_punctuation_state_spelling_and_country(self):
+        for location in ('Atlanta, GA', '  atlanta ,ga ', 'Atlanta, Georgia', 'Atlanta, Ga., USA', 'ATLANTA,  GA, US'):
+            with self.subTest(location=location):
+                self.assertEqual(normalize_location(location), 'atlanta, ga')
+        self.assertEqual(normalize_location('St. Louis, Missouri'), 'st louis, mo')
+        self.assertNotEqual(normalize_location('Portland, OR'), normalize_location('Portland, ME'))
+
+    def test_lone_names_are_not_read_as_states(self):
+        self.assertNotEqual(normalize_location('New York'), normalize_location('NY'))
+        self.assertEqual(normalize_location('Washington'), 'washington')
+        self.assertEqual(normalize_location('New York, New York'), 'new york, ny')
+
+    def test_reads_through_the_db_tier_and_counts_hits_and_misses(self):
+        writer = GeocodeCache()
+        self.assertIsNone(writer.get('Atlanta, GA'))
+        writer.set('Atlanta, GA', dict(ATLANTA))
+        with self.assertNumQueries(0):
+            self.assertEqual(writer.get('atlanta, georgia'), ATLANTA)
+
+        # Another process starts with an empty memory tier: one read (plus the hit count), then memory
+        reader = GeocodeCache()
+        with self.assertNumQueries(2):
+            self.assertEqual(reader.get('Atlanta, GA'), ATLANTA)
+        with self.assertNumQueries(0):
+            self.assertEqual(reader.get('Atlanta, GA'), ATLANTA)
+
+        self.assertEqual(GeocodeCacheEntry.objects.get(key='atlanta, ga').hits, 1)
+        self.assertEqual(
+            {name: writer.stats()[name] for name in ('memory_hits', 'db_hits', 'misses', 'stores')},
+            {'memory_hits': 1, 'db_hits': 0, 'misses': 1, 'stores': 1}
+        )
+        stats = reader.stats()
+        self.assertEqual((stats['memory_hits'], stats['db_hits'], stats['misses']), (1, 1, 0))
+        self.assertEqual(stats['hit_ratio'], 1.0)
+
+    def test_expired_db_rows_are_misses(self):
+        self._entry('atlanta, ga', expires_in=timedelta(seconds=-1))
+
+        cache = GeocodeCache()
+        self.assertIsNone(cache.get('Atlanta, GA'))
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_get_many_reads_the_db_tier_in_chunks(self):
+        cities = [f'City {i}, TX' for i in range(5)]
+        for city in cities:
+            self._entry(normalize_location(city))
+
+        cache = GeocodeCache()
+        cache.DB_CHUNK_SIZE = 2
+        # A SELECT and a hit-count UPDATE for each of the three chunks
+        with self.assertNumQueries(6):
+            found = cache.get_many(cities + ['city 0, texas', 'Nowhere, ZZ'])
+
+        self.assertEqual(set(found), set(cities) | {'city 0, texas'})
+        self.assertEqual(cache.stats()['db_hits'], 6)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_prune_drops_expired_then_least_recently_used_rows(self):
+        now = timezone.now()
+        self._entry('expired', expires_in=timedelta(seconds=-1))
+        for age, key in enumerate(('newest', 'newer', 'oldest')):
+            self._entry(key, last_used_at=now - timedelta(hours=age))
+
+        cache = GeocodeCache()
+        cache.db_max_entries = 2
+        cache.prune()
+
+        self.assertEqual(set(GeocodeCacheEntry.objects.values_list('key', flat=True)), {'newest', 'newer'})
+        self.assertEqual(cache.stats()['db_evictions'], 2)
+
+    def test_writes_prune_the_db_tier_periodically(self):
+        cache = GeocodeCache()
+        cache.PRUNE_EVERY = 3
+        cache.db_max_entries = 2
+        for i in range(3):
+            cache.set(f'City {i}, TX', {'lat': 1.0, 'lng': 2.0, 'name': f'City {i}'})
+            self.assertEqual(GeocodeCacheEntry.objects.count(), min(i + 1, 2))
+
+
+class GeocodeCacheWarmTests(TestCase):
+    def test_warm_loads_the_most_used_locations(self):
+        now = timezone.now()
+        for key, hits in (('atlanta, ga', 9), ('charlotte, nc', 5), ('boise, id', 1)):
+            GeocodeCacheEntry.objects.create(
+                key=key, latitude=1.0, longitude=2.0, name=key, hits=hits,
+                last_used_at=now, expires_at=now + timedelta(days=1)
+            )
+
+        cache = GeocodeCache()
+        self.assertEqual(cache.warm(limit=2), 2)
+        with self.assertNumQueries(0):
+            self.assertEqual(cache.get('Atlanta, GA')['name'], 'atlanta, ga')
+            self.assertEqual(cache.get('Charlotte, NC')['name'], 'charlotte, nc')
+        self.assertEqual(cache.stats()['memory_entries'], 2)
+
+
+class ProfilingMiddlewareTests(TestCase):
+    PAYLOAD = PlanJobTests.PAYLOAD
+
+    def setUp(self):
+        profile_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(profile_dir.cleanup)
+        self.profile_dir = Path(profile_dir.name)
+
+    def _post(self, **headers):
+        def slow_route(*args, **kwargs):
+            with outbound('http', 'graphhopper/route'):
+                time.sleep(0.05)
+            return _route_data(20)
+
+        with mock.patch('routes.views.RouteCalculationService.calculate_route', side_effect=slow_route):
+            return self.client.post(reverse('calculate-route'), self.PAYLOAD, content_type='application/json', **headers)
+
+    def test_requested_profiles_attribute_waits_and_rotate(self):
+        with self.settings(PROFILING_TOKEN='secret', PROFILING_DIR=self.profile_dir, PROFILING_MAX_FILES=2,
+                           PROFILING_INTERVAL=0.002):
+            self.assertNotIn('X-Profile-Id', self._post(HTTP_X_PROFILE='wrong'))
+            ids = [self._post(HTTP_X_PROFILE='secret')['X-Profile-Id'] for _ in range(3)]
+
+        endpoint_dir = self.profile_dir / 'calculate-route'
+        self.assertEqual(sorted(path.stem for path in endpoint_dir.glob('*.json')), sorted(ids[1:]))
+        summary = json.loads((endpoint_dir / f'{ids[-1]}.json').read_text())
+        self.assertEqual(summary['http']['count'], 1)
+        self.assertGreaterEqual(summary['http']['ms'], 50)
+        self.assertEqual(summary['sql']['count'], CalculateRouteQueryBudgetTests.QUERY_BUDGET)
+
+        folded = (endpoint_dir / f'{ids[-1]}.folded').read_text().splitlines()
+        waiting = [line for line in folded if line.rsplit(' ', 1)[0].endswith('[http graphhopper/route]')]
+        self.assertTrue(waiting)
+        self.assertTrue(all(int(line.rsplit(' ', 1)[1]) > 0 for line in folded))
+
+    def test_snapshots_are_safe_while_the_sampler_runs(self):
+        profile = RequestProfile(threading.get_ident())
+        frame = sys._getframe()
+        samples = 5000
+
+        def sampler():
+            for i in range(samples):
+                # A new waiting label each time, so every sample adds a key to the counter
+                profile.enter(f'[http {i}]')
+                profile.sample(frame)
+                profile.leave('http', f'[http {i}]', 0.0)
+
+        thread = threading.Thread(target=sampler)
+        thread.start()
+        while thread.is_alive():
+            self.assertLessEqual(sum(count for _, count in profile.snapshot().most_common()), samples)
+        thread.join()
+
+        self.assertEqual(sum(profile.snapshot().values()), samples)
+        self.assertEqual(profile.summary()['http']['count'], samples)
+
+    def test_cprofile_mode_and_sampling(self):
+        with self.settings(PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=1.0, PROFILING_MODE='cprofile',
+                           PROFILING_DIR=self.profile_dir):
+            profile_id = self._post()['X-Profile-Id']
+            self.assertNotIn('X-Profile-Id', self.client.get(reverse('route-list')))
+        self.assertTrue((self.profile_dir / 'calculate-route' / f'{profile_id}.prof').exists())
+
+
+class BenchmarkTests(TestCase):
+    """The GraphHopper stand-in and the benchmark harness behind `manage.py run_benchmarks`"""
+
+    def test_stand_in_replays_recordings_and_injects_failures(self):
+        # Replayed routes would otherwise refit the process-wide fallback estimator for later tests
+        with FakeGraphHopper(route_latency=0.01, seed=3) as fake, mock.patch('routes.services.route_estimator.observe'):
+            suite = BenchmarkSuite(fake, iterations=2, warmup=0, profile_iterations=1)
+            results = suite.run(['route_service', 'calculate_route_view'])
+            self.assertEqual(results['route_service']['engines'], {'graphhopper': 3})
+            self.assertGreaterEqual(results['calculate_route_view']['p50_ms'], 10)
+            self.assertEqual(results['calculate_route_view']['queries_per_op'], CalculateRouteQueryBudgetTests.QUERY_BUDGET)
+            self.assertEqual(fake.stats()['misses'], 0)
+
+            unknown = requests.get(f'{fake.url}/geocoding', params={'q': 'Nowhere, ZZ'}, timeout=5)
+            self.assertEqual(unknown.json()['hits'], [])
+            fake.failure_rate = 1.0
+            self.assertEqual(requests.get(f'{fake.url}/geocoding', params={'q': 'Boise, ID'}, timeout=5).status_code, 503)
+            fake.failure_mode = 'drop'
+            with self.assertRaises(requests.ConnectionError):
+                requests.get(f'{fake.url}/geocoding', params={'q': 'Boise, ID'}, timeout=5)
+            self.assertEqual(fake.stats()['failures'], 2)
+
+    def test_measure_and_compare_against_baseline(self):
+        def op(i):
+            # A query made on another thread still counts
+            thread = threading.Thread(target=lambda: list(Route.objects.all()[:1]))
+            thread.start()
+            thread.join()
+
+        result = measure(op, iterations=3, warmup=0, profile_iterations=2)
+        self.assertEqual(result['queries_per_op'], 1)
+        self.assertGreater(result['ops_per_s'], 0)
+
+        baseline = {'benchmarks': {'op': dict(result, p95_ms=result['p95_ms'] / 10, alloc_peak_kb=0)}}
+        regressions = compare({'op': dict(result, queries_per_op=2)}, baseline)
+        self.assertEqual([line.split()[1] for line in regressions], ['p95_ms', 'queries_per_op', 'alloc_peak_kb'])
+        self.assertEqual(len(compare({'op': result}, baseline, timings=False)), 1)
+
+
+class LoadTestTests(SimpleTestCase):
+    """The lane mix, response classification and charts behind `manage.py load_test`"""
+
+    def test_lane_mix_splits_recorded_lanes_by_driving_time(self):
+        lanes = loadtest.lane_mix(load_recordings())
+
+        self.assertIn(('Philadelphia, PA', 'Baltimore, MD', 'Richmond, VA'), lanes['short'])
+        self.assertIn(('Dallas, TX', 'Oklahoma City, OK', 'Denver, CO'), lanes['multi'])
+        self.assertEqual(len(lanes['unknown']), len(lanes['short']) + len(lanes['multi']))
+        self.assertIsNone(get_gazetteer().lookup(lanes['unknown'][0][0]))
+
+    def test_responses_are_classified_and_charted(self):
+        def response(status_code, body, server_timing=''):
+            return mock.Mock(status_code=status_code, content=body, headers={'Server-Timing': server_timing},
+                             json=lambda: json.loads(body))
+
+        plan = json.dumps({'route_data': {'engine': 'graphhopper'}}).encode()
+        answers = [
+            response(201, plan, 'hos;dur=1.0, db;dur=12.5, total;dur=80.0'),
+            response(500, b'{"error": "Route calculation failed: database is locked"}'),
+            response(500, b'{"error": "boom"}'),
+            response(400, b'{}'),
+        ]
+        generator = loadtest.LoadGenerator('http://testserver', {'short': [('A', 'B', 'C')]}, mix={'short': 1})
+        session = mock.Mock(post=mock.Mock(side_effect=answers + [requests.Timeout()]))
+        samples = [generator._plan(session, 'short', ('A', 'B', 'C'), 0) for _ in range(5)]
+
+        self.assertEqual(samples[0]['db_ms'], 12.5)
+        self.assertEqual(
+            [sample['error'] for sample in samples], [None, 'db_locked', 'server_error', 'client_error', 'timeout']
+        )
+        self.assertEqual(session.post.call_args.kwargs['headers'], {'Cache-Control': 'no-cache'})
+
+        step = loadtest.summarize(4, samples, elapsed=1.0)
+        self.assertEqual((step['plans_per_s'], step['error_rate'], step['db_locked_rate']), (1.0, 0.8, 0.2))
+        steps = [dict(step, concurrency=c, plans_per_s=t, error_rate=0) for c, t in ((1, 5), (2, 9), (4, 9.5))]
+        self.assertEqual(loadtest.saturation(steps)['concurrency'], 2)
+        svg = ElementTree.fromstring(loadtest.svg_chart(steps))
+        self.assertEqual(len(svg.findall('{http://www.w3.org/2000/svg}polyline')), 7)
+        self.assertIn('database is locked', loadtest.text_chart(steps))
+
+
+class RoadGraphTests(SimpleTestCase):
+    """Bidirectional A* on the bundled sample graph"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp = tempfile.TemporaryDirectory()
+        build_road_graph_from_csv(SAMPLE_ROADS / 'nodes.csv', SAMPLE_ROADS / 'edges.csv', cls.tmp.name)
+        cls.graph = RoadGraph(cls.tmp.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+        super().tearDownClass()
+
+    def _dijkstra(self, source, target):
+        """Plain one-directional Dijkstra as the reference answer"""
+        graph = self.graph
+        dist = {source: 0.0}
+        heap = [(0.0, source)]
+        while heap:
+            d, node = heapq.heappop(heap)
+            if node == target:
+                return d
+            if d > dist[node]:
+                continue
+            for edge in range(int(graph.offsets[node]), int(graph.offsets[node + 1])):
+                neighbour, candidate = int(graph.targets[edge]), d + float(graph.time_s[edge])
+                if candidate < dist.get(neighbour, float('inf')):
+                    dist[neighbour] = candidate
+                    heapq.heappush(heap, (candidate, neighbour))
+        return None
+
+    def test_arrays_are_memory_mapped(self):
+        for name in ('targets', 'time_s', 'lat'):
+            array = getattr(self.graph, name)
+            self.assertIsInstance(array.base, np.memmap)
+            self.assertFalse(array.flags.writeable)
+
+    def test_matches_dijkstra(self):
+        rng = np.random.default_rng(7)
+        for source, target in rng.integers(0, self.graph.node_count, size=(25, 2)).tolist():
+            with self.subTest(source=source, target=target):
+                seconds, edges, _ = self.graph.shortest_path(source, target)
+                self.assertAlmostEqual(seconds, self._dijkstra(source, target), delta=1e-3)
+                self.assertAlmostEqual(float(self.graph.time_s[edges].sum()), seconds, delta=1e-2)
+
+    def test_route_avoids_roads_closed_to_trucks(self):
+        route = self.graph.route([ATLANTA, CHARLOTTE])
+
+        streets = {step['street_name'] for step in route['instructions']}
+        self.assertIn('I-85', streets)
+        self.assertNotIn('Scenic Parkway', streets)
+        self.assertEqual(route['instructions'][-1]['text'], 'Arrive at destination')
+
+    def test_points_too_far_from_the_graph_are_rejected(self):
+        with self.assertRaises(Exception):
+            self.graph.route([ATLANTA, {'lat': 64.8, 'lng': -147.7}])
+
+
+class RoutingFallbackTests(SimpleTestCase):
+    """GraphHopper outages are rerouted on the local graph before falling back to estimates"""
+
+    def setUp(self):
+        route_cache.clear()
+        graphhopper_breaker.reset()
+
+    def _calculate(self):
+        service = RouteCalculationService()
+        with mock.patch.object(service, '_geocode_concurrently', return_value=[ATLANTA, CHARLOTTE, JACKSONVILLE]), \
+                mock.patch.object(service, '_get', side_effect=requests.ConnectionError('upstream down')):
+            return service.calculate_route('Atlanta, GA', 'Charlotte, NC', 'Jacksonville, FL')
+
+    def test_falls_back_to_local_graph(self):
+        route = self._calculate()
+
+        self.assertEqual(route['engine'], 'local')
+        self.assertIn('upstream down', route['error'])
+        self.assertGreater(route['distance_meters'], 1000 * 1000)
+        self.assertEqual(route_cache.stats()['entries'], 0)
+
+    @override_settings(ROUTING_FALLBACK='estimate')
+    def test_estimate_when_local_fallback_disabled(self):
+        self.assertEqual(self._calculate()['engine'], 'estimate')
+
+    @override_settings(ROUTING_ENGINE='local')
+    def test_local_primary_engine_skips_graphhopper(self):
+        route = self._calculate()
+
+        self.assertEqual(route['engine'], 'local')
+        self.assertNotIn('error', route)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    """The GraphHopper breaker's closed -> open -> half-open cycle"""
+
+    def setUp(self):
+        self.now = 1000.0
+        # Only the breaker's clock: asyncio's own timeouts still need the real one
+        clock = mock.patch('routes.upstream.time', mock.Mock(monotonic=lambda: self.now))
+        clock.start()
+        self.addCleanup(clock.stop)
+        self.breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=30)
+
+    def _open(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.now += 30
+
+    def test_opens_after_consecutive_failures_and_probes_once(self):
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow_request())
+
+        self.now += 30
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertEqual([self.breaker.allow_request() for _ in range(3)], [True, False, False])
+
+        # A failed probe reopens the circuit for another cool-down; a good one closes it
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.now += 30
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(self.breaker.snapshot()['opened'], 2)
+
+    def test_probe_without_an_outcome_is_released(self):
+        service = RouteCalculationService()
+        self._open()
+        with mock.patch('routes.services.graphhopper_breaker', self.breaker), \
+                mock.patch.object(service.session, 'get', side_effect=ValueError('timeout must be positive')):
+            with self.assertRaises(ValueError):
+                service._get('route', {}, timeout=0)
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(self.breaker.allow_request())
+
+    def test_read_timeout_costs_one_attempt(self):
+        with FakeGraphHopper(geocode_latency=0.5) as fake, mock.patch('routes.upstream._session', None), \
+                mock.patch('routes.services.graphhopper_breaker', self.breaker), \
+                override_settings(GRAPHHOPPER_BASE_URL=fake.url):
+            service = RouteCalculationService()
+            started = time.perf_counter()
+            with self.assertRaises(requests.ReadTimeout):
+                service._get('geocoding', {'q': 'Boise, ID'}, timeout=0.1)
+            elapsed = time.perf_counter() - started
+
+            # The stand-in counts a call once its latency has passed
+            time.sleep(0.7)
+            self.assertEqual(fake.stats()['geocoding'], 1)
+        self.assertLess(elapsed, 0.4)
+        self.assertEqual(self.breaker.snapshot()['consecutive_failures'], 1)
+
+    def test_cancelled_async_probe_is_released(self):
+        async def never_answers(*args, **kwargs):
+            await asyncio.sleep(60)
+
+        async def probe():
+            client = mock.Mock(get=never_answers)
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(AsyncRouteCalculationService()._aget(client, 'route', {}, 30), timeout=0.01)
+
+        self._open()
+        with mock.patch('routes.services.graphhopper_breaker', self.breaker):
+            asyncio.run(probe())
+        self.assertTrue(self.breaker.allow_request())
+
+
+class GazetteerTests(SimpleTestCase):
+    """Offline geocoding against the bundled gazetteer"""
+
+    def setUp(self):
+        self.gazetteer = get_gazetteer()
+
+    def test_exact_match_ignores_state_spelling_and_case(self):
+        for query in ('Atlanta, GA', 'atlanta,  Georgia', 'Atlanta, GA, USA'):
+            with self.subTest(query=query):
+                self.assertEqual(self.gazetteer.lookup(query)['name'], 'Atlanta, GA')
+
+    def test_saint_and_fort_abbreviations(self):
+        self.assertEqual(self.gazetteer.lookup('Saint Louis, Missouri')['name'], 'St. Louis, MO')
+        self.assertEqual(self.gazetteer.lookup('Ft. Worth, TX')['name'], 'Fort Worth, TX')
+
+    def test_prefix_and_bare_names_prefer_the_largest_place(self):
+        self.assertEqual(self.gazetteer.lookup('New York, NY')['name'], 'New York City, NY')
+        self.assertEqual(self.gazetteer.lookup('Portland')['name'], 'Portland, OR')
+        self.assertEqual(self.gazetteer.lookup('Portland, ME')['name'], 'Portland, ME')
+
+    def test_fuzzy_match_fixes_typos(self):
+        self.assertEqual(self.gazetteer.lookup('Charlote, NC')['name'], 'Charlotte, NC')
+
+    def test_unknown_place_returns_none(self):
+        self.assertIsNone(self.gazetteer.lookup('Xyzzyq, ZZ'))
+
+    def test_loads_census_gazetteer_format(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as handle:
+            handle.write(
+                'USPS\tGEOID\tANSICODE\tNAME\tLSAD\tFUNCSTAT\tALAND\tAWATER\tALAND_SQMI\tAWATER_SQMI\t'
+                'INTPTLAT\tINTPTLONG                                                                                                               \n'
+                'GA\t1304000\t02403126\tAtlanta city\t25\tA\t0\t0\t0\t0\t33.762900\t-84.422592\n'
+            )
+        self.addCleanup(Path(handle.name).unlink)
+
+        place = Gazetteer.load(handle.name).lookup('Atlanta, GA')
+        self.assertEqual(place['name'], 'Atlanta, GA')
+        self.assertAlmostEqual(place['lat'], 33.7629, places=3)
+
+
+class RouteEstimatorTests(TestCase):
+    """Fallback distance/time estimates fitted from real routes"""
+
+    def test_batch_estimate_matches_single_pairs(self):
+        estimator = RouteEstimator()
+        origins = [[33.749, -84.388], [35.2271, -80.8431], [33.749, -84.388]]
+        destinations = [[35.2271, -80.8431], [30.3322, -81.6557], [33.80, -84.30]]
+
+        meters, seconds = estimator.estimate(origins, destinations)
+        for i in range(len(origins)):
+            single_meters, single_seconds = estimator.estimate(origins[i], destinations[i])
+            self.assertAlmostEqual(meters[i], single_meters[0])
+            self.assertAlmostEqual(seconds[i], single_seconds[0])
+
+    def test_observations_refit_the_lane_class(self):
+        estimator = RouteEstimator(prior_weight_m=100e3)
+        origins = np.array([[33.749, -84.388]] * 50)
+        destinations = np.array([[32.7767, -96.7970]] * 50)  # Dallas: a long-haul lane
+        great_circle, _ = estimator.estimate(origins[:1], destinations[:1])
+        great_circle = great_circle[0] / estimator.factors()[0][2]
+
+        # Long-haul legs that run 1.4x the straight line at 90 km/h
+        estimator.observe(origins, destinations, [great_circle * 1.4] * 50, [great_circle * 1.4 / 25] * 50)
+
+        circuity, speed = estimator.factors()
+        self.assertAlmostEqual(circuity[2], 1.4, places=2)
+        self.assertAlmostEqual(speed[2] * 3.6, 90, delta=0.5)
+        self.assertEqual(estimator.snapshot()['long_haul']['observations'], 50)
+        self.assertEqual(estimator.snapshot()['local']['observations'], 0)
+
+    def test_route_legs_split_at_via_points(self):
+        path = {'instructions': [
+            {'distance': 1000, 'time': 60000, 'sign': 0},
+            {'distance': 0, 'time': 0, 'sign': 5},
+            {'distance': 3000, 'time': 120000, 'sign': 0},
+            {'distance': 0, 'time': 0, 'sign': 4},
+        ]}
+        self.assertEqual(route_legs(path), [[1000, 60.0], [3000, 120.0]])
+
+    def test_warm_start_fits_stored_graphhopper_routes(self):
+        for place in (ATLANTA, CHARLOTTE, JACKSONVILLE):
+            geocode_cache.set(place['name'], place)
+        for engine in ('graphhopper', 'estimate'):
+            route = Route.objects.create(current_location='Atlanta, GA', pickup_location='Charlotte, NC',
+                                         dropoff_location='Jacksonville, FL', current_cycle_hours=0)
+            RouteGeometry.objects.create(route=route, engine=engine, distance_meters=1e6, time_seconds=4e4)
+            RouteStep.objects.bulk_create([
+                RouteStep(route=route, step_order=0, instruction='Continue onto I-85', distance_meters=400e3,
+                          duration_seconds=16e3, latitude=ATLANTA['lat'], longitude=ATLANTA['lng']),
+                RouteStep(route=route, step_order=1, instruction='Waypoint 1', distance_meters=600e3,
+                          duration_seconds=24e3, latitude=35.23, longitude=-80.85),
+            ])
+
+        estimator = RouteEstimator(prior_weight_m=1)
+        with self.assertNumQueries(2):
+            self.assertEqual(estimator.warm(), 1)
+
+        snapshot = estimator.snapshot()
+        # Atlanta -> Charlotte is a regional lane, Charlotte -> Jacksonville a long-haul one; estimates are ignored
+        self.assertEqual([snapshot[name]['observations'] for name in ('local', 'regional', 'long_haul')], [0, 1, 1])
+        self.assertEqual((snapshot['regional']['speed_kph'], snapshot['long_haul']['speed_kph']), (90.0, 90.0))
+        road_m, _ = estimator.estimate([[ATLANTA['lat'], ATLANTA['lng']]], [[CHARLOTTE['lat'], CHARLOTTE['lng']]])
+        self.assertAlmostEqual(road_m[0], 400e3, delta=1)
+
+    def test_batch_fallback_estimates_every_failed_trip_at_once(self):
+        places = {'atlanta, ga': ATLANTA, 'charlotte, nc': CHARLOTTE, 'jacksonville, fl': JACKSONVILLE}
+        trips = [
+            ('Atlanta, GA', 'Charlotte, NC', 'Jacksonville, FL'),
+            ('Jacksonville, FL', 'Atlanta, GA', 'Charlotte, NC'),
+            ('Nowhere, ZZ', 'Atlanta, GA', 'Charlotte, NC'),
+        ]
+        def fetch_geocode(location, timeout):
+            coords = places.get(normalize_location(location))
+            return (dict(coords), True) if coords else (None, False)
+
+        geocode_cache.clear()
+        with mock.patch.object(RouteCalculationService, '_fetch_geocode', side_effect=fetch_geocode), \
+                mock.patch.object(RouteCalculationService, '_route_path', side_effect=RuntimeError('upstream down')), \
+                mock.patch.object(RouteCalculationService, '_offline_geocode', return_value=None), \
+                mock.patch.object(route_estimator, 'estimate', wraps=route_estimator.estimate) as estimate:
+            routes = RouteCalculationService().calculate_routes(trips)
+
+        self.assertEqual(estimate.call_count, 1)
+        self.assertEqual([route['engine'] for route in routes], ['estimate'] * 3)
+        self.assertEqual([len(route['waypoints']) for route in routes], [3, 3, 0])
+        single = RouteCalculationService()._fallback_route(*trips[0], ValueError('upstream down'),
+                                                           points=[ATLANTA, CHARLOTTE, JACKSONVILLE])
+        self.assertEqual(routes[0]['distance_meters'], single['distance_meters'])
+
+    def test_fallback_route_uses_geocoded_legs(self):
+        route = RouteCalculationService()._fallback_route(
+            'Atlanta, GA', 'Charlotte, NC', 'Jacksonville, FL', ValueError('upstream down')
+        )
+
+        self.assertEqual(route['engine'], 'estimate')
+        self.assertEqual(len(route['waypoints']), 3)
+        # Atlanta -> Charlotte -> Jacksonville is ~1,000 km by road
+        self.assertTrue(850e3 < route['distance_meters'] < 1200e3, route['distance_meters'])
+        legs = [step['distance'] for step in route['instructions'][1:]]
+        self.assertLess(legs[0], legs[1])
+
+
+class TruckStopTests(SimpleTestCase):
+    # A straight road due east along 35N, ~57 miles per degree of longitude
+    POINTS = [(35.0, -100.0 + i * 0.05) for i in range(201)]
+
+    def setUp(self):
+        self.index = TruckStopIndex([
+            ('Near Stop', 'truck_stop', 35.01, -95.0, 'Near', 'OK'),
+            ('Far Stop', 'truck_stop', 35.5, -95.0, 'Far', 'OK'),
+            ('Later Stop', 'truck_stop', 35.0, -92.0, 'Later', 'AR'),
+            ('Pumps Only', 'fuel', 35.0, -94.8, 'Pumps', 'OK'),
+        ])
+        miles = 10 * 56.7
+        self.profile = RouteProfile({
+            'distance_meters': miles * 1609.34,
+            'time_seconds': miles / 55 * 3600,
+            'instructions': [{'distance': miles * 1609.34, 'time': miles / 55 * 3.6e6, 'interval': [0, 200]}],
+            'points': encode_polyline(self.POINTS),
+        })
+
+    def test_corridor_excludes_stops_off_the_route(self):
+        rows, along, offset = self.index.corridor(self.POINTS, np.linspace(0, 567, 201), 5)
+        names = {self.index.names[row] for row in rows}
+
+        self.assertEqual(names, {'Near Stop', 'Later Stop', 'Pumps Only'})
+        self.assertTrue((offset < 1).all())
+        self.assertAlmostEqual(float(along[[self.index.names[row] for row in rows].index('Near Stop')]), 283.5, delta=1)
+
+    def test_stop_moves_to_the_last_usable_place_before_it(self):
+        placer = StopPlacer(self.profile, self.index)
+
+        # Rest needs truck parking, so the closer fuel-only stop doesn't count; Later Stop is past the point
+        self.assertEqual(placer.label(placer.place('rest', 300.0)), 'Near Stop, Near, OK')
+        self.assertEqual(placer.label(placer.place('fuel', 300.0)), 'Pumps Only, Pumps, OK')
+        self.assertIsNone(placer.place('rest', 150.0))
+
+    def _slow_route(self):
+        # 567 miles at 30 mph: the 11-hour reset falls due at 330 miles, just past Near Stop
+        return {
+            'distance_meters': 567 * 1609.34,
+            'time_seconds': 567 / 30 * 3600,
+            'instructions': [{'distance': 567 * 1609.34, 'time': 567 / 30 * 3.6e6, 'interval': [0, 200]}],
+            'points': encode_polyline(self.POINTS),
+        }
+
+    def test_clocks_run_on_from_the_place_the_driver_stopped(self):
+        route_data = self._slow_route()
+        profile = RouteProfile(route_data)
+        stops = SegmentHOSScheduler().plan_stops(route_data, profile, StopPlacer(profile, self.index))
+
+        self.assertEqual([stop['type'] for stop in stops], ['break', 'rest', 'break'])
+        rest = stops[1]
+        self.assertEqual((rest['miles'], rest['driving_hours']), (283.5, 9.45))
+        self.assertEqual((rest['lat'], rest['lng']), (35.01, -95.0))
+        # The next break is due 8 hours after the moved reset, not after the planned one
+        self.assertAlmostEqual(stops[2]['driving_hours'], 17.45, places=2)
+
+        with mock.patch('routes.services.StopPlacer', lambda profile: StopPlacer(profile, self.index)):
+            compliance_data = HOSComplianceCalculator().calculate_compliance(route_data, 0)
+        days = build_timeline(compliance_data, 'Tulsa, OK', 'Little Rock, AR')
+        first = days[0].segments
+        # The day ends at Near Stop after 1 h pickup, 8 h driving, the break and 1.45 h more driving
+        self.assertEqual((first[-1].remarks, first[-1].location), ('10-hour off duty rest', 'Near Stop, Near, OK'))
+        self.assertEqual(first[-1].start - first[0].start, timedelta(hours=10.95))
+        self.assertEqual((days[0].driving_hours, days[0].total_miles), (9.45, 284))
+
+    def test_no_configured_dataset_keeps_generic_labels(self):
+        with override_settings(TRUCK_STOPS_PATH=None), mock.patch('routes.pois._truck_stop_index', None):
+            compliance_data = HOSComplianceCalculator().calculate_compliance(self._slow_route(), 0)
+
+        self.assertFalse(any('poi' in stop for stop in compliance_data['stop_plan']))
+        self.assertEqual([stop['driving_hours'] for stop in compliance_data['stop_plan']], [8, 11])
+        days = build_timeline(compliance_data, 'Tulsa, OK', 'Little Rock, AR')
+        self.assertEqual(
+            [(segment.remarks, segment.location) for segment in days[0].segments if segment.duty_status == 'off_duty'],
+            [('Required 30-minute break', 'Rest Area'), ('10-hour off duty rest', 'Rest Stop')]
+        )
+
+    def test_timeline_logs_breaks_and_rests_at_planned_stops(self):
+        days = build_timeline({
+            'requires_multi_day': True,
+            'driving_time_hours': 20,
+            'distance_miles': 1100,
+            'total_on_duty_time': 22,
+            'stop_plan': [
+                {'type': 'break', 'driving_hours': 7.5, 'miles': 412.5, 'location': 'Near Stop, Near, OK'},
+                {'type': 'rest', 'driving_hours': 10.75, 'miles': 591.25, 'location': 'Later Stop, Later, AR'},
+                {'type': 'break', 'driving_hours': 18.75, 'miles': 1031.25},
+            ],
+        }, 'Charlotte, NC', 'Jacksonville, FL')
+
+        first = [(segment.duty_status, segment.total_hours, segment.location) for segment in days[0].segments]
+        self.assertEqual(first[:4], [
+            ('on_duty_not_driving', 1.0, 'Charlotte, NC'),
+            ('driving', 7.5, 'En Route'),
+            ('off_duty', 0.5, 'Near Stop, Near, OK'),
+            ('driving', 3.25, 'En Route'),
+        ])
+        self.assertEqual((days[0].segments[-1].remarks, days[0].segments[-1].location),
+                         ('10-hour off duty rest', 'Later Stop, Later, AR'))
+        # Day two's break has no place planned
+        self.assertIn(('Required 30-minute break', 'Rest Area'), [(s.remarks, s.location) for s in days[1].segments])
+        self.assertEqual([day.total_miles for day in days], [591, 509])
+        self.assertEqual(days[1].driving_hours, 9.25)
+
+
+class HOSTimelineTests(SimpleTestCase):
+    """Daily logs from the scheduler's own stop plan"""
+
+    def test_every_planned_stop_reaches_the_logs(self):
+        # 25 hours at 50 mph: break, rest, break, fuel at 1,000 miles, rest
+        route_data = synthetic_route(distance_km=25 * 50 * 1.60934, steps=100, points=1001, mph=50)
+        compliance_data = HOSComplianceCalculator().calculate_compliance(route_data, 0)
+        days = build_timeline(compliance_data, 'Charlotte, NC', 'Jacksonville, FL')
+
+        logged = [
+            (segment.remarks, segment.duty_status) for day in days for segment in day.segments
+            if segment.duty_status != 'driving'
+        ]
+        self.assertEqual(logged, [
+            ('Loading and pickup', 'on_duty_not_driving'),
+            ('Required 30-minute break', 'off_duty'),
+            ('10-hour off duty rest', 'off_duty'),
+            ('Required 30-minute break', 'off_duty'),
+            ('Fuel stop', 'on_duty_not_driving'),
+            ('10-hour off duty rest', 'off_duty'),
+            ('Unloading and delivery', 'on_duty_not_driving'),
+            ('End of duty', 'off_duty'),
+        ])
+        self.assertEqual([day.driving_hours for day in days], [11, 11, 3])
+        self.assertEqual([day.on_duty_hours for day in days], [1, 0.5, 1])
+        self.assertEqual(sum(day.total_miles for day in days), 1250)
+        self.assertEqual(compliance_data['fuel_stops_needed'], 1)
+        # Each shift fits its 14-hour window
+        for day in days:
+            self.assertLessEqual(day.segments[-1].start, datetime.combine(day.log_date, dt_time(20)))
+
+    def test_summaries_without_a_stop_plan_use_fixed_days(self):
+        days = build_timeline(
+            {'driving_time_hours': 25, 'distance_miles': 1375, 'total_on_duty_time': 27}, 'Charlotte, NC', 'Jacksonville, FL'
+        )
+
+        self.assertEqual([day.driving_hours for day in days], [11, 11, 3])
+        self.assertEqual([day.total_miles for day in days], [605, 605, 165])
+        self.assertEqual(
+            [segment.remarks for segment in days[0].segments],
+            ['Loading and pickup', 'Driving - Day 1', 'Required 30-minute break', 'Driving - Day 1 continued',
+             '10-hour off duty rest']
+        )
+
+    def test_single_day_trip(self):
+        days = build_timeline({
+            'driving_time_hours': 9, 'distance_miles': 495, 'total_on_duty_time': 11,
+            'stop_plan': [{'type': 'break', 'driving_hours': 8.0, 'miles': 440.0, 'duration_hours': 0.5}],
+        }, 'Charlotte, NC', 'Jacksonville, FL')
+
+        [day] = days
+        self.assertEqual(
+            [(segment.remarks, segment.total_hours) for segment in day.segments[:-1]],
+            [('Loading and pickup', 1.0), ('Driving to required break', 8.0), ('Required 30-minute break', 0.5),
+             ('Driving to destination', 1.0), ('Unloading and delivery', 1.0)]
+        )
+        self.assertEqual((day.total_miles, day.driving_hours, day.on_duty_hours), (495, 9.0, 2.0))
+
+
+class RouteDocumentParsingTests(SimpleTestCase):
+    POINTS = [[33.749, -84.388, 320.0], [34.0, -84.0, 300.0], [35.2271, -80.8431, 230.0]]
+
+    def _document(self, encoded):
+        path = {
+            'distance': 400000.0,
+            'time': 15000000,
+            'points_encoded': encoded,
+            'points': encode_polyline([point[:2] for point in self.POINTS]) if encoded else {
+                'type': 'LineString', 'coordinates': [[lng, lat, ele] for lat, lng, ele in self.POINTS]
+            },
+            'instructions': [
+                {'distance': 400000.0, 'heading': 12.5, 'sign': 0, 'interval': [0, 2], 'text': 'Continue onto I-85',
+                 'time': 15000000, 'street_name': 'I-85', 'street_ref': 'I 85', 'last_heading': 40.1},
+                {'distance': 0.0, 'sign': 4, 'interval': [2, 2], 'text': 'Arrive at destination', 'time': 0},
+            ],
+            'details': {'max_speed': [[0, 2, 105]]},
+        }
+        alternative = dict(path, distance=1.0, instructions=[])
+        return json.dumps({'info': {'took': 5}, 'paths': [path, alternative]}).encode()
+
+    def test_json_parse_keeps_only_used_fields(self):
+        path = parse_route_document(self._document(encoded=False), streaming=False)
+
+        self.assertEqual(path['distance'], 400000.0)
+        self.assertEqual(path['points'], encode_polyline([point[:2] for point in self.POINTS]))
+        self.assertEqual(set(path['instructions'][0]), {'distance', 'sign', 'interval', 'text', 'time', 'street_name'})
+        with self.assertRaises(ValueError):
+            parse_route_document(b'{"paths": []}', streaming=False)
+
+    @skipIf(ijson is None, 'ijson is not installed')
+    def test_streaming_parse_matches_json_parse(self):
+        for encoded in (True, False):
+            with self.subTest(encoded=encoded):
+                document = self._document(encoded)
+                self.assertEqual(
+                    parse_route_document(document, streaming=True),
+                    parse_route_document(document, streaming=False)
+                )
+        with self.assertRaises(ValueError):
+            parse_route_document(b'{"message": "Cannot find point 0"}')
+
+    def test_streamed_error_responses_release_their_connection(self):
+        self.addCleanup(graphhopper_breaker.reset)
+        service = RouteCalculationService()
+        for status in (404, 503):
+            with self.subTest(status=status):
+                response = requests.Response()
+                response.status_code = status
+                response.raw = mock.Mock()
+                with mock.patch.object(service.session, 'get', return_value=response), \
+                        self.assertRaises(requests.HTTPError):
+                    service._get('route', {}, 10, stream=True)
+                response.raw.close.assert_called_once()
+                response.raw.release_conn.assert_called_once()
+
+    @override_settings(ROUTE_STREAM_PARSE_MIN_BYTES=1)
+    def test_async_route_body_is_parsed_whole_off_the_event_loop(self):
+        route_cache.clear()
+        document = self._document(encoded=True)
+        parses = []
+
+        def parse(body, streaming):
+            parses.append((threading.get_ident(), streaming))
+            return parse_route_document(body, streaming)
+
+        async def plan():
+            service = AsyncRouteCalculationService()
+            transport = httpx.MockTransport(lambda request: httpx.Response(200, content=document))
+            async with httpx.AsyncClient(transport=transport) as client:
+                with mock.patch.object(service, 'ageocode_location', side_effect=[ATLANTA, CHARLOTTE, JACKSONVILLE]):
+                    route = await service._calculate_route(client, 'Atlanta, GA', 'Charlotte, NC', 'Jacksonville, FL', False)
+            return route, threading.get_ident()
+
+        with mock.patch('routes.services.parse_route_document', parse), \
+                mock.patch.object(RouteCalculationService, '_observe'):
+            route, loop_thread = asyncio.run(plan())
+
+        self.assertEqual(route['distance_meters'], 400000.0)
+        [(parse_thread, streaming)] = parses
+        self.assertNotEqual(parse_thread, loop_thread)
+        self.assertFalse(streaming)
@@ -0,0 +1,169 @@
+# routes/upstream.py
+import asyncio
+import logging
+import threading
+import time
+import weakref
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose breaker is open"""
+
+
+class CircuitBreaker:
+    """Stops calling an unhealthy upstream until a cool-down has passed"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold, reset_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+        self.counters = {'successes': 0, 'failures': 0, 'rejected': 0, 'opened': 0}
+
+    def allow_request(self):
+        """Return True if a call may go upstream right now"""
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                # Cool-down over: let exactly one probe through
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = False
+
+            if self._state == self.CLOSED:
+                return True
+
+            if self._state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+
+            self.counters['rejected'] += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.counters['successes'] += 1
+            self._consecutive_failures = 0
+            if self._state != self.CLOSED:
+                logger.info(f"Circuit '{self.name}' closed")
+            self._state = self.CLOSED
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.counters['failures'] += 1
+            self._consecutive_failures += 1
+            if self._state == self.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning(f"Circuit '{self.name}' opened after {self._consecutive_failures} failures")
+                    self.counters['opened'] += 1
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def abandon_probe(self):
+        """A call ended with no outcome (cancelled, or never sent): let the next caller probe instead"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def reset(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._consecutive_failures = 0
+            self._opened_at = None
+            self._probe_in_flight = False
+
+    def snapshot(self):
+        """Breaker state for health checks and monitoring"""
+        state = self.state
+        with self._lock:
+            retry_in = None
+            if state == self.OPEN:
+                retry_in = round(max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at)), 1)
+            return {
+                'state': state,
+                'consecutive_failures': self._consecutive_failures,
+                'failure_threshold': self.failure_threshold,
+                'reset_timeout': self.reset_timeout,
+                'retry_in_seconds': retry_in,
+                **self.counters,
+            }
+
+
+graphhopper_breaker = CircuitBreaker(
+    'graphhopper',
+    failure_threshold=getattr(settings, 'GRAPHHOPPER_BREAKER_FAILURE_THRESHOLD', 5),
+    reset_timeout=getattr(settings, 'GRAPHHOPPER_BREAKER_RESET_TIMEOUT', 30)
+)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Process-wide pooled session, so repeat calls reuse TLS connections"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total=getattr(settings, 'GRAPHHOPPER_MAX_RETRIES', 2),
+                # A read timeout already spent the caller's whole timeout: retrying it would multiply
+                # the wait past the request deadline. Only refused connects and throttling/5xx answers retry
+                read=False,
+                backoff_factor=getattr(settings, 'GRAPHHOPPER_RETRY_BACKOFF', 0.3),
+                backoff_jitter=getattr(settings, 'GRAPHHOPPER_RETRY_BACKOFF', 0.3),
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=frozenset(['GET']),
+                raise_on_status=False
+            )
+            pool_size = getattr(settings, 'GRAPHHOPPER_POOL_SIZE', 20)
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
+
+
+# One pooled AsyncClient per event loop (clients can't be shared across loops)
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client(transport=None):
+    """Long-lived httpx.AsyncClient for the running event loop"""
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.setdefault(loop, {})
+
+    client = clients.get(transport)
+    if client is None:
+        pool_size = getattr(settings, 'GRAPHHOPPER_POOL_SIZE', 20)
+        client = httpx.AsyncClient(
+            transport=transport or httpx.AsyncHTTPTransport(
+                retries=getattr(settings, 'GRAPHHOPPER_MAX_RETRIES', 2),
+                limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+            )
+        )
+        clients[transport] = client
+    return client
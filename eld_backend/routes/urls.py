@@ -4,5 +4,13 @@ from . import views
 
 urlpatterns = [
     path('calculate-route/', views.calculate_route, name='calculate-route'),
+    path('calculate-route/batch/', views.calculate_routes_batch, name='calculate-route-batch'),
+    path('calculate-route/jobs/', views.submit_plan_job, name='plan-job-submit'),
+    path('calculate-route/jobs/<uuid:job_id>/', views.plan_job_status, name='plan-job-status'),
+    path('calculate-route-async/', views.calculate_route_async, name='calculate-route-async'),
+    path('routes/', views.route_list, name='route-list'),
+    path('routes/<int:route_id>/', views.route_detail, name='route-detail'),
+    path('routes/<int:route_id>/geometry/', views.route_geometry, name='route-geometry'),
     path('health/', views.health_check, name='health-check'),
+    path('metrics/', views.metrics, name='metrics'),
 ]
@@ -1,16 +1,190 @@
 # routes/views.py
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.http import HttpResponse, JsonResponse
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework import status
-from .models import Route
-from .serializers import RouteInputSerializer, RouteSerializer
-from .services import RouteCalculationService, HOSComplianceCalculator
+from .models import PlanJob, Route, RouteGeometry, RouteStep
+from .serializers import RouteInputSerializer, RouteSerializer, RouteSummarySerializer
+from .pagination import InvalidPage, keyset_page, not_modified, page_size, validators_for, with_validators
+from .services import (
+    RouteCalculationService, AsyncRouteCalculationService, HOSComplianceCalculator, RouteGeometryService
+)
+from .geo import decode_polyline, zoom_tolerance_m
+from .cache import geocode_cache, geometry_cache, route_cache
+from .estimator import route_estimator
+from .metrics import registry as metrics_registry, timed
+from .upstream import graphhopper_breaker
+from . import jobs
 from eld_logs.services import ELDLogGeneratorService
+import json
 import logging
 
 logger = logging.getLogger(__name__)
 
+def _build_response_data(route, route_data, compliance_data, planned_logs, preview=False, tolerance_m=None):
+    """
+    Shape the calculate-route response shared by the sync and async views.
+    Built from the generator's in-memory (DailyLog, entries) pairs, so no queries are issued.
+    The path itself is only included when a level of detail (tolerance_m) was asked for
+    """
+    response_data = {
+        'route_id': route.id,
+        'route_summary': {
+            'total_distance_miles': round(compliance_data['distance_miles'], 1),
+            'estimated_driving_time': round(compliance_data['driving_time_hours'], 1),
+            'total_duty_time': round(compliance_data['total_on_duty_time'], 1),
+            'fuel_stops_needed': compliance_data['fuel_stops_needed']
+        },
+        'hos_compliance': {
+            'is_compliant': compliance_data['is_compliant'],
+            'compliance_issues': compliance_data['compliance_issues'],
+            'requires_multi_day': compliance_data['requires_multi_day'],
+            'projected_cycle_hours': round(compliance_data['projected_cycle_hours'], 1),
+            'planned_stops': compliance_data['stop_plan']
+        },
+        'route_data': {
+            'instructions': route_data.get('instructions', [])[:5],  # First 5 instructions
+            'waypoints': route_data.get('waypoints', []),
+            'engine': route_data.get('engine', 'graphhopper')
+        },
+        'daily_logs': [
+            {
+                'id': log.id,
+                'date': log.log_date.strftime('%Y-%m-%d'),
+                'total_miles': log.total_miles,
+                'driving_hours': log.driving_hours,
+                'total_duty_hours': log.on_duty_hours + log.driving_hours,
+                'entries': [
+                    {
+                        'duty_status': entry.duty_status,
+                        'start_time': entry.start_time.strftime('%H:%M'),
+                        'end_time': entry.end_time.strftime('%H:%M'),
+                        'location': entry.location,
+                        'remarks': entry.remarks,
+                        'total_hours': entry.total_hours
+                    } for entry in entries
+                ]
+            } for log, entries in planned_logs
+        ]
+    }
+    if tolerance_m is not None and isinstance(route_data.get('points'), str):
+        points, point_count = geometry_cache.simplified(route_data['points'], tolerance_m)
+        response_data['route_data'].update({'points': points, 'points_encoded': True, 'point_count': point_count})
+    if preview:
+        response_data['preview'] = True
+    return response_data
+
+def _apply_compliance(route, compliance_data):
+    """Copy the calculated totals onto the route"""
+    route.total_distance = compliance_data['distance_miles']
+    route.estimated_driving_time = compliance_data['driving_time_hours']
+    route.total_duty_time = compliance_data['total_on_duty_time']
+    route.is_compliant = compliance_data['is_compliant']
+    route.requires_multi_day = compliance_data['requires_multi_day']
+
+def _persist_plans(routes, route_data_list, log_generator, planned_logs):
+    """Write the routes, their geometry and all their planned logs in one transaction of bulk inserts"""
+    geometry_service = RouteGeometryService()
+    with transaction.atomic():
+        Route.objects.bulk_create(routes)
+        geometry_service.save([
+            geometry_service.build(route, route_data) for route, route_data in zip(routes, route_data_list)
+        ])
+        log_generator.save_daily_logs(planned_logs)
+
+def _is_flag_set(request, name):
+    return request.GET.get(name, '').lower() in ('1', 'true', 'yes')
+
+def _detail_tolerance(request):
+    """
+    Simplification tolerance in meters from ?tolerance=<meters> or ?zoom=<map zoom>,
+    None when neither is given. Raises ValueError for unusable values
+    """
+    if request.GET.get('tolerance'):
+        tolerance_m = float(request.GET['tolerance'])
+    elif request.GET.get('zoom'):
+        zoom = float(request.GET['zoom'])
+        if not 0 <= zoom <= 22:
+            raise ValueError('zoom must be between 0 and 22')
+        tolerance_m = zoom_tolerance_m(zoom)
+    else:
+        return None
+
+    if not 0 <= tolerance_m < float('inf'):
+        raise ValueError('tolerance must be a non-negative number of meters')
+    return tolerance_m
+
+def _detail_error(error):
+    return {'error': f'Invalid level of detail: {error}'}
+
+def _is_preview(request):
+    """?preview=true returns the full plan without writing anything"""
+    return _is_flag_set(request, 'preview')
+
+def _route_cache_allowed(request):
+    """Clients can force a fresh GraphHopper route with Cache-Control: no-cache"""
+    return 'no-cache' not in request.headers.get('Cache-Control', '').lower()
+
+def plan_trip(route, preview=False, tolerance_m=None, use_cache=True):
+    """
+    Run the whole pipeline for one unsaved route: routing, HOS checks, daily logs and,
+    unless previewing, one write. Returns (response body, HTTP status); raises on failure
+    """
+    # Nothing is written until the plan is complete (and never in preview mode)
+
+    # Calculate route using mapping service
+    logger.info(f"Calculating route for: {route.current_location} -> {route.pickup_location} -> {route.dropoff_location}")
+    
+    route_service = RouteCalculationService()
+    route_data = route_service.calculate_route(
+        route.current_location,
+        route.pickup_location,
+        route.dropoff_location,
+        use_cache=use_cache
+    )
+    
+    if not route_data:
+        return {'error': 'Could not calculate route. Please check locations.'}, status.HTTP_400_BAD_REQUEST
+    
+    # Calculate HOS compliance
+    with timed('hos'):
+        hos_calculator = HOSComplianceCalculator()
+        compliance_data = hos_calculator.calculate_compliance(
+            route_data, 
+            route.current_cycle_hours
+        )
+    
+    # Update route with calculated data
+    _apply_compliance(route, compliance_data)
+    
+    # Generate ELD logs
+    log_generator = ELDLogGeneratorService()
+    with timed('logs'):
+        try:
+            planned_logs = log_generator.build_daily_logs(route, compliance_data)
+        except Exception as e:
+            logger.error(f"ELD log generation failed: {e}")
+            planned_logs = []
+
+    if not preview:
+        with timed('db'):
+            _persist_plans([route], [route_data], log_generator, planned_logs)
+    
+    # Return comprehensive response
+    with timed('response'):
+        response_data = _build_response_data(route, route_data, compliance_data, planned_logs, preview, tolerance_m)
+    
+    logger.info(f"Route calculated successfully. Distance: {compliance_data['distance_miles']:.1f} miles, Time: {compliance_data['driving_time_hours']:.1f} hours")
+    
+    return response_data, status.HTTP_200_OK if preview else status.HTTP_201_CREATED
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def calculate_route(request):
@@ -22,102 +196,334 @@ def calculate_route(request):
     if not serializer.is_valid():
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+    preview = _is_preview(request)
+    try:
+        tolerance_m = _detail_tolerance(request)
+    except ValueError as e:
+        return Response(_detail_error(e), status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        response_data, response_status = plan_trip(
+            Route(**serializer.validated_data), preview, tolerance_m, use_cache=_route_cache_allowed(request)
+        )
+        return Response(response_data, status=response_status)
+
+    except Exception as e:
+        logger.error(f"Route calculation failed: {str(e)}")
+        return Response(
+            {'error': f'Route calculation failed: {str(e)}'}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def calculate_routes_batch(request):
+    """
+    Plan a whole dispatch board in one call. Shared locations and lanes are resolved
+    once, and every plan is written in a single transaction
+    """
+    trips = request.data.get('trips') if isinstance(request.data, dict) else None
+    if not isinstance(trips, list) or not trips:
+        return Response(
+            {'error': 'Request body must be {"trips": [...]} with at least one trip.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    max_trips = getattr(settings, 'ROUTE_BATCH_MAX_TRIPS', 500)
+    if len(trips) > max_trips:
+        return Response(
+            {'error': f'A batch may contain at most {max_trips} trips.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    preview = _is_preview(request)
+    try:
+        tolerance_m = _detail_tolerance(request)
+    except ValueError as e:
+        return Response(_detail_error(e), status=status.HTTP_400_BAD_REQUEST)
+    results = [None] * len(trips)
+
+    routes = []
+    for index, trip in enumerate(trips):
+        serializer = RouteInputSerializer(data=trip)
+        if serializer.is_valid():
+            routes.append((index, Route(**serializer.validated_data)))
+        else:
+            results[index] = {'index': index, 'status': status.HTTP_400_BAD_REQUEST, 'errors': serializer.errors}
+
+    try:
+        route_data_list = RouteCalculationService().calculate_routes(
+            [(route.current_location, route.pickup_location, route.dropoff_location) for _, route in routes],
+            use_cache=_route_cache_allowed(request)
+        )
+
+        hos_calculator = HOSComplianceCalculator()
+        log_generator = ELDLogGeneratorService()
+        plans = []
+        for (index, route), route_data in zip(routes, route_data_list):
+            try:
+                compliance_data = hos_calculator.calculate_compliance(route_data, route.current_cycle_hours)
+                _apply_compliance(route, compliance_data)
+                planned_logs = log_generator.build_daily_logs(route, compliance_data)
+            except Exception as e:
+                logger.error(f"Batch trip {index} failed: {e}")
+                results[index] = {
+                    'index': index,
+                    'status': status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    'error': f'Route calculation failed: {str(e)}'
+                }
+                continue
+            plans.append((index, route, route_data, compliance_data, planned_logs))
+
+        if not preview and plans:
+            _persist_plans(
+                [route for _, route, _, _, _ in plans],
+                [route_data for _, _, route_data, _, _ in plans],
+                log_generator,
+                [log for _, _, _, _, planned_logs in plans for log in planned_logs]
+            )
+
+        for index, route, route_data, compliance_data, planned_logs in plans:
+            results[index] = {
+                'index': index,
+                'status': status.HTTP_200_OK if preview else status.HTTP_201_CREATED,
+                **_build_response_data(route, route_data, compliance_data, planned_logs, preview, tolerance_m)
+            }
+
+    except Exception as e:
+        logger.error(f"Batch route calculation failed: {str(e)}")
+        return Response(
+            {'error': f'Batch route calculation failed: {str(e)}'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+    succeeded = sum(1 for result in results if result['status'] < 400)
+    return Response({
+        'summary': {'trips': len(trips), 'succeeded': succeeded, 'failed': len(trips) - succeeded},
+        'results': results
+    }, status=status.HTTP_200_OK)
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def submit_plan_job(request):
+    """
+    Queue a calculate-route request for the plan worker and answer 202 straight away.
+    Input is validated here, so a queued job only fails on routing or planning errors
+    """
+    serializer = RouteInputSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
     try:
-        # Save basic route info
-        route = serializer.save()
-        
-        # Calculate route using mapping service
-        logger.info(f"Calculating route for: {route.current_location} -> {route.pickup_location} -> {route.dropoff_location}")
-        
-        route_service = RouteCalculationService()
-        route_data = route_service.calculate_route(
+        tolerance_m = _detail_tolerance(request)
+    except ValueError as e:
+        return Response(_detail_error(e), status=status.HTTP_400_BAD_REQUEST)
+
+    job = jobs.enqueue(
+        serializer.validated_data, _is_preview(request), tolerance_m, use_cache=_route_cache_allowed(request)
+    )
+    status_url = reverse('plan-job-status', args=[job.id])
+    response = Response(
+        {'job_id': str(job.id), 'status': job.status, 'status_url': status_url},
+        status=status.HTTP_202_ACCEPTED
+    )
+    response['Location'] = status_url
+    response['Retry-After'] = str(getattr(settings, 'PLAN_JOB_RETRY_AFTER', 2))
+    return response
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def plan_job_status(request, job_id):
+    """
+    Poll a queued plan. Once finished, result holds the body /api/calculate-route/
+    would have returned and result_status its HTTP status
+    """
+    job = PlanJob.objects.filter(pk=job_id).first()
+    if job is None:
+        return Response({'error': 'Job not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+    response_data = {
+        'job_id': str(job.id),
+        'status': job.status,
+        'attempts': job.attempts,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+    }
+    if job.status in (PlanJob.SUCCEEDED, PlanJob.FAILED):
+        response_data.update({'route_id': job.route_id, 'result_status': job.result_status, 'result': job.result})
+        if job.error:
+            response_data['error'] = job.error
+        return Response(response_data)
+
+    response = Response(response_data)
+    response['Retry-After'] = str(getattr(settings, 'PLAN_JOB_RETRY_AFTER', 2))
+    return response
+
+@csrf_exempt
+@require_POST
+async def calculate_route_async(request):
+    """
+    Async twin of calculate_route: upstream calls never hold a worker thread,
+    so one ASGI process can keep many plans in flight
+    """
+    try:
+        payload = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'error': 'Request body must be valid JSON'}, status=status.HTTP_400_BAD_REQUEST)
+
+    serializer = RouteInputSerializer(data=payload)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    preview = _is_preview(request)
+    try:
+        tolerance_m = _detail_tolerance(request)
+    except ValueError as e:
+        return JsonResponse(_detail_error(e), status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        route = Route(**serializer.validated_data)
+
+        logger.info(f"Calculating route (async) for: {route.current_location} -> {route.pickup_location} -> {route.dropoff_location}")
+
+        route_data = await AsyncRouteCalculationService().calculate_route(
             route.current_location,
             route.pickup_location,
-            route.dropoff_location
+            route.dropoff_location,
+            use_cache=_route_cache_allowed(request)
         )
-        
-        if not route_data:
-            return Response(
-                {'error': 'Could not calculate route. Please check locations.'}, 
-                status=status.HTTP_400_BAD_REQUEST
+
+        # Stop planning and log building are CPU-bound: run them on a worker thread, not the event loop
+        with timed('hos'):
+            compliance_data = await sync_to_async(HOSComplianceCalculator().calculate_compliance, thread_sensitive=False)(
+                route_data,
+                route.current_cycle_hours
             )
-        
-        # Calculate HOS compliance
-        hos_calculator = HOSComplianceCalculator()
-        compliance_data = hos_calculator.calculate_compliance(
-            route_data, 
-            route.current_cycle_hours
-        )
-        
-        # Update route with calculated data
-        route.total_distance = compliance_data['distance_miles']
-        route.estimated_driving_time = compliance_data['driving_time_hours']
-        route.total_duty_time = compliance_data['total_on_duty_time']
-        route.is_compliant = compliance_data['is_compliant']
-        route.requires_multi_day = compliance_data['requires_multi_day']
-        route.save()
-        
-        # Generate ELD logs
-        try:
-            log_generator = ELDLogGeneratorService()
-            daily_logs = log_generator.create_daily_logs(route, compliance_data)
-        except Exception as e:
-            logger.error(f"ELD log generation failed: {e}")
-            daily_logs = []
-        
-        # Return comprehensive response
-        response_data = {
-            'route_id': route.id,
-            'route_summary': {
-                'total_distance_miles': round(compliance_data['distance_miles'], 1),
-                'estimated_driving_time': round(compliance_data['driving_time_hours'], 1),
-                'total_duty_time': round(compliance_data['total_on_duty_time'], 1),
-                'fuel_stops_needed': compliance_data['fuel_stops_needed']
-            },
-            'hos_compliance': {
-                'is_compliant': compliance_data['is_compliant'],
-                'compliance_issues': compliance_data['compliance_issues'],
-                'requires_multi_day': compliance_data['requires_multi_day'],
-                'projected_cycle_hours': round(compliance_data['projected_cycle_hours'], 1)
-            },
-            'route_data': {
-                'instructions': route_data.get('instructions', [])[:5],  # First 5 instructions
-                'waypoints': route_data.get('waypoints', [])
-            },
-            'daily_logs': [
-                {
-                    'id': log.id,
-                    'date': log.log_date.strftime('%Y-%m-%d'),
-                    'total_miles': log.total_miles,
-                    'driving_hours': log.driving_hours,
-                    'total_duty_hours': log.on_duty_hours + log.driving_hours,
-                    'entries': [
-                        {
-                            'duty_status': entry.duty_status,
-                            'start_time': entry.start_time.strftime('%H:%M'),
-                            'end_time': entry.end_time.strftime('%H:%M'),
-                            'location': entry.location,
-                            'remarks': entry.remarks,
-                            'total_hours': entry.total_hours
-                        } for entry in log.entries.all()
-                    ]
-                } for log in daily_logs
-            ]
-        }
-        
-        logger.info(f"Route calculated successfully. Distance: {compliance_data['distance_miles']:.1f} miles, Time: {compliance_data['driving_time_hours']:.1f} hours")
-        
-        return Response(response_data, status=status.HTTP_201_CREATED)
-        
+
+        _apply_compliance(route, compliance_data)
+
+        log_generator = ELDLogGeneratorService()
+        with timed('logs'):
+            try:
+                planned_logs = await sync_to_async(log_generator.build_daily_logs, thread_sensitive=False)(
+                    route, compliance_data
+                )
+            except Exception as e:
+                logger.error(f"ELD log generation failed: {e}")
+                planned_logs = []
+
+        if not preview:
+            with timed('db'):
+                await sync_to_async(_persist_plans)([route], [route_data], log_generator, planned_logs)
+
+        with timed('response'):
+            response_data = _build_response_data(route, route_data, compliance_data, planned_logs, preview, tolerance_m)
+        return JsonResponse(response_data, status=status.HTTP_200_OK if preview else status.HTTP_201_CREATED)
+
     except Exception as e:
         logger.error(f"Route calculation failed: {str(e)}")
-        return Response(
-            {'error': f'Route calculation failed: {str(e)}'}, 
+        return JsonResponse(
+            {'error': f'Route calculation failed: {str(e)}'},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def route_list(request):
+    """
+    Saved routes, newest first, one keyset page at a time (?limit=, ?cursor= from next_cursor).
+    Answers If-None-Match/If-Modified-Since with 304 before serializing anything
+    """
+    try:
+        cursor = request.GET.get('cursor')
+        limit = page_size(request)
+        routes, next_cursor = keyset_page(Route.objects.all(), 'created_at', cursor, limit, descending=True)
+    except InvalidPage as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    etag, last_modified = validators_for(
+        'routes', cursor, limit, next_cursor, [(route.id, route.created_at) for route in routes],
+        last_modified=max((route.created_at for route in routes), default=None)
+    )
+    response = not_modified(request, etag, last_modified)
+    if response is None:
+        response = Response({
+            'results': RouteSummarySerializer(routes, many=True).data,
+            'next_cursor': next_cursor
+        })
+    return with_validators(response, etag, last_modified)
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def route_detail(request, route_id):
+    """One saved route with its steps. Plans are never edited, so the validators come from the route row alone"""
+    route = Route.objects.filter(pk=route_id).first()
+    if route is None:
+        return Response({'error': 'Route not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+    etag, last_modified = validators_for('route', route.id, route.created_at, last_modified=route.created_at)
+    response = not_modified(request, etag, last_modified)
+    if response is None:
+        response = Response(RouteSerializer(route).data)
+    return with_validators(response, etag, last_modified)
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def route_geometry(request, route_id):
+    """
+    Stored path and steps of a planned route, for replays and audits. The path is
+    returned as the stored polyline unless ?decoded=true asks for [lat, lng] pairs;
+    ?zoom= or ?tolerance= returns a simplified path sized for that level of detail
+    """
+    try:
+        tolerance_m = _detail_tolerance(request)
+    except ValueError as e:
+        return Response(_detail_error(e), status=status.HTTP_400_BAD_REQUEST)
+
+    geometry = RouteGeometry.objects.filter(route_id=route_id).first()
+    if geometry is None:
+        return Response({'error': 'No geometry stored for this route.'}, status=status.HTTP_404_NOT_FOUND)
+
+    response_data = {
+        'route_id': route_id,
+        'engine': geometry.engine,
+        'distance_meters': geometry.distance_meters,
+        'time_seconds': geometry.time_seconds,
+        'point_count': geometry.point_count,
+        'points': geometry.encoded_points,
+        'points_encoded': True,
+        'steps': list(
+            RouteStep.objects.filter(route_id=route_id).order_by('step_order').values(
+                'step_order', 'instruction', 'distance_meters', 'duration_seconds', 'latitude', 'longitude'
+            )
+        )
+    }
+    if tolerance_m is not None:
+        response_data['points'], response_data['point_count'] = geometry_cache.simplified(
+            geometry.encoded_points, tolerance_m
+        )
+        response_data['tolerance_m'] = round(tolerance_m, 1)
+    if _is_flag_set(request, 'decoded'):
+        response_data['points'] = decode_polyline(response_data['points']).round(5).tolist()
+        response_data['points_encoded'] = False
+    return Response(response_data)
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def health_check(request):
     """Simple health check endpoint"""
-    return Response({'status': 'healthy', 'message': 'ELD Route Planner API is running!'})
+    return Response({
+        'status': 'healthy',
+        'message': 'ELD Route Planner API is running!',
+        'geocode_cache': geocode_cache.stats(),
+        'route_cache': route_cache.stats(),
+        'geometry_cache': geometry_cache.stats(),
+        'upstream': {'graphhopper': graphhopper_breaker.snapshot()},
+        'route_estimator': route_estimator.snapshot(),
+        'stage_latency': metrics_registry.snapshot()
+    })
+
+def metrics(request):
+    """Stage latency histograms, upstream error and fallback counters and cache counters for Prometheus"""
+    return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')